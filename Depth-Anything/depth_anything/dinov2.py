@@ -0,0 +1,230 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# References:
+#   https://github.com/facebookresearch/dino/blob/main/vision_transformer.py
+#   https://github.com/rwightman/pytorch-image-models/tree/master/timm/models/vision_transformer.py
+
+"""Vendored DINOv2 backbone, state dict compatible with torch.hub dinov2."""
+
+from functools import partial
+import math
+
+import torch
+import torch.nn as nn
+from torch.nn.init import trunc_normal_
+
+from .dinov2_layers import Attention, Block, Mlp, PatchEmbed
+
+DINOV2_ARCHS = {
+    'vits': {'embed_dim': 384, 'depth': 12, 'num_heads': 6},
+    'vitb': {'embed_dim': 768, 'depth': 12, 'num_heads': 12},
+    'vitl': {'embed_dim': 1024, 'depth': 24, 'num_heads': 16},
+}
+
+
+def init_weights_vit_timm(module: nn.Module):
+  """ViT weight initialization, original timm impl (for reproducibility)."""
+  if isinstance(module, nn.Linear):
+    trunc_normal_(module.weight, std=0.02)
+    if module.bias is not None:
+      nn.init.zeros_(module.bias)
+
+
+class DinoVisionTransformer(nn.Module):
+
+  def __init__(
+      self,
+      img_size=224,
+      patch_size=16,
+      in_chans=3,
+      embed_dim=768,
+      depth=12,
+      num_heads=12,
+      mlp_ratio=4.0,
+      qkv_bias=True,
+      ffn_bias=True,
+      proj_bias=True,
+      init_values=None,  # for layerscale: None or 0 => no layerscale
+      act_layer=nn.GELU,
+      num_register_tokens=0,
+      interpolate_antialias=False,
+      interpolate_offset=0.1,
+  ):
+    super().__init__()
+    norm_layer = partial(nn.LayerNorm, eps=1e-6)
+
+    self.num_features = self.embed_dim = embed_dim
+    self.num_tokens = 1
+    self.n_blocks = depth
+    self.num_heads = num_heads
+    self.patch_size = patch_size
+    self.num_register_tokens = num_register_tokens
+    self.interpolate_antialias = interpolate_antialias
+    self.interpolate_offset = interpolate_offset
+
+    self.patch_embed = PatchEmbed(
+        img_size=img_size,
+        patch_size=patch_size,
+        in_chans=in_chans,
+        embed_dim=embed_dim,
+    )
+    num_patches = self.patch_embed.num_patches
+
+    self.cls_token = nn.Parameter(torch.zeros(1, 1, embed_dim))
+    self.pos_embed = nn.Parameter(
+        torch.zeros(1, num_patches + self.num_tokens, embed_dim)
+    )
+    assert num_register_tokens >= 0
+    self.register_tokens = (
+        nn.Parameter(torch.zeros(1, num_register_tokens, embed_dim))
+        if num_register_tokens
+        else None
+    )
+
+    self.blocks = nn.ModuleList([
+        Block(
+            dim=embed_dim,
+            num_heads=num_heads,
+            mlp_ratio=mlp_ratio,
+            qkv_bias=qkv_bias,
+            proj_bias=proj_bias,
+            ffn_bias=ffn_bias,
+            norm_layer=norm_layer,
+            act_layer=act_layer,
+            attn_class=Attention,
+            ffn_layer=Mlp,
+            init_values=init_values,
+        )
+        for _ in range(depth)
+    ])
+
+    self.norm = norm_layer(embed_dim)
+    self.head = nn.Identity()
+    self.mask_token = nn.Parameter(torch.zeros(1, embed_dim))
+    self.init_weights()
+
+  def init_weights(self):
+    # weights are about to be loaded from a checkpoint, nothing to init
+    if self.cls_token.is_meta:
+      return
+    trunc_normal_(self.pos_embed, std=0.02)
+    nn.init.normal_(self.cls_token, std=1e-6)
+    if self.register_tokens is not None:
+      nn.init.normal_(self.register_tokens, std=1e-6)
+    self.apply(init_weights_vit_timm)
+
+  def interpolate_pos_encoding(self, x, w, h):
+    previous_dtype = x.dtype
+    npatch = x.shape[1] - 1
+    N = self.pos_embed.shape[1] - 1
+    if npatch == N and w == h:
+      return self.pos_embed
+    pos_embed = self.pos_embed.float()
+    class_pos_embed = pos_embed[:, 0]
+    patch_pos_embed = pos_embed[:, 1:]
+    dim = x.shape[-1]
+    w0 = w // self.patch_size
+    h0 = h // self.patch_size
+
+    M = int(math.sqrt(N))  # Recover the number of patches in each dimension
+    assert N == M * M
+    kwargs = {}
+    if self.interpolate_offset:
+      # Historical kludge: add a small number to avoid floating point error in
+      # the interpolation, see https://github.com/facebookresearch/dino/issues/8
+      sx = float(w0 + self.interpolate_offset) / M
+      sy = float(h0 + self.interpolate_offset) / M
+      kwargs['scale_factor'] = (sx, sy)
+    else:
+      kwargs['size'] = (w0, h0)
+
+    patch_pos_embed = nn.functional.interpolate(
+        patch_pos_embed.reshape(1, M, M, dim).permute(0, 3, 1, 2),
+        mode='bicubic',
+        antialias=self.interpolate_antialias,
+        **kwargs,
+    )
+    assert (w0, h0) == patch_pos_embed.shape[-2:]
+
+    patch_pos_embed = patch_pos_embed.permute(0, 2, 3, 1).view(1, -1, dim)
+    return torch.cat(
+        (class_pos_embed.unsqueeze(0), patch_pos_embed), dim=1
+    ).to(previous_dtype)
+
+  def prepare_tokens(self, x):
+    _, _, w, h = x.shape
+    x = self.patch_embed(x)
+    x = torch.cat((self.cls_token.expand(x.shape[0], -1, -1), x), dim=1)
+    x = x + self.interpolate_pos_encoding(x, w, h)
+
+    if self.register_tokens is not None:
+      x = torch.cat(
+          (
+              x[:, :1],
+              self.register_tokens.expand(x.shape[0], -1, -1),
+              x[:, 1:],
+          ),
+          dim=1,
+      )
+    return x
+
+  def get_intermediate_layers(
+      self, x, n=1, reshape=False, return_class_token=False, norm=True
+  ):
+    B, _, w, h = x.shape
+    x = self.prepare_tokens(x)
+    total_block_len = len(self.blocks)
+    blocks_to_take = (
+        range(total_block_len - n, total_block_len) if isinstance(n, int) else n
+    )
+    outputs = []
+    for i, blk in enumerate(self.blocks):
+      x = blk(x)
+      if i in blocks_to_take:
+        outputs.append(x)
+    assert len(outputs) == len(
+        blocks_to_take
+    ), f'only {len(outputs)} / {len(blocks_to_take)} blocks found'
+
+    if norm:
+      outputs = [self.norm(out) for out in outputs]
+    class_tokens = [out[:, 0] for out in outputs]
+    outputs = [out[:, 1 + self.num_register_tokens :] for out in outputs]
+    if reshape:
+      outputs = [
+          out.reshape(B, w // self.patch_size, h // self.patch_size, -1)
+          .permute(0, 3, 1, 2)
+          .contiguous()
+          for out in outputs
+      ]
+    if return_class_token:
+      return tuple(zip(outputs, class_tokens))
+    return tuple(outputs)
+
+  def forward(self, x):
+    x = self.prepare_tokens(x)
+    for blk in self.blocks:
+      x = blk(x)
+    x = self.norm(x)
+    return self.head(x[:, 0])
+
+
+def dinov2(encoder='vitl', **kwargs):
+  """Local replacement of torch.hub.load('facebookresearch/dinov2', ...)."""
+  assert encoder in DINOV2_ARCHS, f'{encoder} not in {list(DINOV2_ARCHS)}'
+  vit_kwargs = dict(
+      img_size=518,
+      patch_size=14,
+      mlp_ratio=4,
+      init_values=1.0,
+      num_register_tokens=0,
+      interpolate_antialias=False,
+      interpolate_offset=0.1,
+  )
+  vit_kwargs.update(DINOV2_ARCHS[encoder])
+  vit_kwargs.update(kwargs)
+  return DinoVisionTransformer(**vit_kwargs)
@@ -1,8 +1,17 @@
+import inspect
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
 from .blocks import FeatureFusionBlock, _make_scratch
+from .dinov2 import dinov2
+
+MODEL_CONFIGS = {
+    'vits': {'features': 64, 'out_channels': [48, 96, 192, 384]},
+    'vitb': {'features': 128, 'out_channels': [96, 192, 384, 768]},
+    'vitl': {'features': 256, 'out_channels': [256, 512, 1024, 1024]},
+}
 
 
 def _make_fusion_block(features, use_bn, size=None):
@@ -186,26 +195,12 @@ class DPT_DINOv2(nn.Module):
       out_channels=[256, 512, 1024, 1024],
       use_bn=False,
       use_clstoken=False,
-      localhub=True,
   ):
     super(DPT_DINOv2, self).__init__()
 
     assert encoder in ['vits', 'vitb', 'vitl']
 
-    # in case the Internet connection is not stable, please load the DINOv2 locally
-    if localhub:
-      self.pretrained = torch.hub.load(
-          'torchhub/facebookresearch_dinov2_main',
-          'dinov2_{:}14'.format(encoder),
-          source='local',
-          pretrained=False,
-      )
-    else:
-      self.pretrained = torch.hub.load(
-          'facebookresearch/dinov2', 'dinov2_{:}14'.format(encoder)
-      )
-
-    # breakpoint()
+    self.pretrained = dinov2(encoder)
 
     dim = self.pretrained.blocks[0].attn.qkv.in_features
 
@@ -236,8 +231,29 @@ class DPT_DINOv2(nn.Module):
     return depth.squeeze(1)
 
 
+def load_dpt_dinov2(checkpoint, encoder='vitl', device='cuda'):
+  """Builds DPT_DINOv2 on the meta device and loads `checkpoint` into it.
+
+  Skips the random init of all parameters and, on torch>=2.1, memory-maps
+  the checkpoint and assigns its tensors instead of copying them.
+  """
+  with torch.device('meta'):
+    model = DPT_DINOv2(encoder=encoder, **MODEL_CONFIGS[encoder])
+
+  if 'assign' in inspect.signature(nn.Module.load_state_dict).parameters:
+    state_dict = torch.load(
+        checkpoint, map_location='cpu', mmap=True, weights_only=True
+    )
+    model.load_state_dict(state_dict, strict=True, assign=True)
+  else:
+    state_dict = torch.load(checkpoint, map_location='cpu')
+    model = model.to_empty(device='cpu')
+    model.load_state_dict(state_dict, strict=True)
+
+  return model.to(device).eval()
+
+
 if __name__ == '__main__':
-  depth_anything = DPT_DINOv2()
-  depth_anything.load_state_dict(
-      torch.load('checkpoints/depth_anything_dinov2_vitl14.pth')
+  depth_anything = load_dpt_dinov2(
+      'checkpoints/depth_anything_vitl14.pth', device='cpu'
   )
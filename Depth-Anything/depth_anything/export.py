@@ -0,0 +1,90 @@
+"""Export DPT_DINOv2 to TorchScript or ONNX.
+
+Exported models take a normalized image batch of shape (B, 3, H, W) with a
+dynamic batch dimension and a fixed H, W (multiples of 14), and return the
+relative depth of shape (B, H, W), exactly like `DPT_DINOv2.forward`.
+
+Usage (from the Depth-Anything directory):
+  python -m depth_anything.export --encoder vitl \
+    --load-from checkpoints/depth_anything_vitl14.pth \
+    --shape 518 924 --runtime onnx --output-path depth_anything_vitl14.onnx
+"""
+
+import argparse
+import json
+
+import torch
+
+from .dpt import MODEL_CONFIGS, load_dpt_dinov2
+from .runtime import SHAPE_FILE
+
+RUNTIMES = ['onnx', 'torchscript']
+
+
+def round_shape(shape):
+  """Round (H, W) to the closest multiple of the ViT patch size (14)."""
+  return [max(14, 14 * int(round(x / 14))) for x in shape]
+
+
+def export(model, path, shape=(518, 518), runtime='onnx'):
+  assert runtime in RUNTIMES, f'runtime {runtime} not in {RUNTIMES}'
+  assert all(x % 14 == 0 for x in shape), f'shape {shape} not multiple of 14'
+
+  model.eval()
+  image = torch.rand(1, 3, *shape, device=next(model.parameters()).device)
+
+  if runtime == 'torchscript':
+    with torch.no_grad():
+      traced = torch.jit.trace(model, image, check_trace=False)
+    traced = torch.jit.freeze(traced)
+    torch.jit.save(
+        traced,
+        path,
+        _extra_files={SHAPE_FILE: json.dumps(list(shape))},
+    )
+  else:
+    torch.onnx.export(
+        model,
+        (image,),
+        path,
+        input_names=['image'],
+        output_names=['depth'],
+        opset_version=14,
+        dynamic_axes={'image': {0: 'batch'}, 'depth': {0: 'batch'}},
+    )
+  print(f'Model exported to {path}')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Export DPT_DINOv2')
+  parser.add_argument(
+      '--encoder', type=str, default='vitl', choices=list(MODEL_CONFIGS)
+  )
+  parser.add_argument('--load-from', type=str, required=True)
+  parser.add_argument(
+      '--shape',
+      type=int,
+      nargs=2,
+      default=(518, 518),
+      help='Input (H, W). Rounded to multiple of 14, no dynamic shape!',
+  )
+  parser.add_argument('--runtime', type=str, default='onnx', choices=RUNTIMES)
+  parser.add_argument('--output-path', type=str, default=None)
+  args = parser.parse_args()
+
+  shape = round_shape(args.shape)
+  if list(args.shape) != shape:
+    print(f'Shape {args.shape} is not multiple of 14. Rounding to {shape}')
+
+  output_path = args.output_path
+  if output_path is None:
+    ext = 'onnx' if args.runtime == 'onnx' else 'pt'
+    output_path = 'depth_anything_{:}14_{:}x{:}.{:}'.format(
+        args.encoder, shape[0], shape[1], ext
+    )
+
+  depth_anything = load_dpt_dinov2(
+      args.load_from, encoder=args.encoder, device='cpu'
+  )
+
+  export(depth_anything, output_path, shape=shape, runtime=args.runtime)
@@ -0,0 +1,68 @@
+"""Inference wrapper for DPT_DINOv2 models exported by `export.py`.
+
+Loading an exported model skips building the PyTorch model and allows running
+on ONNX Runtime, including CPU only machines.
+"""
+
+import json
+
+import torch
+
+# key of the TorchScript extra file holding the static input shape
+SHAPE_FILE = 'shape.json'
+
+
+class DepthAnythingRuntime:
+  """Callable with the same contract as `DPT_DINOv2.forward`.
+
+  Input images must match `input_shape` (H, W), which is fixed at export time.
+  The runtime is given by the file extension (.onnx for ONNX, TorchScript
+  otherwise), `runtime` is checked against it when set.
+  """
+
+  def __init__(self, path, device=None, runtime=None):
+    self.path = path
+    self.runtime = 'onnx' if path.endswith('.onnx') else 'torchscript'
+    if runtime is not None and runtime != self.runtime:
+      raise ValueError(
+          f'{path} is a {self.runtime} model, not a {runtime} one'
+      )
+    if self.runtime == 'onnx':
+      import onnxruntime as ort  # pylint: disable=g-import-not-at-top
+
+      providers = ['CPUExecutionProvider']
+      if device != 'cpu' and 'CUDAExecutionProvider' in (
+          ort.get_available_providers()
+      ):
+        providers.insert(0, 'CUDAExecutionProvider')
+      self.session = ort.InferenceSession(path, providers=providers)
+      self.input_name = self.session.get_inputs()[0].name
+      self.input_shape = tuple(self.session.get_inputs()[0].shape[-2:])
+      # outputs are fetched on host, keep inputs there too
+      self.device = torch.device('cpu')
+      self.module = None
+    else:
+      if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+      self.device = torch.device(device)
+      extra_files = {SHAPE_FILE: ''}
+      self.module = torch.jit.load(
+          path, map_location=self.device, _extra_files=extra_files
+      )
+      self.module.eval()
+      self.input_shape = tuple(json.loads(extra_files[SHAPE_FILE]))
+      self.session = None
+
+  def __call__(self, x):
+    assert tuple(x.shape[-2:]) == self.input_shape, (
+        f'input shape {tuple(x.shape[-2:])} does not match exported shape'
+        f' {self.input_shape}'
+    )
+    if self.module is not None:
+      with torch.no_grad():
+        return self.module(x.to(self.device, torch.float32))
+
+    depth = self.session.run(
+        None, {self.input_name: x.detach().float().cpu().numpy()}
+    )[0]
+    return torch.from_numpy(depth).to(x.device)
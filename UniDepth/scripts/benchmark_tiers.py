@@ -0,0 +1,114 @@
+"""
+Benchmark UniDepthV2 inference tiers: ms/frame and abs_rel per tier.
+
+abs_rel needs GT depth: `--gt-path` holds one `.npy` per frame (same file stem
+as the image). Without it only the cost columns are measured, a tier is not
+compared against another tier's prediction. Prints a markdown table, e.g.
+
+| tier | long_dim | resolution_level | num_patches | precision | ms/frame | abs_rel |
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from unidepth.models import UniDepthV2
+from unidepth.models.unidepthv2 import INFERENCE_TIERS
+
+
+def load_rgb(img_path, long_dim):
+    rgb = np.array(Image.open(img_path))[..., :3]
+    if long_dim is not None:
+        scale = long_dim / max(rgb.shape[:2])
+        size = (round(rgb.shape[1] * scale), round(rgb.shape[0] * scale))
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+    return torch.from_numpy(rgb).permute(2, 0, 1)
+
+
+def abs_rel(pred, gt):
+    pred = F.interpolate(pred[None, None], size=gt.shape, mode="bilinear")[0, 0]
+    valid = gt > 0
+    return ((pred[valid] - gt[valid]).abs() / gt[valid]).mean().item()
+
+
+def run_tier(model, img_paths, tier, warmup):
+    long_dim = INFERENCE_TIERS[tier]["long_dim"]
+    rgbs = [load_rgb(img_path, long_dim) for img_path in img_paths]
+    for rgb in rgbs[:warmup]:
+        model.infer(rgb, tier=tier)
+
+    depths, elapsed = [], 0.0
+    for rgb in rgbs:
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        depth = model.infer(rgb, tier=tier)["depth"]
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        elapsed += time.perf_counter() - start
+        depths.append(depth[0, 0])
+    return depths, 1000.0 * elapsed / len(rgbs)
+
+
+def main(args):
+    img_paths = sorted(glob.glob(os.path.join(args.img_path, "*.jpg")))
+    img_paths += sorted(glob.glob(os.path.join(args.img_path, "*.png")))
+    img_paths = img_paths[: args.num_frames]
+
+    model = UniDepthV2.from_pretrained(args.model)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = model.to(device).eval()
+
+    results = {
+        tier: run_tier(model, img_paths, tier, args.warmup)
+        for tier in INFERENCE_TIERS
+    }
+
+    if args.gt_path is not None:
+        gts = [
+            np.load(
+                os.path.join(
+                    args.gt_path, os.path.splitext(os.path.basename(p))[0] + ".npy"
+                )
+            )
+            for p in img_paths
+        ]
+        gts = [torch.from_numpy(gt).float().to(device) for gt in gts]
+    else:
+        gts = None
+        print("No --gt-path, abs_rel is not measured.")
+
+    print(
+        "| tier | long_dim | resolution_level | num_patches | precision "
+        "| ms/frame | abs_rel |\n"
+        "|---|---|---|---|---|---|---|"
+    )
+    for tier, (depths, ms) in results.items():
+        settings = INFERENCE_TIERS[tier]
+        err = "n/a"
+        if gts is not None:
+            err = "%.4f" % np.mean([abs_rel(d, gt) for d, gt in zip(depths, gts)])
+        print(
+            f"| {tier} | {settings['long_dim']} | {settings['resolution_level']} "
+            f"| {settings['num_patches']} | {settings['precision']} "
+            f"| {ms:.1f} | {err} |"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark UniDepthV2 tiers")
+    parser.add_argument("--img-path", type=str, required=True)
+    parser.add_argument("--gt-path", type=str, default=None)
+    parser.add_argument("--num-frames", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument(
+        "--model", type=str, default="lpiccinelli/unidepth-v2-vitl14"
+    )
+    main(parser.parse_args())
@@ -1,17 +1,18 @@
 import argparse
-import glob
 import os
+import sys
 
 import cv2
 import imageio
 import numpy as np
-from PIL import Image
 import torch
 import tqdm
 from unidepth.models import UniDepthV2
+from unidepth.models.unidepthv2 import INFERENCE_TIERS
 from unidepth.utils import colorize, image_grid
 
-LONG_DIM = 640
+sys.path.append(".")
+from pipeline.frames import FrameSource
 
 def demo(model, args):
   outdir = args.outdir  # "./outputs"
@@ -22,29 +23,35 @@ def demo(model, args):
   outdir_scene = os.path.join(outdir, scene_name)
   os.makedirs(outdir_scene, exist_ok=True)
   # img_path_list = sorted(glob.glob("/home/zhengqili/filestore/DAVIS/DAVIS/JPEGImages/480p/%s/*.jpg"%scene_name))
-  img_path_list = sorted(glob.glob(os.path.join(args.img_path, "*.jpg")))
-  img_path_list += sorted(glob.glob(os.path.join(args.img_path, "*.png")))
+  # directory of frames or video file
+  source = FrameSource(args.img_path)
+
+  # long side of the input, None keeps the original resolution
+  long_dim = INFERENCE_TIERS[args.tier]["long_dim"]
 
   fovs = []
-  for img_path in tqdm.tqdm(img_path_list):
-    rgb = np.array(Image.open(img_path))[..., :3]
-    if rgb.shape[1] > rgb.shape[0]:
-      final_w, final_h = LONG_DIM, int(
-          round(LONG_DIM * rgb.shape[0] / rgb.shape[1])
-      )
-    else:
-      final_w, final_h = (
-          int(round(LONG_DIM * rgb.shape[1] / rgb.shape[0])),
-          LONG_DIM,
-      )
-    rgb = cv2.resize(
-        rgb, (final_w, final_h), cv2.INTER_AREA
-    )  # .transpose(2, 0, 1)
+  for name, frame in tqdm.tqdm(
+      zip(source.frame_names, source), total=len(source)
+  ):
+    rgb = np.ascontiguousarray(frame[..., ::-1])
+    if long_dim is not None:
+      if rgb.shape[1] > rgb.shape[0]:
+        final_w, final_h = long_dim, int(
+            round(long_dim * rgb.shape[0] / rgb.shape[1])
+        )
+      else:
+        final_w, final_h = (
+            int(round(long_dim * rgb.shape[1] / rgb.shape[0])),
+            long_dim,
+        )
+      rgb = cv2.resize(
+          rgb, (final_w, final_h), cv2.INTER_AREA
+      )  # .transpose(2, 0, 1)
 
     rgb_torch = torch.from_numpy(rgb).permute(2, 0, 1)
     # intrinsics_torch = torch.from_numpy(np.load("assets/demo/intrinsics.npy"))
     # predict
-    predictions = model.infer(rgb_torch)
+    predictions = model.infer(rgb_torch, tier=args.tier)
     fov_ = np.rad2deg(
         2
         * np.arctan(
@@ -57,7 +64,7 @@ def demo(model, args):
     fovs.append(fov_)
     # breakpoint()
     np.savez(
-        os.path.join(outdir_scene, img_path.split("/")[-1][:-4] + ".npz"),
+        os.path.join(outdir_scene, name + ".npz"),
         depth=np.float32(depth),
         fov=fov_,
     )
@@ -68,6 +75,13 @@ if __name__ == "__main__":
   parser.add_argument("--img-path", type=str)
   parser.add_argument("--outdir", type=str, default="./vis_depth")
   parser.add_argument("--scene-name", type=str)
+  parser.add_argument(
+      "--tier",
+      type=str,
+      default="standard",
+      choices=list(INFERENCE_TIERS),
+      help="speed/accuracy operating point, see scripts/benchmark_tiers.py",
+  )
 
   args = parser.parse_args()
 
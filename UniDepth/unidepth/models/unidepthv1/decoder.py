@@ -3,6 +3,7 @@ Author: Luigi Piccinelli
 Licensed under the CC-BY NC 4.0 license (http://creativecommons.org/licenses/by-nc/4.0/)
 """
 
+from collections import OrderedDict
 from typing import List, Tuple
 
 import torch
@@ -13,9 +14,12 @@ from timm.models.layers import trunc_normal_
 
 from unidepth.layers import (MLP, AttentionBlock, ConvUpsample, NystromBlock,
                              PositionEmbeddingSine)
-from unidepth.utils.geometric import flat_interpolate, generate_rays
+from unidepth.utils.geometric import (flat_interpolate,
+                                      generate_rays_cached)
 from unidepth.utils.misc import max_stack
-from unidepth.utils.sht import rsh_cart_8
+from unidepth.utils.sht import rsh_cart_fused
+
+RAYS_EMBEDDING_CACHE_SIZE = 4
 
 
 class ListAdapter(nn.Module):
@@ -185,6 +189,7 @@ class DepthHead(nn.Module):
         self.out2 = nn.Conv2d(hidden_dim // 8, 1, 3, padding=1)
         self.out4 = nn.Conv2d(hidden_dim // 4, 1, 3, padding=1)
         self.out8 = nn.Conv2d(hidden_dim // 2, 1, 3, padding=1)
+        self.rays_embedding_cache = OrderedDict()
 
     def set_original_shapes(self, shapes: Tuple[int, int]):
         self.original_shapes = shapes
@@ -192,35 +197,65 @@ class DepthHead(nn.Module):
     def set_shapes(self, shapes: Tuple[int, int]):
         self.shapes = shapes
 
+    def embed_rays(self, rays_hr: torch.Tensor, shapes, intrinsics=None):
+        # rays harmonics at 1/16, 1/8 and 1/4, they only depend on the camera:
+        # at inference they are cached by the intrinsics rays come from
+        use_cache = (
+            intrinsics is not None
+            and not self.training
+            and not (rays_hr.requires_grad and torch.is_grad_enabled())
+        )
+        if use_cache:
+            key = (
+                tuple(intrinsics.detach().flatten().tolist()),
+                tuple(self.original_shapes),
+                tuple(shapes),
+                str(rays_hr.device),
+                rays_hr.dtype,
+            )
+            if key in self.rays_embedding_cache:
+                self.rays_embedding_cache.move_to_end(key)
+                return self.rays_embedding_cache[key]
+
+        rays_embeddings = tuple(
+            rsh_cart_fused(
+                F.normalize(
+                    flat_interpolate(
+                        rays_hr,
+                        old=self.original_shapes,
+                        new=[x * ratio for x in shapes],
+                    ),
+                    dim=-1,
+                ),
+                degree=8,
+            )
+            for ratio in [1, 2, 4]
+        )
+
+        if use_cache:
+            self.rays_embedding_cache[key] = rays_embeddings
+            while len(self.rays_embedding_cache) > RAYS_EMBEDDING_CACHE_SIZE:
+                self.rays_embedding_cache.popitem(last=False)
+        return rays_embeddings
+
     def forward(
-        self, features: torch.Tensor, rays_hr: torch.Tensor, pos_embed, level_embed
+        self,
+        features: torch.Tensor,
+        rays_hr: torch.Tensor,
+        pos_embed,
+        level_embed,
+        intrinsics=None,
     ) -> torch.Tensor:
         features = features.unbind(dim=-1)
         shapes = self.shapes
 
         # camera_embedding
-        # torch.cuda.synchronize()
-        # start = time()
-        rays_embedding_16 = F.normalize(
-            flat_interpolate(rays_hr, old=self.original_shapes, new=shapes), dim=-1
-        )
-        rays_embedding_8 = F.normalize(
-            flat_interpolate(
-                rays_hr, old=self.original_shapes, new=[x * 2 for x in shapes]
-            ),
-            dim=-1,
+        rays_embedding_16, rays_embedding_8, rays_embedding_4 = self.embed_rays(
+            rays_hr, shapes, intrinsics=intrinsics
         )
-        rays_embedding_4 = F.normalize(
-            flat_interpolate(
-                rays_hr, old=self.original_shapes, new=[x * 4 for x in shapes]
-            ),
-            dim=-1,
-        )
-        rays_embedding_16 = self.project_rays16(rsh_cart_8(rays_embedding_16))
-        rays_embedding_8 = self.project_rays8(rsh_cart_8(rays_embedding_8))
-        rays_embedding_4 = self.project_rays4(rsh_cart_8(rays_embedding_4))
-        # torch.cuda.synchronize()
-        # print(f"camera_embedding took {time() - start} seconds")
+        rays_embedding_16 = self.project_rays16(rays_embedding_16)
+        rays_embedding_8 = self.project_rays8(rays_embedding_8)
+        rays_embedding_4 = self.project_rays4(rays_embedding_4)
         features_tokens = torch.cat(features, dim=1)
         features_tokens_pos = pos_embed + level_embed
 
@@ -360,7 +395,7 @@ class Decoder(nn.Module):
         intrinsics[:, 0, 2] = intrinsics[:, 0, 2] * original_shapes[1]
         intrinsics[:, 1, 2] = intrinsics[:, 1, 2] * original_shapes[0]
         if not self.test_fixed_camera:
-            rays, _ = generate_rays(intrinsics, original_shapes, noisy=False)
+            rays, _ = generate_rays_cached(intrinsics, original_shapes, noisy=False)
 
         return intrinsics, rays
 
@@ -451,6 +486,10 @@ class Decoder(nn.Module):
         )
 
         # run bulk of the model
+        # intrinsics rays come from, GT ones if used by the camera
+        rays_intrinsics = (
+            inputs["K"] if self.test_fixed_camera or self.skip_camera else intrinsics
+        )
         self.depth_layer.set_shapes(common_shape)
         self.depth_layer.set_original_shapes((H, W))
         out8, out4, out2, depth_features = self.depth_layer(
@@ -458,6 +497,7 @@ class Decoder(nn.Module):
             rays_hr=rays,
             pos_embed=pos_embed,
             level_embed=level_embed,
+            intrinsics=rays_intrinsics,
         )
 
         return intrinsics, [out8, out4, out2], depth_features
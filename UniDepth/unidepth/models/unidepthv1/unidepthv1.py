@@ -18,7 +18,7 @@ from unidepth.models.unidepthv1.decoder import Decoder
 from unidepth.utils.constants import (IMAGENET_DATASET_MEAN,
                                       IMAGENET_DATASET_STD)
 from unidepth.utils.distributed import is_main_process
-from unidepth.utils.geometric import (generate_rays,
+from unidepth.utils.geometric import (generate_rays_cached,
                                       spherical_zbuffer_to_euclidean)
 from unidepth.utils.misc import get_params
 
@@ -127,7 +127,7 @@ class UniDepthV1(
 
         # Get camera infos, if any
         if gt_intrinsics is not None:
-            rays, angles = generate_rays(
+            rays, angles = generate_rays_cached(
                 gt_intrinsics, self.image_shape, noisy=self.training
             )
             inputs["rays"] = rays
@@ -151,7 +151,9 @@ class UniDepthV1(
         ) / len(predictions)
 
         # Final 3D points backprojection
-        pred_angles = generate_rays(pred_intrinsics, (H, W), noisy=False)[-1]
+        pred_angles = generate_rays_cached(pred_intrinsics, (H, W), noisy=False)[
+            -1
+        ]
         # You may want to use inputs["angles"] if available?
         pred_angles = rearrange(pred_angles, "b (h w) c -> b c h w", h=H, w=W)
         points_3d = torch.cat((pred_angles, predictions), dim=1)
@@ -216,7 +218,7 @@ class UniDepthV1(
         inputs["cls_tokens"] = cls_tokens
         inputs["image"] = rgbs
         if gt_intrinsics is not None:
-            rays, angles = generate_rays(
+            rays, angles = generate_rays_cached(
                 gt_intrinsics, self.image_shape, noisy=self.training
             )
             inputs["rays"] = rays
@@ -240,7 +242,7 @@ class UniDepthV1(
 
         # final 3D points backprojection
         intrinsics = gt_intrinsics if gt_intrinsics is not None else pred_intrinsics
-        angles = generate_rays(intrinsics, (H, W), noisy=False)[-1]
+        angles = generate_rays_cached(intrinsics, (H, W), noisy=False)[-1]
         angles = rearrange(angles, "b (h w) c -> b c h w", h=H, w=W)
         points_3d = torch.cat((angles, predictions), dim=1)
         points_3d = spherical_zbuffer_to_euclidean(
@@ -1,5 +1,6 @@
-from .unidepthv2 import UniDepthV2
+from .unidepthv2 import INFERENCE_TIERS, UniDepthV2
 
 __all__ = [
+    "INFERENCE_TIERS",
     "UniDepthV2",
 ]
@@ -6,7 +6,8 @@ from timm.models.layers import trunc_normal_
 
 from unidepth.layers import (MLP, AttentionBlock, ConvUpsampleShuffleResidual,
                              NystromBlock, PositionEmbeddingSine)
-from unidepth.utils.geometric import flat_interpolate, generate_rays
+from unidepth.utils.geometric import (flat_interpolate,
+                                      generate_rays_cached)
 from unidepth.utils.positional_embedding import generate_fourier_features
 
 
@@ -401,7 +402,7 @@ class Decoder(nn.Module):
         rays = (
             rays_gt
             if rays_gt is not None
-            else generate_rays(intrinsics, original_shapes)[0]
+            else generate_rays_cached(intrinsics, original_shapes)[0]
         )
         return intrinsics, rays
 
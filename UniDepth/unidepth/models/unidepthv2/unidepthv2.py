@@ -14,7 +14,7 @@ from unidepth.models.unidepthv2.decoder import Decoder
 from unidepth.utils.constants import (IMAGENET_DATASET_MEAN,
                                       IMAGENET_DATASET_STD)
 from unidepth.utils.distributed import is_main_process
-from unidepth.utils.geometric import (generate_rays,
+from unidepth.utils.geometric import (generate_rays_cached,
                                       spherical_zbuffer_to_euclidean)
 from unidepth.utils.misc import (first_stack, last_stack, max_stack,
                                  mean_stack, softmax_stack)
@@ -27,6 +27,36 @@ STACKING_FNS = {
     "softmax": softmax_stack,
 }
 RESOLUTION_LEVELS = 10
+# named operating points: input long side (None keeps the image size), network
+# resolution level, number of 14x14 patches overriding the level (None uses
+# it) and autocast precision, see scripts/benchmark_tiers.py for measured
+# costs. The encoder cost grows linearly to quadratically (attention) with the
+# number of patches, for pixels_bounds = [1400, 2400]:
+#   draft     1400 patches (~0.27 MP), 0.58x the standard patches, fp16
+#   standard  2400 patches (~0.47 MP), fp32, the previous behaviour
+#   high      3600 patches (~0.71 MP), 1.5x the standard patches, fp32, above
+#             the training resolution bounds
+INFERENCE_TIERS = {
+    "draft": {
+        "long_dim": 448,
+        "resolution_level": 0,
+        "num_patches": None,
+        "precision": "fp16",
+    },
+    "standard": {
+        "long_dim": 640,
+        "resolution_level": RESOLUTION_LEVELS,
+        "num_patches": None,
+        "precision": "fp32",
+    },
+    "high": {
+        "long_dim": None,
+        "resolution_level": RESOLUTION_LEVELS,
+        "num_patches": 3600,
+        "precision": "fp32",
+    },
+}
+PRECISIONS = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
 
 
 # inference helpers
@@ -42,7 +72,11 @@ def _check_ratio(image_ratio, ratio_bounds):
         )
 
 
-def _check_resolution(shape_constraints, resolution_level):
+def _check_resolution(shape_constraints, resolution_level, num_patches=None):
+    if num_patches is not None:
+        # explicit network resolution, may exceed pixels_bounds_ori
+        shape_constraints["pixels_bounds"] = [num_patches, num_patches]
+        return shape_constraints
     if resolution_level is None:
         warnings.warn(
             "Resolution level is not set. Using max resolution. "
@@ -67,6 +101,21 @@ def _check_resolution(shape_constraints, resolution_level):
     return shape_constraints
 
 
+def _get_tier(tier):
+    assert (
+        tier in INFERENCE_TIERS
+    ), f"Inference tier {tier} not found in {INFERENCE_TIERS.keys()}"
+    return INFERENCE_TIERS[tier]
+
+
+def _autocast_dtype(device_type, precision):
+    dtype = PRECISIONS[precision]
+    if device_type == "cpu" and dtype == torch.float16:
+        warnings.warn("fp16 autocast is not supported on CPU. Using bf16.")
+        dtype = torch.bfloat16
+    return dtype
+
+
 def _get_closes_num_pixels(image_shape, pixels_bounds):
     h, w = image_shape
     num_pixels = h * w
@@ -134,12 +183,14 @@ class UniDepthV2(
         self.interpolation_mode = "bilinear"
         self.eps = eps
         self.resolution_level = None
+        self.num_patches = None
+        self.precision = "fp32"
 
     def forward(self, inputs, image_metas):
         H, W = inputs["depth"].shape[-2:]
 
         if "K" in inputs:
-            rays, angles = generate_rays(inputs["K"], (H, W))
+            rays, angles = generate_rays_cached(inputs["K"], (H, W))
             inputs["rays"] = rays
             inputs["angles"] = angles
 
@@ -165,7 +216,7 @@ class UniDepthV2(
         outs = self.pixel_decoder(inputs, image_metas)
 
         angles = rearrange(
-            generate_rays(outs["K"], (H, W), noisy=False)[-1],
+            generate_rays_cached(outs["K"], (H, W), noisy=False)[-1],
             "b (h w) c -> b c h w",
             h=H,
             w=W,
@@ -198,9 +249,22 @@ class UniDepthV2(
         }
         return outputs
 
+    def set_tier(self, tier: str):
+        settings = _get_tier(tier)
+        self.resolution_level = settings["resolution_level"]
+        self.num_patches = settings["num_patches"]
+        self.precision = settings["precision"]
+
     @torch.no_grad()
-    def infer(self, rgbs: torch.Tensor, intrinsics=None):
+    def infer(self, rgbs: torch.Tensor, intrinsics=None, tier=None):
         shape_constraints = self.shape_constraints
+        resolution_level, precision = self.resolution_level, self.precision
+        num_patches = self.num_patches
+        if tier is not None:
+            settings = _get_tier(tier)
+            resolution_level = settings["resolution_level"]
+            num_patches = settings["num_patches"]
+            precision = settings["precision"]
         if rgbs.ndim == 3:
             rgbs = rgbs.unsqueeze(0)
         if intrinsics is not None and intrinsics.ndim == 2:
@@ -222,7 +286,9 @@ class UniDepthV2(
             )
 
         # check resolution constraints: tradeoff resolution and speed
-        shape_constraints = _check_resolution(shape_constraints, self.resolution_level)
+        shape_constraints = _check_resolution(
+            shape_constraints, resolution_level, num_patches
+        )
 
         # get image shape
         (h, w), ratio = _shapes((H, W), shape_constraints)
@@ -233,35 +299,46 @@ class UniDepthV2(
             ratio,
         )
 
-        # run encoder
-        features, tokens = self.pixel_encoder(rgbs)
-
-        cls_tokens = [x.contiguous() for x in tokens]
-        features = [
-            self.stacking_fn(features[i:j]).contiguous()
-            for i, j in self.slices_encoder_range
-        ]
-        tokens = [
-            self.stacking_fn(tokens[i:j]).contiguous()
-            for i, j in self.slices_encoder_range
-        ]
-        global_tokens = [cls_tokens[i] for i in [-2, -1]]
-        camera_tokens = [cls_tokens[i] for i in [-3, -2, -1]] + [tokens[-2]]
-
-        # get data fro decoder and adapt to given camera
-        inputs = {}
-        inputs["features"] = features
-        inputs["tokens"] = tokens
-        inputs["global_tokens"] = global_tokens
-        inputs["camera_tokens"] = camera_tokens
-        inputs["image"] = rgbs
-        if gt_intrinsics is not None:
-            rays, angles = generate_rays(gt_intrinsics, (h, w))
-            inputs["rays"] = rays
-            inputs["angles"] = angles
-            inputs["K"] = gt_intrinsics
+        # run encoder and decoder, reduced precision is opt-in (see tiers)
+        dtype = _autocast_dtype(self.device.type, precision)
+        with torch.autocast(
+            device_type=self.device.type,
+            dtype=dtype,
+            enabled=dtype != torch.float32,
+        ):
+            features, tokens = self.pixel_encoder(rgbs)
+
+            cls_tokens = [x.contiguous() for x in tokens]
+            features = [
+                self.stacking_fn(features[i:j]).contiguous()
+                for i, j in self.slices_encoder_range
+            ]
+            tokens = [
+                self.stacking_fn(tokens[i:j]).contiguous()
+                for i, j in self.slices_encoder_range
+            ]
+            global_tokens = [cls_tokens[i] for i in [-2, -1]]
+            camera_tokens = [cls_tokens[i] for i in [-3, -2, -1]] + [tokens[-2]]
+
+            # get data fro decoder and adapt to given camera
+            inputs = {}
+            inputs["features"] = features
+            inputs["tokens"] = tokens
+            inputs["global_tokens"] = global_tokens
+            inputs["camera_tokens"] = camera_tokens
+            inputs["image"] = rgbs
+            if gt_intrinsics is not None:
+                rays, angles = generate_rays_cached(gt_intrinsics, (h, w))
+                inputs["rays"] = rays
+                inputs["angles"] = angles
+                inputs["K"] = gt_intrinsics
+
+            outs = self.pixel_decoder(inputs, {})
+        outs = {
+            k: v.float() if k in ["K", "depth", "confidence"] else v
+            for k, v in outs.items()
+        }
 
-        outs = self.pixel_decoder(inputs, {})
         # undo the reshaping and get original image size (slow)
         outs = _postprocess(outs, ratio, (H, W), mode=self.interpolation_mode)
         pred_intrinsics = outs["K"]
@@ -270,7 +347,7 @@ class UniDepthV2(
 
         # final 3D points backprojection
         intrinsics = intrinsics if intrinsics is not None else pred_intrinsics
-        angles = generate_rays(intrinsics, (H, W))[-1]
+        angles = generate_rays_cached(intrinsics, (H, W))[-1]
         angles = rearrange(angles, "b (h w) c -> b c h w", h=H, w=W)
         points_3d = torch.cat((angles, depth), dim=1)
         points_3d = spherical_zbuffer_to_euclidean(
@@ -3,6 +3,7 @@ Author: Luigi Piccinelli
 Licensed under the CC-BY NC 4.0 license (http://creativecommons.org/licenses/by-nc/4.0/)
 """
 
+from collections import OrderedDict
 from typing import Tuple
 
 import torch
@@ -53,6 +54,53 @@ def generate_rays(
     return ray_directions, angles
 
 
+# bounded LRU of (rays, angles) keyed by (K, H, W, device, dtype)
+RAYS_CACHE_SIZE = 8
+_RAYS_CACHE: "OrderedDict[tuple, Tuple[torch.Tensor, torch.Tensor]]" = OrderedDict()
+
+
+def clear_rays_cache():
+    _RAYS_CACHE.clear()
+
+
+def generate_rays_cached(
+    camera_intrinsics: torch.Tensor, image_shape: Tuple[int, int], noisy: bool = False
+):
+    """
+    Memoized version of `generate_rays`.
+
+    Rays and angles only depend on the intrinsics and the image shape, hence
+    for video inference they are the same for every frame. Falls back to
+    `generate_rays` whenever a fresh result is needed: noisy rays, intrinsics
+    that require grad or tracing for export. Returned tensors are shared
+    among callers and must not be modified in place.
+    """
+    if (
+        noisy
+        or RAYS_CACHE_SIZE <= 0
+        or (camera_intrinsics.requires_grad and torch.is_grad_enabled())
+        or torch.jit.is_tracing()
+    ):
+        return generate_rays(camera_intrinsics, image_shape, noisy=noisy)
+
+    key = (
+        tuple(camera_intrinsics.detach().flatten().tolist()),
+        int(image_shape[0]),
+        int(image_shape[1]),
+        str(camera_intrinsics.device),
+        camera_intrinsics.dtype,
+    )
+    if key in _RAYS_CACHE:
+        _RAYS_CACHE.move_to_end(key)
+        return _RAYS_CACHE[key]
+
+    rays, angles = generate_rays(camera_intrinsics, image_shape, noisy=False)
+    _RAYS_CACHE[key] = (rays, angles)
+    while len(_RAYS_CACHE) > RAYS_CACHE_SIZE:
+        _RAYS_CACHE.popitem(last=False)
+    return rays, angles
+
+
 @torch.jit.script
 def spherical_zbuffer_to_euclidean(spherical_tensor: torch.Tensor) -> torch.Tensor:
     theta = spherical_tensor[..., 0]  # Extract polar angle
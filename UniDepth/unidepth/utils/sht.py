@@ -5,6 +5,9 @@ https://github.com/cheind/torch-spherical-harmonics
 for more information.
 """
 
+import math
+from functools import lru_cache
+
 import torch
 
 
@@ -1393,6 +1396,95 @@ def rsh_cart_8(xyz: torch.Tensor):
     )
 
 
+@lru_cache(maxsize=None)
+def _rsh_coefficients(degree: int):
+    # sqrt(2) * K_l^m for m > 0 and K_l^0 for m == 0, with K_l^m the SH
+    # normalization sqrt((2l + 1) / 4pi * (l - m)! / (l + m)!)
+    return {
+        (l, m): (1.0 if m == 0 else math.sqrt(2.0))
+        * math.sqrt(
+            (2 * l + 1)
+            / (4 * math.pi)
+            * math.factorial(l - m)
+            / math.factorial(l + m)
+        )
+        for m in range(degree + 1)
+        for l in range(m, degree + 1)
+    }
+
+
+def rsh_cart_fused(xyz: torch.Tensor, degree: int = 8):
+    """Computes all real spherical harmonics up to `degree`, low-allocation.
+
+    Same output as `rsh_cart_<degree>`, but evaluated as
+    K_l^m P_l^m(z) Re/Im((x + iy)^m) with the associated Legendre recurrence
+    in l and the complex power recurrence in m. Every harmonic is written in
+    place into the output, only a few single-channel buffers are allocated.
+    In-place updates are not differentiable: if `xyz` requires grad it falls
+    back to the autogenerated `rsh_cart_<degree>`.
+
+    Params:
+        xyz: (N,...,3) tensor of points on the unit sphere
+        degree: maximum degree
+
+    Returns:
+        rsh: (N,...,(degree+1)**2) real spherical harmonics
+            projections of input. Ynm is found at index
+            `n*(n+1) + m`, with `0 <= n <= degree` and
+            `-n <= m <= n`.
+    """
+    if xyz.requires_grad and torch.is_grad_enabled():
+        return [
+            rsh_cart_0,
+            rsh_cart_1,
+            rsh_cart_2,
+            rsh_cart_3,
+            rsh_cart_4,
+            rsh_cart_5,
+            rsh_cart_6,
+            rsh_cart_7,
+            rsh_cart_8,
+        ][degree](xyz)
+
+    coefficients = _rsh_coefficients(degree)
+    x, y, z = xyz.unbind(-1)
+    out = xyz.new_empty(*xyz.shape[:-1], (degree + 1) ** 2)
+    tmp, tmp2 = torch.empty_like(x), torch.empty_like(x)
+    c, s = torch.ones_like(x), torch.zeros_like(x)  # Re/Im of (x + iy)^m
+    p0, p1 = torch.empty_like(x), torch.empty_like(x)  # P_{l-2}^m, P_{l-1}^m
+
+    pmm = 1.0  # P_m^m = (-1)^m (2m - 1)!!, sin(theta)^m is in (x + iy)^m
+    for m in range(degree + 1):
+        if m > 0:
+            torch.mul(s, y, out=tmp)
+            torch.mul(c, y, out=tmp2)
+            c.mul_(x).sub_(tmp)
+            s.mul_(x).add_(tmp2)
+            pmm *= -(2 * m - 1)
+        p1.fill_(pmm)
+        for l in range(m, degree + 1):
+            if l == m + 1:
+                p0.copy_(p1)
+                p1.mul_(z).mul_(2 * m + 1)
+            elif l > m + 1:
+                # P_l = ((2l - 1) z P_{l-1} - (l + m - 1) P_{l-2}) / (l - m)
+                torch.mul(z, p1, out=tmp)
+                p0.mul_(-(l + m - 1) / (l - m)).add_(
+                    tmp, alpha=(2 * l - 1) / (l - m)
+                )
+                p0, p1 = p1, p0
+            k = coefficients[(l, m)]
+            if m == 0:
+                torch.mul(p1, k, out=tmp)
+                out[..., l * (l + 1)].copy_(tmp)
+            else:
+                torch.mul(p1, c, out=tmp)
+                out[..., l * (l + 1) + m].copy_(tmp.mul_(k))
+                torch.mul(p1, s, out=tmp)
+                out[..., l * (l + 1) - m].copy_(tmp.mul_(k))
+    return out
+
+
 __all__ = [
     "rsh_cart_0",
     "rsh_cart_1",
@@ -1403,6 +1495,7 @@ __all__ = [
     "rsh_cart_6",
     "rsh_cart_7",
     "rsh_cart_8",
+    "rsh_cart_fused",
 ]
 
 
@@ -222,6 +222,33 @@ def read_images_binary(path_to_model_file):
   return images
 
 
+def read_image_poses_binary(path_to_model_file):
+  """Names, qvecs (N, 4) and tvecs (N, 3) of the images of an images.bin.
+
+  Like read_images_binary, without parsing the 2D points of the images.
+  """
+  names, poses = [], []
+  with open(path_to_model_file, "rb") as fid:
+    num_reg_images = read_next_bytes(fid, 8, "Q")[0]
+    for _ in range(num_reg_images):
+      binary_image_properties = read_next_bytes(
+          fid, num_bytes=64, format_char_sequence="idddddddi"
+      )
+      poses.append(binary_image_properties[1:8])
+      image_name = b""
+      current_char = fid.read(1)
+      while current_char != b"\x00":  # look for the ASCII 0 entry
+        image_name += current_char
+        current_char = fid.read(1)
+      names.append(image_name.decode("utf-8"))
+      num_points2D = read_next_bytes(
+          fid, num_bytes=8, format_char_sequence="Q"
+      )[0]
+      fid.seek(24 * num_points2D, os.SEEK_CUR)
+  poses = np.array(poses, dtype=np.float64).reshape(-1, 7)
+  return names, poses[:, :4], poses[:, 4:]
+
+
 def read_points3D_text(path):
   """see: src/base/reconstruction.cc
 
@@ -324,6 +351,25 @@ def qvec2rotmat(qvec):
   ])
 
 
+def qvecs2rotmats(qvecs):
+  """Vectorized qvec2rotmat, (N, 4) qvecs to (N, 3, 3) rotations."""
+  w, x, y, z = np.asarray(qvecs).T
+  return np.stack(
+      [
+          1 - 2 * y**2 - 2 * z**2,
+          2 * x * y - 2 * w * z,
+          2 * z * x + 2 * w * y,
+          2 * x * y + 2 * w * z,
+          1 - 2 * x**2 - 2 * z**2,
+          2 * y * z - 2 * w * x,
+          2 * z * x - 2 * w * y,
+          2 * y * z + 2 * w * x,
+          1 - 2 * x**2 - 2 * y**2,
+      ],
+      axis=-1,
+  ).reshape(-1, 3, 3)
+
+
 def rotmat2qvec(R):
   Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
   K = (
@@ -23,9 +23,11 @@
 # pylint: disable=undefined-variable
 # pylint: disable=undefined-loop-variable
 
+from itertools import islice  # pylint: disable=g-importing-member
 import sys
 
 sys.path.append("base/droid_slam")
+sys.path.append(".")
 
 from tqdm import tqdm
 import numpy as np
@@ -38,6 +40,10 @@ from lietorch import SE3
 
 import torch.nn.functional as F
 from droid import Droid
+from pipeline.preprocess import crop_to_multiple
+from pipeline.preprocess import resize_crop
+from pipeline.preprocess import target_size
+from pipeline.reconstruction import save_tracking
 
 
 def image_stream(
@@ -76,11 +82,9 @@ def image_stream(
 
     # breakpoint()
     h0, w0, _ = image.shape
-    h1 = int(h0 * np.sqrt((384 * 512) / (h0 * w0)))
-    w1 = int(w0 * np.sqrt((384 * 512) / (h0 * w0)))
+    h1, w1 = target_size(h0, w0)
 
-    image = cv2.resize(image, (w1, h1), interpolation=cv2.INTER_AREA)
-    image = image[: h1 - h1 % 8, : w1 - w1 % 8]
+    image = resize_crop(image)
 
     # if t == 4 or t == 29:
     # imageio.imwrite("debug/camel_%d.png"%t, image[..., ::-1])
@@ -93,7 +97,7 @@ def image_stream(
     depth = F.interpolate(
         depth[None, None], (h1, w1), mode="nearest-exact"
     ).squeeze()
-    depth = depth[: h1 - h1 % 8, : w1 - w1 % 8]
+    depth = crop_to_multiple(depth)
 
     mask = torch.ones_like(depth)
 
@@ -110,49 +114,27 @@ def image_stream(
 def save_full_reconstruction(
     droid, full_traj, rgb_list, senor_depth_list, motion_prob, scene_name
 ):
-  """Save full reconstruction."""
-  from pathlib import Path
+  """Save full reconstruction, frames are streamed to the container."""
   t = full_traj.shape[0]
-  images = np.array(rgb_list[:t])  # droid.video.images[:t].cpu().numpy()
-  disps = 1.0 / (np.array(senor_depth_list[:t]) + 1e-6)
-
   poses = full_traj  # .cpu().numpy()
   intrinsics = droid.video.intrinsics[:t].cpu().numpy()
 
-  Path("reconstructions/{}".format(scene_name)).mkdir(
-      parents=True, exist_ok=True
-  )
-  np.save("reconstructions/{}/images.npy".format(scene_name), images)
-  np.save("reconstructions/{}/disps.npy".format(scene_name), disps)
-  np.save("reconstructions/{}/poses.npy".format(scene_name), poses)
-  np.save(
-      "reconstructions/{}/intrinsics.npy".format(scene_name), intrinsics * 8.0
-  )
-  np.save("reconstructions/{}/motion_prob.npy".format(scene_name), motion_prob)
-
-  intrinsics = intrinsics[0] * 8.0
   poses_th = torch.as_tensor(poses, device="cpu")
   cam_c2w = SE3(poses_th).inv().matrix().numpy()
 
-  K = np.eye(3)
-  K[0, 0] = intrinsics[0]
-  K[1, 1] = intrinsics[1]
-  K[0, 2] = intrinsics[2]
-  K[1, 2] = intrinsics[3]
-  print("K ", K)
-  print("img_data ", images.shape)
-  print("disp_data ", disps.shape)
-
-  max_frames = min(1000, images.shape[0])
-  print("outputs/%s_droid.npz" % scene_name)
-  Path("outputs").mkdir(parents=True, exist_ok=True)
-
-  np.savez(
-      "outputs/%s_droid.npz" % scene_name,
-      images=np.uint8(images[:max_frames, ::-1, ...].transpose(0, 2, 3, 1)),
-      depths=np.float32(1.0 / disps[:max_frames, ...]),
-      intrinsic=K,
-      cam_c2w=cam_c2w[:max_frames],
+  print("frames ", t)
+  print("reconstructions/%s" % scene_name)
+  save_tracking(
+      "reconstructions/%s" % scene_name,
+      (np.asarray(image) for image in islice(rgb_list, t)),
+      (
+          1.0 / (np.asarray(depth) + 1e-6)
+          for depth in islice(senor_depth_list, t)
+      ),
+      poses,
+      intrinsics * 8.0,
+      motion_prob,
+      cam_c2w,
   )
 
 
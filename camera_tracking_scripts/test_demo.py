@@ -23,9 +23,12 @@
 # pylint: disable=undefined-variable
 # pylint: disable=undefined-loop-variable
 
+import contextlib
+from itertools import islice  # pylint: disable=g-importing-member
 import sys
 
 sys.path.append("base/droid_slam")
+sys.path.append(".")
 
 from tqdm import tqdm
 import numpy as np
@@ -38,6 +41,12 @@ from lietorch import SE3
 
 import torch.nn.functional as F
 from droid import Droid
+from pipeline.frames import FrameSource
+from pipeline.preprocess import crop_to_multiple
+from pipeline.preprocess import resize_crop
+from pipeline.preprocess import target_size
+from pipeline.reconstruction import DEPTH_ENCODING
+from pipeline.reconstruction import save_tracking
 
 
 def image_stream(
@@ -48,8 +57,14 @@ def image_stream(
     aligns=None,
     K=None,
     stride=1,
+    original_size=None,
 ):
-  """image generator."""
+  """image generator.
+
+  Images are resized with pipeline.preprocess.resize_crop, unless
+  original_size (h0, w0) is given: they are then already resized frames of
+  that size, e.g. FramePyramid.tracking.
+  """
   del scene_name, stride
 
   fx, fy, cx, cy = (
@@ -60,7 +75,10 @@ def image_stream(
   )  # np.loadtxt(os.path.join(datapath, 'calibration.txt')).tolist()
 
   for t, (image_file) in enumerate(image_list):
-    image = cv2.imread(image_file)
+    # paths, or already decoded BGR images
+    image = (
+        cv2.imread(image_file) if isinstance(image_file, str) else image_file
+    )
     # depth = cv2.imread(depth_file, cv2.IMREAD_ANYDEPTH) / 5000.
     # depth = np.float32(np.load(depth_file)) / 300.0
     # depth =  1. / pt_data["depth"]
@@ -75,12 +93,14 @@ def image_stream(
     depth[depth < 1e-2] = 0.0
 
     # breakpoint()
-    h0, w0, _ = image.shape
-    h1 = int(h0 * np.sqrt((384 * 512) / (h0 * w0)))
-    w1 = int(w0 * np.sqrt((384 * 512) / (h0 * w0)))
-
-    image = cv2.resize(image, (w1, h1), interpolation=cv2.INTER_AREA)
-    image = image[: h1 - h1 % 8, : w1 - w1 % 8]
+    if original_size is None:
+      h0, w0, _ = image.shape
+      h1, w1 = target_size(h0, w0)
+      image = resize_crop(image)
+    else:
+      h0, w0 = original_size
+      h1, w1 = target_size(h0, w0)
+      image = np.array(image)
 
     # if t == 4 or t == 29:
     # imageio.imwrite("debug/camel_%d.png"%t, image[..., ::-1])
@@ -93,7 +113,7 @@ def image_stream(
     depth = F.interpolate(
         depth[None, None], (h1, w1), mode="nearest-exact"
     ).squeeze()
-    depth = depth[: h1 - h1 % 8, : w1 - w1 % 8]
+    depth = crop_to_multiple(depth)
 
     mask = torch.ones_like(depth)
 
@@ -107,129 +127,88 @@ def image_stream(
       yield t, image[None], intrinsics, mask
 
 
-def save_full_reconstruction(
-    droid, full_traj, rgb_list, senor_depth_list, motion_prob, scene_name
-):
-  """Save full reconstruction."""
-  from pathlib import Path
+def reconstruction_arrays(droid, full_traj, rgb_list, senor_depth_list):
+  """Per frame images, disparities, poses and intrinsics of a tracked scene."""
   t = full_traj.shape[0]
   images = np.array(rgb_list[:t])  # droid.video.images[:t].cpu().numpy()
   disps = 1.0 / (np.array(senor_depth_list[:t]) + 1e-6)
 
   poses = full_traj  # .cpu().numpy()
   intrinsics = droid.video.intrinsics[:t].cpu().numpy()
+  return {
+      "images": images,
+      "disps": disps,
+      "poses": poses,
+      "intrinsics": intrinsics * 8.0,
+  }
 
-  Path("reconstructions/{}".format(scene_name)).mkdir(
-      parents=True, exist_ok=True
-  )
-  np.save("reconstructions/{}/images.npy".format(scene_name), images)
-  np.save("reconstructions/{}/disps.npy".format(scene_name), disps)
-  np.save("reconstructions/{}/poses.npy".format(scene_name), poses)
-  np.save(
-      "reconstructions/{}/intrinsics.npy".format(scene_name), intrinsics * 8.0
-  )
-  np.save("reconstructions/{}/motion_prob.npy".format(scene_name), motion_prob)
-
-  intrinsics = intrinsics[0] * 8.0
-  poses_th = torch.as_tensor(poses, device="cpu")
-  cam_c2w = SE3(poses_th).inv().matrix().numpy()
-
-  K = np.eye(3)
-  K[0, 0] = intrinsics[0]
-  K[1, 1] = intrinsics[1]
-  K[0, 2] = intrinsics[2]
-  K[1, 2] = intrinsics[3]
-  print("K ", K)
-  print("img_data ", images.shape)
-  print("disp_data ", disps.shape)
-
-  max_frames = min(1000, images.shape[0])
-  print("outputs/%s_droid.npz" % scene_name)
-  Path("outputs").mkdir(parents=True, exist_ok=True)
-
-  np.savez(
-      "outputs/%s_droid.npz" % scene_name,
-      images=np.uint8(images[:max_frames, ::-1, ...].transpose(0, 2, 3, 1)),
-      depths=np.float32(1.0 / disps[:max_frames, ...]),
-      intrinsic=K,
-      cam_c2w=cam_c2w[:max_frames],
-  )
 
+def save_full_reconstruction(
+    droid,
+    full_traj,
+    rgb_list,
+    senor_depth_list,
+    motion_prob,
+    scene_name,
+    depth_encoding=DEPTH_ENCODING,
+):
+  """Save full reconstruction, frames are streamed to the container."""
+  t = full_traj.shape[0]
+  recon = {
+      "images": (np.asarray(image) for image in islice(rgb_list, t)),
+      "disps": (
+          1.0 / (np.asarray(depth) + 1e-6)
+          for depth in islice(senor_depth_list, t)
+      ),
+      "poses": full_traj,
+      "intrinsics": droid.video.intrinsics[:t].cpu().numpy() * 8.0,
+      "motion_prob": motion_prob,
+  }
+  write_reconstruction(recon, scene_name, depth_encoding)
 
-if __name__ == "__main__":
-  parser = argparse.ArgumentParser()
-  parser.add_argument("--datapath")
-  parser.add_argument("--weights", default="droid.pth")
-  parser.add_argument("--buffer", type=int, default=1024)
-  parser.add_argument("--image_size", default=[240, 320])
-  parser.add_argument("--disable_vis", action="store_true")
 
-  parser.add_argument("--beta", type=float, default=0.3)
-  parser.add_argument(
-      "--filter_thresh", type=float, default=2.0
-  )  # motion threhold for keyframe
-  parser.add_argument("--warmup", type=int, default=8)
-  parser.add_argument("--keyframe_thresh", type=float, default=2.0)
-  parser.add_argument("--frontend_thresh", type=float, default=12.0)
-  parser.add_argument("--frontend_window", type=int, default=25)
-  parser.add_argument("--frontend_radius", type=int, default=2)
-  parser.add_argument("--frontend_nms", type=int, default=1)
+def write_reconstruction(recon, scene_name, depth_encoding=DEPTH_ENCODING):
+  """Saves reconstruction_arrays and motion_prob of a scene.
 
-  parser.add_argument("--stereo", action="store_true")
-  parser.add_argument("--depth", action="store_true")
-  parser.add_argument("--upsample", action="store_true")
-  parser.add_argument("--scene_name", help="scene_name")
-
-  parser.add_argument("--backend_thresh", type=float, default=16.0)
-  parser.add_argument("--backend_radius", type=int, default=2)
-  parser.add_argument("--backend_nms", type=int, default=3)
+  images and disps can also be iterables of frames, which are written
+  chunk by chunk.
+  """
+  poses_th = torch.as_tensor(recon["poses"], device="cpu")
+  cam_c2w = SE3(poses_th).inv().matrix().numpy()
 
-  parser.add_argument(
-      "--mono_depth_path", default="Depth-Anything/video_visualization"
+  print("frames ", len(cam_c2w))
+  print("reconstructions/%s" % scene_name)
+  save_tracking(
+      "reconstructions/%s" % scene_name,
+      recon["images"],
+      recon["disps"],
+      recon["poses"],
+      recon["intrinsics"],
+      recon["motion_prob"],
+      cam_c2w,
+      depth_encoding=depth_encoding,
   )
-  parser.add_argument("--metric_depth_path", default="UniDepth/outputs ")
-  args = parser.parse_args()
 
-  print("Running evaluation on {}".format(args.datapath))
-  print(args)
 
-  scene_name = args.scene_name.split("/")[-1]
+def align_mono_depth(da_disps, metric_depths, fovs, image_shape):
+  """Aligns the mono disparities to the metric depths.
 
-  tstamps = []
-  rgb_list = []
-  senor_depth_list = []
+  Args:
+    da_disps: list of Depth-Anything disparity maps.
+    metric_depths: list of UniDepth metric depth maps.
+    fovs: list of UniDepth horizontal fov (degrees).
+    image_shape: (H, W) of the input images.
 
-  image_list = sorted(glob.glob(os.path.join("%s" % (args.datapath), "*.jpg")))
-  image_list += sorted(glob.glob(os.path.join("%s" % (args.datapath), "*.png")))
-
-  # NOTE Mono is inverse depth, but metric-depth is depth!
-  mono_disp_paths = sorted(
-      glob.glob(
-          os.path.join("%s/%s" % (args.mono_depth_path, scene_name), "*.npy")
-      )
-  )
-  metric_depth_paths = sorted(
-      glob.glob(
-          os.path.join("%s/%s" % (args.metric_depth_path, scene_name), "*.npz")
-      )
-  )
-
-  img_0 = cv2.imread(image_list[0])
+  Returns:
+    mono_disp_list (resized to the metric depth resolution), aligns (scale,
+    shift, normalize_scale) for image_stream and the intrinsics K.
+  """
   scales = []
   shifts = []
   mono_disp_list = []
-  fovs = []
-  for t, (mono_disp_file, metric_depth_file) in enumerate(
-      zip(mono_disp_paths, metric_depth_paths)
-  ):
-    da_disp = np.float32(np.load(mono_disp_file))  # / 300.0
-    uni_data = np.load(metric_depth_file)
-    metric_depth = uni_data["depth"]
-
-    fovs.append(uni_data["fov"])
-
+  for da_disp, metric_depth in zip(da_disps, metric_depths):
     da_disp = cv2.resize(
-        da_disp,
+        np.float32(da_disp),
         (metric_depth.shape[1], metric_depth.shape[0]),
         interpolation=cv2.INTER_NEAREST_EXACT,
     )
@@ -268,7 +247,7 @@ if __name__ == "__main__":
     shifts.append(shift)
 
   print("************** UNIDEPTH FOV ", np.median(fovs))
-  ff = img_0.shape[1] / (2 * np.tan(np.radians(np.median(fovs) / 2.0)))
+  ff = image_shape[1] / (2 * np.tan(np.radians(np.median(fovs) / 2.0)))
   K = np.eye(3)
   K[0, 0] = (
       ff * 1.0
@@ -277,10 +256,10 @@ if __name__ == "__main__":
       ff * 1.0
   )  # pp_intrinsic[0]  * (img_0.shape[0] / (pp_intrinsic[2] * 2))
   K[0, 2] = (
-      img_0.shape[1] / 2.0
+      image_shape[1] / 2.0
   )  # pp_intrinsic[1]) * (img_0.shape[1] / (pp_intrinsic[1] * 2))
   K[1, 2] = (
-      img_0.shape[0] / 2.0
+      image_shape[0] / 2.0
   )  # (pp_intrinsic[2]) * (img_0.shape[0] / (pp_intrinsic[2] * 2))
 
   ss_product = np.array(scales) * np.array(shifts)
@@ -294,6 +273,37 @@ if __name__ == "__main__":
   )
 
   aligns = (align_scale, align_shift, normalize_scale)
+  return mono_disp_list, aligns, K
+
+
+def track(
+    args,
+    image_list,
+    mono_disp_list,
+    aligns,
+    K,
+    scene_name,
+    profile=contextlib.nullcontext,
+    original_size=None,
+):
+  """Runs camera tracking and the final global BA.
+
+  Args:
+    args: tracking arguments, see get_parser().
+    image_list: image paths or BGR images (H, W, 3).
+    mono_disp_list: mono disparities from align_mono_depth.
+    aligns: alignment from align_mono_depth.
+    K: intrinsics from align_mono_depth.
+    scene_name: scene name.
+    profile: phase context manager factory, see pipeline.profiling.
+    original_size: (h0, w0) if image_list holds already resized frames, see
+      image_stream.
+
+  Returns:
+    droid, estimated trajectory, rgb_list, senor_depth_list and motion_prob.
+  """
+  rgb_list = []
+  senor_depth_list = []
 
   for t, image, depth, intrinsics, mask in tqdm(
       image_stream(
@@ -303,6 +313,7 @@ if __name__ == "__main__":
           use_depth=True,
           aligns=aligns,
           K=K,
+          original_size=original_size,
       )
   ):
     if not args.disable_vis:
@@ -315,23 +326,115 @@ if __name__ == "__main__":
       args.image_size = [image.shape[2], image.shape[3]]
       droid = Droid(args)
 
-    droid.track(t, image, depth, intrinsics=intrinsics, mask=mask)
+    with profile("tracking/droid.track", frames=1):
+      droid.track(t, image, depth, intrinsics=intrinsics, mask=mask)
 
   # last frame
-  droid.track_final(t, image, depth, intrinsics=intrinsics, mask=mask)
+  with profile("tracking/droid.track_final"):
+    droid.track_final(t, image, depth, intrinsics=intrinsics, mask=mask)
+
+  with profile("tracking/droid.terminate", frames=t + 1):
+    traj_est, _, motion_prob = droid.terminate(
+        image_stream(
+            image_list,
+            mono_disp_list,
+            scene_name,
+            use_depth=True,
+            aligns=aligns,
+            K=K,
+            original_size=original_size,
+        ),
+        _opt_intr=True,
+        full_ba=True,
+        scene_name=scene_name,
+    )
+  return droid, traj_est, rgb_list, senor_depth_list, motion_prob
 
-  traj_est, depth_est, motion_prob = droid.terminate(
-      image_stream(
-          image_list,
-          mono_disp_list,
-          scene_name,
-          use_depth=True,
-          aligns=aligns,
-          K=K,
-      ),
-      _opt_intr=True,
-      full_ba=True,
-      scene_name=scene_name,
+
+def get_parser():
+  """Tracking arguments."""
+  parser = argparse.ArgumentParser(allow_abbrev=False)
+  parser.add_argument("--datapath")
+  parser.add_argument("--weights", default="droid.pth")
+  parser.add_argument("--buffer", type=int, default=1024)
+  parser.add_argument("--image_size", default=[240, 320])
+  parser.add_argument("--disable_vis", action="store_true")
+
+  parser.add_argument("--beta", type=float, default=0.3)
+  parser.add_argument(
+      "--filter_thresh", type=float, default=2.0
+  )  # motion threhold for keyframe
+  parser.add_argument("--warmup", type=int, default=8)
+  parser.add_argument("--keyframe_thresh", type=float, default=2.0)
+  parser.add_argument("--frontend_thresh", type=float, default=12.0)
+  parser.add_argument("--frontend_window", type=int, default=25)
+  parser.add_argument("--frontend_radius", type=int, default=2)
+  parser.add_argument("--frontend_nms", type=int, default=1)
+
+  parser.add_argument("--stereo", action="store_true")
+  parser.add_argument("--depth", action="store_true")
+  parser.add_argument("--upsample", action="store_true")
+  parser.add_argument("--scene_name", help="scene_name")
+
+  parser.add_argument("--backend_thresh", type=float, default=16.0)
+  parser.add_argument("--backend_radius", type=int, default=2)
+  parser.add_argument("--backend_nms", type=int, default=3)
+
+  parser.add_argument(
+      "--mono_depth_path", default="Depth-Anything/video_visualization"
+  )
+  parser.add_argument("--metric_depth_path", default="UniDepth/outputs ")
+  parser.add_argument(
+      "--depth_encoding",
+      type=str,
+      default=DEPTH_ENCODING,
+      choices=("float32", "float16", "log_uint16"),
+      help="encoding of the saved depths, float16 and log_uint16 are lossy",
+  )
+  return parser
+
+
+if __name__ == "__main__":
+  args = get_parser().parse_args()
+
+  print("Running evaluation on {}".format(args.datapath))
+  print(args)
+
+  scene_name = args.scene_name.split("/")[-1]
+
+  # directory of frames or video file, frames are streamed
+  image_list = FrameSource(args.datapath)
+
+  # NOTE Mono is inverse depth, but metric-depth is depth!
+  mono_disp_paths = sorted(
+      glob.glob(
+          os.path.join("%s/%s" % (args.mono_depth_path, scene_name), "*.npy")
+      )
+  )
+  metric_depth_paths = sorted(
+      glob.glob(
+          os.path.join("%s/%s" % (args.metric_depth_path, scene_name), "*.npz")
+      )
+  )
+
+  img_0 = image_list[0]
+  da_disps = []
+  metric_depths = []
+  fovs = []
+  for mono_disp_file, metric_depth_file in zip(
+      mono_disp_paths, metric_depth_paths
+  ):
+    da_disps.append(np.float32(np.load(mono_disp_file)))  # / 300.0
+    uni_data = np.load(metric_depth_file)
+    metric_depths.append(uni_data["depth"])
+    fovs.append(uni_data["fov"])
+
+  mono_disp_list, aligns, K = align_mono_depth(
+      da_disps, metric_depths, fovs, img_0.shape[:2]
+  )
+
+  droid, traj_est, rgb_list, senor_depth_list, motion_prob = track(
+      args, image_list, mono_disp_list, aligns, K, scene_name
   )
 
   if args.scene_name is not None:
@@ -342,4 +445,5 @@ if __name__ == "__main__":
         senor_depth_list,
         motion_prob,
         args.scene_name,
+        args.depth_encoding,
     )
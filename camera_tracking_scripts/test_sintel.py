@@ -26,6 +26,7 @@
 import sys
 
 sys.path.append("base/droid_slam")
+sys.path.append(".")
 
 from tqdm import tqdm
 import numpy as np
@@ -37,6 +38,10 @@ import argparse
 
 import torch.nn.functional as F
 from droid import Droid
+from pipeline.preprocess import crop_to_multiple
+from pipeline.preprocess import resize_crop
+from pipeline.preprocess import target_size
+from pipeline.reconstruction import save_tracking
 
 
 def image_stream(
@@ -63,16 +68,14 @@ def image_stream(
     depth[depth < 1e-2] = 0.0
 
     h0, w0, _ = image.shape
-    h1 = int(h0 * np.sqrt((384 * 512) / (h0 * w0)))
-    w1 = int(w0 * np.sqrt((384 * 512) / (h0 * w0)))
+    h1, w1 = target_size(h0, w0)
 
-    image = cv2.resize(image, (w1, h1))
-    image = image[: h1 - h1 % 8, : w1 - w1 % 8]
+    image = resize_crop(image)
     image = torch.as_tensor(image).permute(2, 0, 1)
 
     depth = torch.as_tensor(depth)
     depth = F.interpolate(depth[None, None], (h1, w1)).squeeze()
-    depth = depth[: h1 - h1 % 8, : w1 - w1 % 8]
+    depth = crop_to_multiple(depth)
 
     mask = torch.ones_like(depth)
 
@@ -90,7 +93,6 @@ def save_full_reconstruction(
     droid, full_traj, rgb_list, senor_depth_list, motion_prob, scene_name
 ):
   """Save full reconstruction."""
-  from pathlib import Path
   from lietorch import SE3
 
   del scene_name
@@ -104,38 +106,20 @@ def save_full_reconstruction(
   poses = full_traj  # .cpu().numpy()
   intrinsics = droid.video.intrinsics[:t].cpu().numpy()
 
-  Path("reconstructions/{}".format(scene_name)).mkdir(
-      parents=True, exist_ok=True
-  )
-  np.save("reconstructions/{}/images.npy".format(scene_name), images)
-  np.save("reconstructions/{}/disps.npy".format(scene_name), disps)
-  np.save("reconstructions/{}/poses.npy".format(scene_name), poses)
-  np.save(
-      "reconstructions/{}/intrinsics.npy".format(scene_name), intrinsics * 8.0
-  )
-  np.save("reconstructions/{}/motion_prob.npy".format(scene_name), motion_prob)
-
-  intrinsics = intrinsics[0] * 8.0
   poses_th = torch.as_tensor(poses, device="cpu")
   cam_c2w = SE3(poses_th).inv().matrix().numpy()
 
-  K = np.eye(3)
-  K[0, 0] = intrinsics[0]
-  K[1, 1] = intrinsics[1]
-  K[0, 2] = intrinsics[2]
-  K[1, 2] = intrinsics[3]
-  print("K ", K)
   print("img_data ", images.shape)
   print("disp_data ", disps.shape)
-  print("outputs/%s_droid.npz" % scene_name)
-
-  Path("outputs").mkdir(parents=True, exist_ok=True)
-  np.savez(
-      "outputs/%s_droid.npz" % scene_name,
-      images=np.uint8(images[:, ::-1, ...].transpose(0, 2, 3, 1)),
-      depths=np.float32(1.0 / disps[:, ...]),
-      intrinsic=K,
-      cam_c2w=cam_c2w,
+  print("reconstructions/%s" % scene_name)
+  save_tracking(
+      "reconstructions/%s" % scene_name,
+      images,
+      disps,
+      poses,
+      intrinsics * 8.0,
+      motion_prob,
+      cam_c2w,
   )
 
 
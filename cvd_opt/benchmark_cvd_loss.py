@@ -0,0 +1,149 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Equivalence check and benchmark of the eager and compiled CVD loss.
+
+Runs on synthetic inputs with the shapes of the depth optimization phase,
+checks that loss and gradients of `compile_consistency_loss` match
+`consistency_loss`, then reports ms per step (forward + backward) and peak
+memory of both.
+
+Usage: python cvd_opt/benchmark_cvd_loss.py --num_frames 50 --size 192 256
+"""
+
+# pylint: disable=invalid-name
+
+import argparse
+import time
+
+from cvd_opt import compile_consistency_loss
+from cvd_opt import consistency_loss
+from cvd_opt import consistency_targets
+from geometry_utils import NormalGenerator
+import torch
+
+
+def synthetic_inputs(num_frames, height, width, steps=(1, 2, 4, 8, 15)):
+  """Random scene with the layout of the CVD optimization inputs."""
+  g = torch.Generator().manual_seed(0)
+  N, H, W = num_frames, height, width
+
+  cam_c2w = torch.eye(4).repeat(N, 1, 1)
+  cam_c2w[:, :3, 3] = 0.01 * torch.randn(N, 3, generator=g).cumsum(0)
+
+  K = torch.tensor([
+      [0.8 * W, 0.0, 0.5 * W],
+      [0.0, 0.8 * W, 0.5 * H],
+      [0.0, 0.0, 1.0],
+  ])
+
+  base = 0.5 + torch.rand(N, 1, H // 8, W // 8, generator=g)
+  disp = torch.nn.functional.interpolate(base, size=(H, W), mode="bilinear")
+  disp = disp.squeeze(1)
+
+  ii = torch.cat([torch.arange(N - s) for s in steps if s < N])
+  jj = torch.cat([torch.arange(s, N) for s in steps if s < N])
+  P = ii.shape[0]
+  flows = torch.randn(P, 2, H, W, generator=g)
+  flow_masks = (torch.rand(P, 1, H, W, generator=g) > 0.2).float()
+  uncertainty = 0.1 + 0.4 * torch.rand(N, 1, H, W, generator=g)
+
+  fg_alpha = 0.2 + (torch.rand(N, H, W, generator=g) > 0.5).float()
+  return {
+      "cam_c2w": cam_c2w,
+      "K": K,
+      "K_inv": torch.linalg.inv(K),
+      "disp_data": disp * (1.0 + 0.05 * torch.randn(N, H, W, generator=g)),
+      "init_disp": disp,
+      "uncertainty": uncertainty,
+      "flows": flows,
+      "flow_masks": flow_masks,
+      "ii": ii,
+      "jj": jj,
+      "fg_alpha": fg_alpha,
+  }
+
+
+def loss_and_grads(loss_fn, inputs, compute_normals, targets):
+  disp_data = inputs["disp_data"].clone().requires_grad_(True)
+  uncertainty = inputs["uncertainty"].clone().requires_grad_(True)
+  loss = loss_fn(
+      inputs["cam_c2w"],
+      inputs["K"],
+      inputs["K_inv"],
+      torch.clamp(disp_data, 1e-3, 1e3),
+      inputs["init_disp"],
+      torch.clamp(uncertainty, 1e-4, 1e3),
+      inputs["flows"],
+      inputs["flow_masks"],
+      inputs["ii"],
+      inputs["jj"],
+      compute_normals,
+      inputs["fg_alpha"],
+      targets=targets,
+  )
+  loss.backward()
+  return loss.detach(), disp_data.grad, uncertainty.grad
+
+
+def benchmark(loss_fn, inputs, compute_normals, targets, iters):
+  for _ in range(3):
+    loss_and_grads(loss_fn, inputs, compute_normals, targets)
+  torch.cuda.synchronize()
+  torch.cuda.reset_peak_memory_stats()
+  start = time.perf_counter()
+  for _ in range(iters):
+    loss_and_grads(loss_fn, inputs, compute_normals, targets)
+  torch.cuda.synchronize()
+  ms = 1000.0 * (time.perf_counter() - start) / iters
+  return ms, torch.cuda.max_memory_allocated() / 2**20
+
+
+def main(args):
+  inputs = synthetic_inputs(args.num_frames, *args.size)
+  inputs = {k: v.cuda() for k, v in inputs.items()}
+  compute_normals = [NormalGenerator(*args.size).cuda()]
+  targets = consistency_targets(
+      inputs["init_disp"], inputs["K_inv"], compute_normals
+  )
+
+  eager = loss_and_grads(consistency_loss, inputs, compute_normals, targets)
+  compiled_loss = compile_consistency_loss()
+  compiled = loss_and_grads(compiled_loss, inputs, compute_normals, targets)
+  names = ["loss", "grad disp", "grad uncertainty"]
+  for name, a, b in zip(names, eager, compiled):
+    a, b = torch.nan_to_num(a), torch.nan_to_num(b)
+    err = ((a - b).abs().max() / a.abs().max().clamp(min=1e-12)).item()
+    print("%s max rel error %.2e" % (name, err))
+    assert err < args.tol, "%s mismatch: %.2e" % (name, err)
+
+  print("| loss | ms/step | peak MB |\n|---|---|---|")
+  loss_fns = [("eager", consistency_loss), ("compiled", compiled_loss)]
+  for name, loss_fn in loss_fns:
+    ms, peak = benchmark(
+        loss_fn, inputs, compute_normals, targets, args.iters
+    )
+    print("| %s | %.2f | %.1f |" % (name, ms, peak))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--num_frames", type=int, default=50)
+  parser.add_argument(
+      "--size", type=int, nargs=2, default=(192, 256), help="H W"
+  )
+  parser.add_argument("--iters", type=int, default=20)
+  parser.add_argument("--tol", type=float, default=1e-4)
+  main(parser.parse_args())
@@ -22,9 +22,11 @@ from utils.utils import bilinear_sampler
 # pylint: disable=g-import-not-at-top
 try:
   import alt_cuda_corr
+
+  ALT_CUDA_CORR = True
 except:  # pylint: disable=bare-except
-  # alt_cuda_corr is not compiled
-  pass
+  # alt_cuda_corr is not compiled, use the pure PyTorch local correlation
+  ALT_CUDA_CORR = False
 
 
 class CorrBlock:
@@ -82,11 +84,20 @@ class CorrBlock:
 
 
 class AlternateCorrBlock:
-  """Correlation block for MegaSaM."""
+  """Correlation block for MegaSaM.
 
-  def __init__(self, fmap1, fmap2, num_levels=4, radius=4):
+  Computes the correlation only within the lookup window of each query pixel
+  instead of materializing the all-pairs volume, O(HW r^2) instead of
+  O((HW)^2) memory. Uses the alt_cuda_corr extension when it is compiled,
+  otherwise a pure PyTorch implementation chunked over query pixels that runs
+  on both CPU and GPU. Same output as CorrBlock.
+  """
+
+  def __init__(self, fmap1, fmap2, num_levels=4, radius=4, chunk_elems=2**26):
     self.num_levels = num_levels
     self.radius = radius
+    # max number of sampled feature values held in memory per chunk
+    self.chunk_elems = chunk_elems
 
     self.pyramid = [(fmap1, fmap2)]
     for _ in range(self.num_levels):
@@ -95,6 +106,9 @@ class AlternateCorrBlock:
       self.pyramid.append((fmap1, fmap2))
 
   def __call__(self, coords):
+    if not ALT_CUDA_CORR or not coords.is_cuda:
+      return self.local_corr(coords)
+
     coords = coords.permute(0, 2, 3, 1)
     # pylint: disable=invalid-name
     B, H, W, _ = coords.shape
@@ -113,3 +127,48 @@ class AlternateCorrBlock:
     corr = torch.stack(corr_list, dim=1)
     corr = corr.reshape(B, -1, H, W)
     return corr / torch.sqrt(torch.tensor(dim).float())
+
+  def local_corr(self, coords):
+    """Pure PyTorch lookup, channels ordered as in CorrBlock."""
+    # pylint: disable=invalid-name
+    r = self.radius
+    B, _, H, W = coords.shape
+    fmap1 = self.pyramid[0][0]
+    dim = fmap1.shape[1]
+    fmap1 = fmap1.reshape(B, dim, H * W)
+
+    # window offsets, x offset varies along the first axis as in CorrBlock
+    d = torch.linspace(-r, r, 2 * r + 1, device=coords.device)
+    delta = torch.stack(torch.meshgrid(d, d, indexing='ij'), dim=-1).view(-1, 2)
+    K = delta.shape[0]
+
+    coords = coords.permute(0, 2, 3, 1).reshape(B, H * W, 1, 2)
+    chunk = max(1, self.chunk_elems // (B * dim * K))
+
+    out_pyramid = []
+    for i in range(self.num_levels):
+      fmap2_i = self.pyramid[i][1]
+      H2, W2 = fmap2_i.shape[-2:]
+      coords_lvl = coords / 2**i + delta  # B, HW, K, 2
+      corr_lvl = []
+      for start in range(0, H * W, chunk):
+        grid = coords_lvl[:, start : start + chunk]
+        n = grid.shape[1]
+        # bilinear_sampler normalization, align_corners=True
+        grid = torch.stack(
+            [
+                2 * grid[..., 0] / (W2 - 1) - 1,
+                2 * grid[..., 1] / (H2 - 1) - 1,
+            ],
+            dim=-1,
+        ).view(B, 1, n * K, 2)
+        feats = F.grid_sample(fmap2_i, grid, align_corners=True)
+        feats = feats.view(B, dim, n, K)
+        corr_lvl.append(
+            torch.einsum('bcn,bcnk->bnk', fmap1[..., start : start + n], feats)
+        )
+      out_pyramid.append(torch.cat(corr_lvl, dim=1))
+
+    out = torch.cat(out_pyramid, dim=-1).view(B, H, W, -1)
+    out = out.permute(0, 3, 1, 2).contiguous().float()
+    return out / torch.sqrt(torch.tensor(dim).float())
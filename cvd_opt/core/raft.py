@@ -124,8 +124,14 @@ class RAFT(nn.Module):
       flow_init=None,
       upsample=True,
       test_mode=False,
+      early_stop_thresh=None,
   ):
-    """Estimate optical flow between pair of frames."""
+    """Estimate optical flow between pair of frames.
+
+    In test mode only the final flow is upsampled, and if `early_stop_thresh`
+    is set the GRU iterations stop as soon as the mean magnitude of the
+    1/8 resolution flow update is below it for every pair in the batch.
+    """
 
     image1 = 2 * (image1 / 255.0) - 1.0
     image2 = 2 * (image2 / 255.0) - 1.0
@@ -159,9 +165,12 @@ class RAFT(nn.Module):
     if flow_init is not None:
       coords1 = coords1 + flow_init
 
+    if test_mode and iters < 1:
+      raise ValueError('iters must be positive in test mode')
+
     flow_predictions = []
-    flow_up = None
-    for _ in range(iters):
+    up_mask = None
+    for itr in range(iters):
       coords1 = coords1.detach()
       corr = corr_fn(coords1)  # index correlation volume
 
@@ -172,6 +181,14 @@ class RAFT(nn.Module):
       # F(t+1) = F(t) + \Delta(t)
       coords1 = coords1 + delta_flow
 
+      if test_mode:
+        # only the final prediction is used, upsample it after the loop
+        if early_stop_thresh is not None and itr < iters - 1:
+          delta_mag = delta_flow.float().norm(dim=1).mean(dim=(1, 2)).max()
+          if delta_mag.item() < early_stop_thresh:
+            break
+        continue
+
       # upsample predictions
       if up_mask is None:
         flow_up = upflow8(coords1 - coords0)
@@ -181,8 +198,11 @@ class RAFT(nn.Module):
       flow_predictions.append(flow_up)
 
     if test_mode:
-      if flow_up is None:
-        raise ValueError('flow_up is None')
-      return coords1 - coords0, flow_up, net
+      flow_low = coords1 - coords0
+      if up_mask is None:
+        flow_up = upflow8(flow_low)
+      else:
+        flow_up = self.upsample_flow(flow_low, up_mask)
+      return flow_low, flow_up, net
 
     return flow_predictions
@@ -20,15 +20,25 @@
 # pylint: disable=redefined-outer-name
 
 import argparse
+import contextlib
 import os
 from pathlib import Path
+import sys
+import time
 
 from geometry_utils import NormalGenerator
+from geometry_utils import reproject_depth
 import kornia
 from lietorch import SE3
 import numpy as np
 import torch
 
+sys.path.append(".")
+# pylint: disable=g-import-not-at-top
+from pipeline.reconstruction import DEPTH_ENCODING
+from pipeline.reconstruction import open_reconstruction
+from pipeline.reconstruction import save_outputs
+
 
 def gradient_loss(gt, pred, u):
   """Gradient loss."""
@@ -83,6 +93,206 @@ def sobel_fg_alpha(disp, mode="sobel", beta=10.0):
 
 ALPHA_MOTION = 0.25
 RESIZE_FACTOR = 0.5
+# (resolution, steps) of the depth optimization phase, coarse to fine. The
+# resolution is relative to the input disparities, flows are at RESIZE_FACTOR.
+DEFAULT_SCHEDULE = ((RESIZE_FACTOR, 400),)
+
+
+class ConvergenceMonitor:
+  """Early stopping of an optimization phase without per step host syncs.
+
+  Losses are accumulated on device and only read back every `check_every`
+  steps, which is also when the phase is logged and the stopping criteria are
+  checked: relative plateau of the windowed mean loss, gradient norm and
+  wall clock deadline. Criteria set to None are disabled.
+  """
+
+  def __init__(
+      self,
+      name,
+      check_every=10,
+      rel_tol=None,
+      patience=2,
+      grad_tol=None,
+      deadline=None,
+  ):
+    self.name = name
+    self.check_every = check_every
+    self.rel_tol = rel_tol
+    self.patience = patience
+    self.grad_tol = grad_tol
+    self.deadline = deadline
+
+    self.num_steps = 0
+    self.loss_sum = None
+    self.window = 0
+    self.prev_loss = None
+    self.num_plateau = 0
+    self.stop_reason = None
+
+  def step(self, loss, params):
+    """Records a step, returns True if the phase should stop."""
+    self.num_steps += 1
+    self.window += 1
+    loss = loss.detach()
+    self.loss_sum = loss if self.loss_sum is None else self.loss_sum + loss
+    if self.num_steps % self.check_every:
+      return False
+
+    stats = [self.loss_sum / self.window]
+    if self.grad_tol is not None:
+      grads = [p.grad for p in params if p.grad is not None]
+      stats.append(torch.sqrt(sum(torch.sum(g**2) for g in grads)))
+    stats = torch.stack(stats).tolist()  # single sync
+    mean_loss = stats[0]
+    self.loss_sum = None
+    self.window = 0
+
+    msg = "%s step %d loss %.6f" % (self.name, self.num_steps, mean_loss)
+    if self.grad_tol is not None:
+      msg += " grad %.3e" % stats[1]
+    print(msg)
+
+    if self.rel_tol is not None and self.prev_loss is not None:
+      rel_change = (self.prev_loss - mean_loss) / max(
+          abs(self.prev_loss), 1e-12
+      )
+      if rel_change < self.rel_tol:
+        self.num_plateau += 1
+      else:
+        self.num_plateau = 0
+      if self.num_plateau >= self.patience:
+        self.stop_reason = "plateau"
+    self.prev_loss = mean_loss
+
+    if self.grad_tol is not None and stats[1] < self.grad_tol:
+      self.stop_reason = "grad_norm"
+    if self.deadline is not None and time.perf_counter() > self.deadline:
+      self.stop_reason = "time_budget"
+
+    if self.stop_reason is not None:
+      print(
+          "%s stopped at step %d (%s)"
+          % (self.name, self.num_steps, self.stop_reason)
+      )
+    return self.stop_reason is not None
+
+
+def compile_consistency_loss():
+  """consistency_loss fused with torch.compile (forward and backward).
+
+  Shapes are static per pyramid level, so each level compiles once.
+  """
+  return torch.compile(consistency_loss, dynamic=False)
+
+
+def parse_schedule(schedule):
+  """Parses "0.125:200,0.25:150,0.5:50" into ((0.125, 200), ...)."""
+  levels = []
+  for level in schedule.split(","):
+    scale, steps = level.split(":")
+    levels.append((float(scale), int(steps)))
+  return tuple(levels)
+
+
+def resize_disp(disp, size):
+  if tuple(disp.shape[-2:]) == tuple(size):
+    return disp
+  return torch.nn.functional.interpolate(
+      disp.unsqueeze(1), size=size, mode="bilinear"
+  ).squeeze(1)
+
+
+def resize_flows(flows, size):
+  """Resizes flows (N, 2, h, w) to size and rescales their magnitude."""
+  h, w = flows.shape[-2:]
+  if (h, w) == tuple(size):
+    return flows
+  flows = torch.nn.functional.interpolate(flows, size=size, mode="bilinear")
+  scale = torch.tensor([size[1] / w, size[0] / h], device=flows.device)
+  return flows * scale.view(1, 2, 1, 1)
+
+
+def build_level(
+    scale, init_disp, flows, flow_masks, cvd_prob, K, flow_scale=RESIZE_FACTOR
+):
+  """Resamples the optimization inputs to a pyramid level.
+
+  Args:
+    scale: level resolution relative to init_disp.
+    init_disp: (N, H, W) disparities at full resolution.
+    flows: (P, 2, h, w) flows at flow_scale resolution.
+    flow_masks: (P, 1, h, w) flow masks at flow_scale resolution.
+    cvd_prob: (N, 1, h, w) initial uncertainty at flow_scale resolution.
+    K: (3, 3) intrinsics at full resolution.
+    flow_scale: resolution of flows relative to init_disp.
+
+  Returns:
+    dict of level inputs.
+  """
+  H, W = init_disp.shape[-2:]
+  size = (round(H * scale), round(W * scale))
+  if scale == flow_scale:
+    init_disp_l = torch.nn.functional.interpolate(
+        init_disp.unsqueeze(1), scale_factor=(scale, scale), mode="bilinear"
+    ).squeeze(1)
+    assert init_disp_l.shape[-2:] == flows.shape[-2:]
+    size = tuple(init_disp_l.shape[-2:])
+  else:
+    init_disp_l = resize_disp(init_disp, size)
+
+  fg_alpha = sobel_fg_alpha(init_disp_l[:, None, ...]) > 0.2
+  fg_alpha = fg_alpha.squeeze(1).float() + 0.2
+
+  K_l = K.clone()
+  K_l[0:2, ...] *= scale
+  return {
+      "size": size,
+      "init_disp": init_disp_l,
+      "flows": resize_flows(flows, size),
+      "flow_masks": torch.nn.functional.interpolate(
+          flow_masks, size=size, mode="nearest-exact"
+      ),
+      "cvd_prob": resize_disp(cvd_prob.squeeze(1), size).unsqueeze(1),
+      "fg_alpha": fg_alpha,
+      "K": K_l,
+      "K_inv": torch.linalg.inv(K_l),
+  }
+
+
+def consistency_targets(init_disp, K_inv, compute_normals):
+  """Terms of consistency_loss that only depend on init_disp.
+
+  init_disp is fixed during an optimization phase, so these are computed once
+  per scene (and pyramid level) instead of at every step.
+  """
+  _, H, W = init_disp.shape
+  yy, xx = torch.meshgrid(
+      torch.arange(H, device=init_disp.device),
+      torch.arange(W, device=init_disp.device),
+      indexing="ij",
+  )
+  grid = torch.stack([xx, yy], dim=-1).float()[None]
+
+  with torch.no_grad():
+    init_normal = compute_normals[0](
+        1.0 / torch.clamp(init_disp[:, None, ...], 1e-3, 1e3), K_inv[None]
+    )
+    log_init_disp_ds = []
+    for scale in range(4):
+      interval = 2**scale
+      init_disp_ds = torch.nn.functional.interpolate(
+          init_disp[:, None, ...],
+          scale_factor=(1.0 / interval, 1.0 / interval),
+          mode="nearest-exact",
+      )
+      log_init_disp_ds.append(torch.log(init_disp_ds))
+
+  return {
+      "grid": grid,
+      "init_normal": init_normal,
+      "log_init_disp_ds": log_init_disp_ds,
+  }
 
 
 def consistency_loss(
@@ -103,17 +313,17 @@ def consistency_loss(
     w_si=1.0,
     w_grad=2.0,
     w_normal=4.0,
+    targets=None,
 ):
-  """Consistency loss."""
+  """Consistency loss.
+
+  targets: output of consistency_targets(init_disp, ...), computed on the fly
+    if None.
+  """
   _, H, W = disp_data.shape
-  # mesh grid
-  xx = torch.arange(0, W).view(1, -1).repeat(H, 1)
-  yy = torch.arange(0, H).view(-1, 1).repeat(1, W)
-  xx = xx.view(1, 1, H, W)  # .repeat(B ,1 ,1 ,1)
-  yy = yy.view(1, 1, H, W)  # .repeat(B ,1 ,1 ,1)
-  grid = (
-      torch.cat((xx, yy), 1).float().cuda().permute(0, 2, 3, 1)
-  )  # [None, ...]
+  if targets is None:
+    targets = consistency_targets(init_disp, K_inv, compute_normals)
+  grid = targets["grid"]
 
   loss_flow = 0.0  # flow reprojection loss
   loss_d_ratio = 0.0  # depth consistency loss
@@ -128,7 +338,8 @@ def consistency_loss(
 
   # warp disp from target time
   pixel_locations = grid + flows_step
-  resize_factor = torch.tensor([W - 1.0, H - 1.0]).cuda()[None, None, None, ...]
+  resize_factor = torch.tensor([W - 1.0, H - 1.0], device=grid.device)
+  resize_factor = resize_factor[None, None, None, ...]
   normalized_pixel_locations = 2 * (pixel_locations / resize_factor) - 1.0
 
   disp_sampled = torch.nn.functional.grid_sample(
@@ -139,29 +350,19 @@ def consistency_loss(
 
   uu = torch.index_select(uncertainty, dim=0, index=ii).squeeze(1)
 
-  grid_h = torch.cat([grid, torch.ones_like(grid[..., 0:1])], dim=-1).unsqueeze(
-      -1
-  )
   # depth of reference view
   ref_depth = 1.0 / torch.clamp(
       torch.index_select(disp_data, dim=0, index=ii), 1e-3, 1e3
   )
 
-  pts_3d_ref = ref_depth[..., None, None] * (K_inv[None, None, None] @ grid_h)
-  rot = cam_1to2[:, None, None, :3, :3]
-  trans = cam_1to2[:, None, None, :3, 3:4]
-
-  pts_3d_tgt = (rot @ pts_3d_ref) + trans  # [:, None, None, :, None]
-  depth_tgt = pts_3d_tgt[:, :, :, 2:3, 0]
-  disp_tgt = 1.0 / torch.clamp(depth_tgt, 0.1, 1e3)
+  proj_x, proj_y, proj_z = reproject_depth(ref_depth, K, K_inv, cam_1to2)
+  disp_tgt = 1.0 / torch.clamp(proj_z, 0.1, 1e3)
 
   # flow consistency loss
-  pts_2D_tgt = K[None, None, None] @ pts_3d_tgt
-
-  flow_masks_step_ = flow_masks_step * (pts_2D_tgt[:, :, :, 2, 0] > 0.1)
-  pts_2D_tgt = pts_2D_tgt[:, :, :, :2, 0] / torch.clamp(
-      pts_2D_tgt[:, :, :, 2:, 0], 1e-3, 1e3
-  )
+  flow_masks_step_ = flow_masks_step * (proj_z > 0.1)
+  pts_2D_tgt = torch.stack([proj_x, proj_y], dim=-1) / torch.clamp(
+      proj_z, 1e-3, 1e3
+  ).unsqueeze(-1)
 
   disp_sampled = torch.clamp(disp_sampled, 1e-3, 1e2)
   disp_tgt = torch.clamp(disp_tgt, 1e-3, 1e2)
@@ -187,22 +388,14 @@ def consistency_loss(
 
   # prior mono-depth reg loss
   loss_prior = si_loss(init_disp, disp_data)
-  KK = torch.inverse(K_inv)
 
   # multi gradient consistency
-  disp_data_ds = disp_data[:, None, ...]
-  init_disp_ds = init_disp[:, None, ...]
-  K_rescale = KK.clone()
-  K_inv_rescale = torch.inverse(K_rescale)
   pred_normal = compute_normals[0](
-      1.0 / torch.clamp(disp_data_ds, 1e-3, 1e3), K_inv_rescale[None]
-  )
-  init_normal = compute_normals[0](
-      1.0 / torch.clamp(init_disp_ds, 1e-3, 1e3), K_inv_rescale[None]
+      1.0 / torch.clamp(disp_data[:, None, ...], 1e-3, 1e3), K_inv[None]
   )
 
   loss_normal = torch.mean(
-      fg_alpha * (1.0 - torch.sum(pred_normal * init_normal, dim=1))
+      fg_alpha * (1.0 - torch.sum(pred_normal * targets["init_normal"], dim=1))
   )  # / (1e-8 + torch.sum(fg_alpha))
 
   loss_grad = 0.0
@@ -213,18 +406,9 @@ def consistency_loss(
         scale_factor=(1.0 / interval, 1.0 / interval),
         mode="nearest-exact",
     )
-    init_disp_ds = torch.nn.functional.interpolate(
-        init_disp[:, None, ...],
-        scale_factor=(1.0 / interval, 1.0 / interval),
-        mode="nearest-exact",
-    )
-    uncertainty_rs = torch.nn.functional.interpolate(
-        uncertainty,
-        scale_factor=(1.0 / interval, 1.0 / interval),
-        mode="nearest-exact",
-    )
+    # the uncertainty is not used by gradient_loss
     loss_grad += gradient_loss(
-        torch.log(disp_data_ds), torch.log(init_disp_ds), uncertainty_rs
+        torch.log(disp_data_ds), targets["log_init_disp_ds"][scale], None
     )
 
   return (
@@ -235,44 +419,125 @@ def consistency_loss(
       + loss_grad * w_grad
   )
 
-if __name__ == "__main__":
-  parser = argparse.ArgumentParser()
+def get_parser():
+  """CVD optimization arguments."""
+  parser = argparse.ArgumentParser(allow_abbrev=False)
   parser.add_argument("--w_grad", type=float, default=2.0, help="w_grad")
   parser.add_argument("--w_normal", type=float, default=6.0, help="w_normal")
   parser.add_argument(
       "--output_dir", type=str, default="outputs_cvd", help="outputs direcotry"
   )
   parser.add_argument("--scene_name", type=str, help="scene name")
+  parser.add_argument(
+      "--schedule",
+      type=str,
+      default=None,
+      help="coarse to fine depth optimization, resolution:steps pairs e.g."
+      " 0.125:200,0.25:150,0.5:50 (default 0.5:400). The scale and shift"
+      " alignment runs at the first resolution.",
+  )
+  parser.add_argument(
+      "--align_solver",
+      type=str,
+      default="adam",
+      choices=["adam", "lbfgs"],
+      help="scale and shift alignment: 100 Adam steps (also refining the"
+      " uncertainty) or L-BFGS on the per-frame scale and shift only",
+  )
+  parser.add_argument(
+      "--align_iters",
+      type=int,
+      default=20,
+      help="max L-BFGS iterations of the scale and shift alignment",
+  )
+  parser.add_argument(
+      "--compile",
+      action="store_true",
+      help="torch.compile consistency_loss, see benchmark_cvd_loss.py",
+  )
+  parser.add_argument(
+      "--log_every",
+      type=int,
+      default=10,
+      help="read back, log and check convergence every K steps",
+  )
+  parser.add_argument(
+      "--rel_tol",
+      type=float,
+      default=None,
+      help="stop a phase when the relative decrease of the mean loss over"
+      " log_every steps is below this for --patience checks, e.g. 1e-3",
+  )
+  parser.add_argument("--patience", type=int, default=2)
+  parser.add_argument(
+      "--grad_tol",
+      type=float,
+      default=None,
+      help="stop a phase when the gradient norm is below this",
+  )
+  parser.add_argument(
+      "--time_budget",
+      type=float,
+      default=None,
+      help="max seconds for the whole optimization",
+  )
+  parser.add_argument(
+      "--depth_encoding",
+      type=str,
+      default=DEPTH_ENCODING,
+      choices=("float32", "float16", "log_uint16"),
+      help="encoding of the saved depths, float16 and log_uint16 are lossy",
+  )
 
-  args = parser.parse_args()
+  return parser
 
-  cache_dir = "./cache_flow"
-  rootdir = os.getcwd() + "/reconstructions"
 
-  output_dir = args.output_dir
-  scene_name = args.scene_name
-  print("***************************** ", scene_name)
-  img_data = np.load(os.path.join(rootdir, scene_name, "images.npy"))[
-      :, ::-1, ...
-  ]
-  disp_data = (
-      np.load(
-          os.path.join(rootdir, scene_name.replace("_opt", ""), "disps.npy")
-      )
-      + 1e-6
-  )
-  intrinsics = np.load(os.path.join(rootdir, scene_name, "intrinsics.npy"))
-  poses = np.load(os.path.join(rootdir, scene_name, "poses.npy"))
-  mot_prob = np.load(os.path.join(rootdir, scene_name, "motion_prob.npy"))
+def optimize(
+    images,
+    disps,
+    intrinsics,
+    poses,
+    mot_prob,
+    flows,
+    flow_masks,
+    iijj,
+    args,
+    profile=contextlib.nullcontext,
+):
+  """Consistent video depth optimization of a tracked scene.
+
+  Args:
+    images: (N, 3, H, W) BGR images of the reconstruction.
+    disps: (N, H, W) aligned mono disparities of the reconstruction.
+    intrinsics: (N, 4) fx, fy, cx, cy of the reconstruction.
+    poses: (N, 7) camera poses of the reconstruction.
+    mot_prob: (N, H/8, W/8) motion probabilities of the reconstruction.
+    flows: (P, 2, H/2, W/2) flows from preprocess_flow.
+    flow_masks: (P, 1, H/2, W/2) flow consistency masks from preprocess_flow.
+    iijj: (2, P) frame indices of the flows from preprocess_flow.
+    args: see get_parser().
+    profile: phase context manager factory, see pipeline.profiling.
+
+  Returns:
+    dict with the optimized images, depths, intrinsic and cam_c2w.
+  """
+  deadline = None
+  if args.time_budget is not None:
+    deadline = time.perf_counter() + args.time_budget
+
+  def convergence_monitor(name):
+    return ConvergenceMonitor(
+        name,
+        check_every=args.log_every,
+        rel_tol=args.rel_tol,
+        patience=args.patience,
+        grad_tol=args.grad_tol,
+        deadline=deadline,
+    )
 
-  flows = np.load(
-      "%s/%s/flows.npy" % (cache_dir, scene_name), allow_pickle=True
-  )
-  flow_masks = np.load(
-      "%s/%s/flows_masks.npy" % (cache_dir, scene_name), allow_pickle=True
-  )
+  img_data = images[:, ::-1, ...]
+  disp_data = disps + 1e-6
   flow_masks = np.float32(flow_masks)
-  iijj = np.load("%s/%s/ii-jj.npy" % (cache_dir, scene_name), allow_pickle=True)
 
   intrinsics = intrinsics[0]
   poses_th = torch.as_tensor(poses, device="cpu").float().cuda()
@@ -300,19 +565,9 @@ if __name__ == "__main__":
 
   assert init_disp.shape == disp_data.shape
 
-  init_disp = torch.nn.functional.interpolate(
-      init_disp.unsqueeze(1),
-      scale_factor=(RESIZE_FACTOR, RESIZE_FACTOR),
-      mode="bilinear",
-  ).squeeze(1)
-  disp_data = torch.nn.functional.interpolate(
-      disp_data.unsqueeze(1),
-      scale_factor=(RESIZE_FACTOR, RESIZE_FACTOR),
-      mode="bilinear",
-  ).squeeze(1)
-
-  fg_alpha = sobel_fg_alpha(init_disp[:, None, ...]) > 0.2
-  fg_alpha = fg_alpha.squeeze(1).float() + 0.2
+  schedule = DEFAULT_SCHEDULE
+  if args.schedule is not None:
+    schedule = parse_schedule(args.schedule)
 
   cvd_prob = torch.nn.functional.interpolate(
       torch.from_numpy(mot_prob).unsqueeze(1).cuda(),
@@ -322,44 +577,45 @@ if __name__ == "__main__":
   cvd_prob[cvd_prob > 0.5] = 0.5
   cvd_prob = torch.clamp(cvd_prob, 1e-3, 1.0)
 
-  # rescale intrinsic matrix to small resolution
+  loss_fn = consistency_loss
+  if args.compile:
+    loss_fn = compile_consistency_loss()
+
   K_o = K.clone()
-  K[0:2, ...] *= RESIZE_FACTOR
-  K_inv = torch.linalg.inv(K)
+  full_disp = init_disp
+  level = build_level(schedule[0][0], full_disp, flows, flow_masks, cvd_prob, K)
+  init_disp = level["init_disp"]
+  disp_data = level["init_disp"].clone()
 
   disp_data.requires_grad = False
   poses_th.requires_grad = False
 
-  uncertainty = cvd_prob
+  uncertainty = level["cvd_prob"].clone()
 
   # First optimize scale and shift to align them
   log_scale_ = torch.log(torch.ones(init_disp.shape[0]).to(disp_data.device))
   shift_ = torch.zeros(init_disp.shape[0]).to(disp_data.device)
   log_scale_.requires_grad = True
   shift_.requires_grad = True
-  uncertainty.requires_grad = True
-
-  optim = torch.optim.Adam([
-      {"params": log_scale_, "lr": 1e-2},
-      {"params": shift_, "lr": 1e-2},
-      {"params": uncertainty, "lr": 1e-2},
-  ])
+  # L-BFGS only solves for the 2N scale and shift scalars
+  uncertainty.requires_grad = args.align_solver == "adam"
 
   compute_normals = []
   compute_normals.append(
-      NormalGenerator(disp_data.shape[-2], disp_data.shape[-1])
+      NormalGenerator(disp_data.shape[-2], disp_data.shape[-1]).cuda()
   )
   init_disp = torch.clamp(init_disp, 1e-3, 1e3)
+  targets = consistency_targets(init_disp, level["K_inv"], compute_normals)
 
-  for i in range(100):
-    optim.zero_grad()
+  def scale_shift_loss(backward=True):
+    """Loss and nan free gradients of the scale and shift alignment."""
     cam_c2w = SE3(poses_th).inv().matrix()
     scale_ = torch.exp(log_scale_)
 
-    loss = consistency_loss(
+    loss = loss_fn(
         cam_c2w,
-        K,
-        K_inv,
+        level["K"],
+        level["K_inv"],
         torch.clamp(
             disp_data * scale_[..., None, None] + shift_[..., None, None],
             1e-3,
@@ -367,91 +623,193 @@ if __name__ == "__main__":
         ),
         init_disp,
         torch.clamp(uncertainty, 1e-4, 1e3),
-        flows,
-        flow_masks,
+        level["flows"],
+        level["flow_masks"],
         ii,
         jj,
         compute_normals,
-        fg_alpha,
+        level["fg_alpha"],
+        targets=targets,
     )
 
+    if not backward:
+      return loss
     loss.backward()
-    uncertainty.grad = torch.nan_to_num(uncertainty.grad, nan=0.0)
+    if uncertainty.requires_grad:
+      uncertainty.grad = torch.nan_to_num(uncertainty.grad, nan=0.0)
     log_scale_.grad = torch.nan_to_num(log_scale_.grad, nan=0.0)
     shift_.grad = torch.nan_to_num(shift_.grad, nan=0.0)
+    return loss
+
+  with profile("cvd/phase1", frames=init_disp.shape[0]):
+    if args.align_solver == "lbfgs":
+      optim = torch.optim.LBFGS(
+          [log_scale_, shift_],
+          lr=1.0,
+          max_iter=args.align_iters,
+          history_size=10,
+          line_search_fn="strong_wolfe",
+      )
 
-    optim.step()
-    print("step ", i, loss.item())
+      def closure():
+        optim.zero_grad()
+        return scale_shift_loss()
+
+      optim.step(closure)
+      # step returns the loss of its first evaluation, before any update
+      with torch.no_grad():
+        loss = scale_shift_loss(backward=False)
+      print("scale_shift lbfgs loss %.6f" % loss.item())
+    else:
+      optim = torch.optim.Adam([
+          {"params": log_scale_, "lr": 1e-2},
+          {"params": shift_, "lr": 1e-2},
+          {"params": uncertainty, "lr": 1e-2},
+      ])
+
+      monitor = convergence_monitor("scale_shift")
+      for _ in range(100):
+        optim.zero_grad()
+        loss = scale_shift_loss()
+        optim.step()
+        if monitor.step(loss, [log_scale_, shift_, uncertainty]):
+          break
+
+  # Then optimize depth and uncertainty, coarse to fine
+  full_disp = (
+      full_disp * torch.exp(log_scale_)[..., None, None].detach()
+      + shift_[..., None, None].detach()
+  )
+  poses_th.requires_grad = False  # True
+  cam_c2w = SE3(poses_th).inv().matrix()
 
-  # Then optimize depth and uncertainty
   disp_data = (
       disp_data * torch.exp(log_scale_)[..., None, None].detach()
       + shift_[..., None, None].detach()
   )
-  init_disp = (
-      init_disp * torch.exp(log_scale_)[..., None, None].detach()
-      + shift_[..., None, None].detach()
+  for level_idx, (scale, steps) in enumerate(schedule):
+    if level_idx > 0:
+      level = build_level(scale, full_disp, flows, flow_masks, cvd_prob, K_o)
+      # carry the optimized correction over the (aligned) initialization
+      ratio = disp_data.detach() / torch.clamp(init_disp, 1e-3, 1e3)
+      disp_data = level["init_disp"] * resize_disp(ratio, level["size"])
+      uncertainty = resize_disp(
+          uncertainty.detach().squeeze(1), level["size"]
+      ).unsqueeze(1)
+      compute_normals = [NormalGenerator(*level["size"]).cuda()]
+    else:
+      level["init_disp"] = (
+          init_disp * torch.exp(log_scale_)[..., None, None].detach()
+          + shift_[..., None, None].detach()
+      )
+    init_disp = torch.clamp(level["init_disp"], 1e-3, 1e3)
+    targets = consistency_targets(init_disp, level["K_inv"], compute_normals)
+
+    disp_data = disp_data.detach()
+    uncertainty = uncertainty.detach()
+    disp_data.requires_grad = True
+    uncertainty.requires_grad = True
+
+    optim = torch.optim.Adam([
+        {"params": disp_data, "lr": 5e-3},
+        {"params": uncertainty, "lr": 5e-3},
+    ])
+
+    with profile("cvd/phase2", frames=init_disp.shape[0]):
+      monitor = convergence_monitor("level %d" % level_idx)
+      for _ in range(steps):
+        optim.zero_grad()
+        cam_c2w = SE3(poses_th).inv().matrix()
+        loss = loss_fn(
+            cam_c2w,
+            level["K"],
+            level["K_inv"],
+            torch.clamp(disp_data, 1e-3, 1e3),
+            init_disp,
+            torch.clamp(uncertainty, 1e-4, 1e3),
+            level["flows"],
+            level["flow_masks"],
+            ii,
+            jj,
+            compute_normals,
+            level["fg_alpha"],
+            w_ratio=1.0,
+            w_flow=0.2,
+            w_si=1,
+            w_grad=args.w_grad,
+            w_normal=args.w_normal,
+            targets=targets,
+        )
+
+        loss.backward()
+        disp_data.grad = torch.nan_to_num(disp_data.grad, nan=0.0)
+        uncertainty.grad = torch.nan_to_num(uncertainty.grad, nan=0.0)
+
+        optim.step()
+        if monitor.step(loss, [disp_data, uncertainty]):
+          break
+
+  disp_data_opt = (
+      resize_disp(disp_data, tuple(full_disp.shape[-2:]))
+      .detach()
+      .cpu()
+      .numpy()
   )
-  init_disp = torch.clamp(init_disp, 1e-3, 1e3)
 
-  disp_data.requires_grad = True
-  uncertainty.requires_grad = True
-  poses_th.requires_grad = False  # True
+  return {
+      "images": np.uint8(
+          img_data_pt.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+      ),
+      "depths": np.clip(np.float16(1.0 / disp_data_opt), 1e-3, 1e2),
+      "intrinsic": K_o.detach().cpu().numpy(),
+      "cam_c2w": cam_c2w.detach().cpu().numpy(),
+  }
 
-  optim = torch.optim.Adam([
-      {"params": disp_data, "lr": 5e-3},
-      {"params": uncertainty, "lr": 5e-3},
-  ])
 
-  losses = []
-  for i in range(400):
-    optim.zero_grad()
-    cam_c2w = SE3(poses_th).inv().matrix()
-    loss = consistency_loss(
-        cam_c2w,
-        K,
-        K_inv,
-        torch.clamp(disp_data, 1e-3, 1e3),
-        init_disp,
-        torch.clamp(uncertainty, 1e-4, 1e3),
-        flows,
-        flow_masks,
-        ii,
-        jj,
-        compute_normals,
-        fg_alpha,
-        w_ratio=1.0,
-        w_flow=0.2,
-        w_si=1,
-        w_grad=args.w_grad,
-        w_normal=args.w_normal,
-    )
+if __name__ == "__main__":
+  args = get_parser().parse_args()
 
-    loss.backward()
-    disp_data.grad = torch.nan_to_num(disp_data.grad, nan=0.0)
-    uncertainty.grad = torch.nan_to_num(uncertainty.grad, nan=0.0)
+  cache_dir = "./cache_flow"
+  rootdir = os.getcwd() + "/reconstructions"
 
-    optim.step()
-    print("step ", i, loss.item())
-    losses.append(loss)
+  output_dir = args.output_dir
+  scene_name = args.scene_name
+  print("***************************** ", scene_name)
+  recon = open_reconstruction(os.path.join(rootdir, scene_name))
+  img_data = np.asarray(recon["images"])
+  disp_data = np.asarray(
+      open_reconstruction(
+          os.path.join(rootdir, scene_name.replace("_opt", ""))
+      )["disps"]
+  )
+  intrinsics = np.asarray(recon["intrinsics"])
+  poses = np.asarray(recon["poses"])
+  mot_prob = np.asarray(recon["motion_prob"])
 
-  disp_data_opt = (
-      torch.nn.functional.interpolate(
-          disp_data.unsqueeze(1), scale_factor=(2, 2), mode="bilinear"
-      )
-      .squeeze(1)
-      .detach()
-      .cpu()
-      .numpy()
+  flows = np.load(
+      "%s/%s/flows.npy" % (cache_dir, scene_name), allow_pickle=True
   )
+  flow_masks = np.load(
+      "%s/%s/flows_masks.npy" % (cache_dir, scene_name), allow_pickle=True
+  )
+  iijj = np.load("%s/%s/ii-jj.npy" % (cache_dir, scene_name), allow_pickle=True)
 
-  # poses_ = poses_th.detach().cpu().numpy()
+  outputs = optimize(
+      img_data,
+      disp_data,
+      intrinsics,
+      poses,
+      mot_prob,
+      flows,
+      flow_masks,
+      iijj,
+      args,
+  )
 
   Path(output_dir).mkdir(parents=True, exist_ok=True)
-  np.savez(
-      "%s/%s_sgd_cvd_hr.npz" % (output_dir, scene_name),
-      images=np.uint8(img_data_pt.cpu().numpy().transpose(0, 2, 3, 1) * 255.0),
-      depths=np.clip(np.float16(1.0 / disp_data_opt), 1e-3, 1e2),
-      intrinsic=K_o.detach().cpu().numpy(),
-      cam_c2w=cam_c2w.detach().cpu().numpy(),
+  save_outputs(
+      "%s/%s_sgd_cvd_hr" % (output_dir, scene_name),
+      outputs,
+      images_from=os.path.join(rootdir, scene_name),
+      depth_encoding=args.depth_encoding,
   )
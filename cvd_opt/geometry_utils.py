@@ -70,7 +70,7 @@ class BackprojectDepth(nn.Module):
   def forward(self, depth_b1hw: Tensor, invK_b44: Tensor) -> Tensor:
     """Backprojects spatial points in 2D image space to world space using invK_b44 at the depths defined in depth_b1hw."""
     cam_points_b3N = torch.matmul(
-        invK_b44[:, :3, :3], self.pix_coords_13N.float().cuda()
+        invK_b44[:, :3, :3], self.pix_coords_13N.to(invK_b44)
     )
     cam_points_b3N = depth_b1hw.flatten(start_dim=2) * cam_points_b3N
     cam_points_b4N = to_homogeneous(cam_points_b3N, dim=1)
@@ -107,6 +107,37 @@ class Project3D(jit.ScriptModule):
     return torch.cat([pix_coords_b2N, depth_b1N], dim=1)
 
 
+def reproject_depth(
+    depth_phw: Tensor, K_33: Tensor, invK_33: Tensor, cam_1to2_p44: Tensor
+):
+  """Projects every pixel of depth maps into a second camera.
+
+  Same as K @ (R @ (depth * invK @ [x, y, 1]) + t) for the pixel grid, but
+  the per pair K R invK and K t are precomputed and applied as plane-wise
+  multiply-adds, with no (P, H, W, 3, 1) temporaries. K must have [0, 0, 1]
+  as last row, so the projected z is also the depth in the second camera.
+
+  Returns:
+    x, y, z planes (P, H, W) of the projection, x and y not yet divided by z.
+  """
+  _, H, W = depth_phw.shape
+  ys, xs = torch.meshgrid(
+      torch.arange(H, device=depth_phw.device, dtype=depth_phw.dtype),
+      torch.arange(W, device=depth_phw.device, dtype=depth_phw.dtype),
+      indexing="ij",
+  )
+  M_p33 = K_33 @ cam_1to2_p44[:, :3, :3] @ invK_33
+  b_p3 = (K_33 @ cam_1to2_p44[:, :3, 3:4])[..., 0]
+
+  M_p33 = M_p33[:, :, :, None, None]
+  b_p3 = b_p3[:, :, None, None]
+  return [
+      depth_phw * (M_p33[:, r, 0] * xs + M_p33[:, r, 1] * ys + M_p33[:, r, 2])
+      + b_p3[:, r]
+      for r in range(3)
+  ]
+
+
 class NormalGenerator(nn.Module):
   """Estimates normals from depth maps."""
 
@@ -15,8 +15,6 @@
 
 """Preprocess flow for MegaSaM."""
 
-import glob
-import os
 import sys
 
 # pylint: disable=g-bad-import-order
@@ -24,10 +22,14 @@ import sys
 
 import numpy as np
 import torch
+import torch.nn.functional as F
 # FLOW ESTIMATOR
 sys.path.append('cvd_opt/core')
 from raft import RAFT
 from core.utils.utils import InputPadder
+sys.path.append('.')
+from pipeline.frames import FrameSource
+from pipeline.preprocess import resize_crop
 from pathlib import Path  # pylint: disable=g-importing-member
 
 import argparse
@@ -36,29 +38,78 @@ import cv2
 
 
 def warp_flow(img, flow):
-  h, w = flow.shape[:2]
-  flow_new = flow.copy()
-  flow_new[:, :, 0] += np.arange(w)
-  flow_new[:, :, 1] += np.arange(h)[:, np.newaxis]
-
-  res = cv2.remap(
-      img, flow_new, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT
+  """Bilinearly warps a batch of images (B, C, H, W) by flows (B, 2, H, W)."""
+  _, _, h, w = flow.shape
+  ys, xs = torch.meshgrid(
+      torch.arange(h, device=flow.device, dtype=flow.dtype),
+      torch.arange(w, device=flow.device, dtype=flow.dtype),
+      indexing='ij',
+  )
+  # same as cv2.remap with INTER_LINEAR and BORDER_CONSTANT
+  grid = torch.stack(
+      [
+          2.0 * (flow[:, 0] + xs) / (w - 1) - 1.0,
+          2.0 * (flow[:, 1] + ys) / (h - 1) - 1.0,
+      ],
+      dim=-1,
   )
-  return res
+  return F.grid_sample(img, grid, mode='bilinear', align_corners=True)
 
 
 def resize_flow(flow, img_h, img_w):
-  # flow = np.load(flow_path)
-  flow_h, flow_w = flow.shape[0], flow.shape[1]
-  flow[:, :, 0] *= float(img_w) / float(flow_w)
-  flow[:, :, 1] *= float(img_h) / float(flow_h)
-  flow = cv2.resize(flow, (img_w, img_h), cv2.INTER_LINEAR)
-
+  """Resizes a batch of flows (B, 2, H, W) and rescales their magnitude."""
+  flow_h, flow_w = flow.shape[-2:]
+  scale = torch.tensor(
+      [float(img_w) / float(flow_w), float(img_h) / float(flow_h)],
+      device=flow.device,
+      dtype=flow.dtype,
+  )
+  flow = F.interpolate(
+      flow, size=(img_h, img_w), mode='bilinear', align_corners=False
+  )
+  return flow * scale.view(1, 2, 1, 1)
+
+
+def consistency_check(flow_fwd, flow_bwd, thresh=1.0):
+  """Half resolution forward flows and their fwd-bwd consistency masks.
+
+  Args:
+    flow_fwd: (B, 2, H, W) forward flows, on device.
+    flow_bwd: (B, 2, H, W) backward flows, on device.
+    thresh: max fwd-bwd error in pixels (at half resolution).
+
+  Returns:
+    (B, 2, H/2, W/2) float16 flows and (B, 1, H/2, W/2) bool masks, on host.
+  """
+  h, w = flow_fwd.shape[-2] // 2, flow_fwd.shape[-1] // 2
+  flows = resize_flow(torch.cat([flow_fwd, flow_bwd], dim=0), h, w)
+  flow_fwd, flow_bwd = flows.chunk(2, dim=0)
+  bwd2fwd_flow = warp_flow(flow_bwd, flow_fwd)
+  fwd_lr_error = torch.norm(flow_fwd + bwd2fwd_flow, dim=1, keepdim=True)
+  fwd_mask = fwd_lr_error < thresh
+  return flow_fwd.half().cpu().numpy(), fwd_mask.cpu().numpy()
+
+
+def flow_chain(step, steps):
+  """Splits step into a chain of already computed steps, largest first."""
+  chain = []
+  for s in sorted(steps, reverse=True):
+    while s <= step - sum(chain):
+      chain.append(s)
+  return chain
+
+
+def compose_flows(flows):
+  """Composes chained (B, 2, H, W) flows [f(a->b), f(b->c), ...] to f(a->z)."""
+  flow = flows[0]
+  for next_flow in flows[1:]:
+    flow = flow + warp_flow(next_flow, flow)
   return flow
 
 
-if __name__ == '__main__':
-  parser = argparse.ArgumentParser()
+def get_parser():
+  """Flow arguments, also used to build RAFT."""
+  parser = argparse.ArgumentParser(allow_abbrev=False)
   parser.add_argument(
       '--model', default='raft-things.pth', help='restore checkpoint'
   )
@@ -88,63 +139,158 @@ if __name__ == '__main__':
   parser.add_argument(
       '--mixed_precision', action='store_true', help='use mixed precision'
   )
-  args = parser.parse_args()
+  parser.add_argument(
+      '--alternate_corr',
+      action='store_true',
+      help='memory-bounded local correlation, for high resolution flow',
+  )
+  parser.add_argument(
+      '--flow_max_pixels',
+      default=384 * 512,
+      type=int,
+      help='frames are resized to this area before RAFT, raise it together'
+      ' with --alternate_corr',
+  )
+  parser.add_argument(
+      '--post_batch',
+      default=32,
+      type=int,
+      help='number of pairs resized and consistency checked at once on GPU',
+  )
+  parser.add_argument(
+      '--flow_compose',
+      action='store_true',
+      help='initialize long stride flows by chaining shorter strides, and'
+      ' only run a short refinement when the chain is consistent',
+  )
+  parser.add_argument(
+      '--compose_iters',
+      default=4,
+      type=int,
+      help='RAFT iterations for pairs whose composed flow is consistent',
+  )
+  parser.add_argument(
+      '--compose_thresh',
+      default=0.25,
+      type=float,
+      help='fwd-bwd error (in 1/8 res pixels) above which a pixel of a'
+      ' composed flow is an outlier',
+  )
+  parser.add_argument(
+      '--compose_max_outliers',
+      default=0.1,
+      type=float,
+      help='max fraction of fwd-bwd inconsistent pixels of a composed flow,'
+      ' above it the pair runs the full --flow_iters',
+  )
+  parser.add_argument(
+      '--flow_iters', default=22, type=int, help='max RAFT GRU iterations'
+  )
+  parser.add_argument(
+      '--flow_early_stop',
+      default=None,
+      type=float,
+      help='stop RAFT iterations once the mean flow update (in 1/8 res'
+      ' pixels) is below this value, e.g. 0.01',
+  )
+  return parser
+
 
+def load_flow_model(args):
+  """RAFT in eval mode on GPU."""
   model = torch.nn.DataParallel(RAFT(args))
   model.load_state_dict(torch.load(args.model))
   print(f'Loaded checkpoint at {args.model}')
   flow_model = model.module
   flow_model.cuda()  # .eval()
   flow_model.eval()
+  return flow_model
 
-  scene_name = args.scene_name
-  image_list = sorted(
-      glob.glob(os.path.join(args.datapath, '*.png'))
-  )  # [::stride]
-  image_list += sorted(
-      glob.glob(os.path.join(args.datapath, '*.jpg'))
-  )  # [::stride]
-  img_data = []
 
-  for t, (image_file) in tqdm.tqdm(enumerate(image_list)):
-    image = cv2.imread(image_file)[..., ::-1]  # rgb
-    h0, w0, _ = image.shape
-    h1 = int(h0 * np.sqrt((384 * 512) / (h0 * w0)))
-    w1 = int(w0 * np.sqrt((384 * 512) / (h0 * w0)))
-    image = cv2.resize(image, (w1, h1))
-    image = image[: h1 - h1 % 8, : w1 - w1 % 8].transpose(2, 0, 1)
+def load_images(image_list, max_pixels=384 * 512):
+  """Resizes images to about max_pixels area, cropped to a multiple of 8.
+
+  Args:
+    image_list: image paths or BGR images (H, W, 3).
+    max_pixels: target area.
+
+  Returns:
+    (N, 3, H, W) uint8 RGB images.
+  """
+  img_data = []
+  for image_file in tqdm.tqdm(image_list):
+    # paths, or already decoded BGR images
+    if isinstance(image_file, str):
+      image_file = cv2.imread(image_file)
+    image = image_file[..., ::-1]  # rgb
+    image = resize_crop(image, max_pixels).transpose(2, 0, 1)
     img_data.append(image)
 
-  img_data = np.array(img_data)
+  return np.array(img_data)
+
 
-  flows_low = []
+def compute_flows(flow_model, img_data, args):
+  """Flows between frames at strides 1, 2, 4, 8 and 15.
 
-  flows_high = []
-  flow_masks_high = []
+  Frames are visited last to first: pairs starting at frame i only read the low
+  resolution flows of pairs starting in [i, i + 15], those further ahead are
+  evicted so that device memory does not grow with the number of frames.
 
+  Returns:
+    half resolution flows (P, 2, H/2, W/2) float16, their consistency masks
+    (P, 1, H/2, W/2) and the (2, P) frame indices of each pair.
+  """
   flow_init = None
   flows_arr_low_bwd = {}
   flows_arr_low_fwd = {}
+  # (i, j) -> 1/8 resolution flow from frame i to j, for --flow_compose
+  flows_low = {}
 
   ii = []
   jj = []
   flows_arr_up = []
   masks_arr_up = []
-
-  for step in [1, 2, 4, 8, 15]:
-    flows_arr_low = []
-    for i in tqdm.tqdm(range(max(0, -step), img_data.shape[0] - max(0, step))):
+  pending_fwd = []
+  pending_bwd = []
+
+  def flush_pending():
+    if not pending_fwd:
+      return
+    flows_up, masks_up = consistency_check(
+        torch.stack(pending_fwd), torch.stack(pending_bwd)
+    )
+    flows_arr_up.append(flows_up)
+    masks_arr_up.append(masks_up)
+    pending_fwd.clear()
+    pending_bwd.clear()
+
+  device = next(flow_model.parameters()).device
+  steps = [1, 2, 4, 8, 15]
+  num_frames = img_data.shape[0]
+  for i in tqdm.tqdm(reversed(range(num_frames - 1)), total=num_frames - 1):
+    # flows of frames visited before are only needed up to steps[-1] frames
+    # after i, and flows starting at i + 1 only at i + 1
+    k = i + steps[-1]
+    flows_arr_low_fwd.pop(i + 1, None)
+    flows_arr_low_bwd.pop(k + 1, None)
+    for s in steps:
+      flows_low.pop((k, k + s), None)
+      flows_low.pop((k + s, k), None)
+
+    for step_idx, step in enumerate(steps):
+      if i + step >= num_frames:
+        break
       image1 = (
           torch.as_tensor(np.ascontiguousarray(img_data[i : i + 1]))
           .float()
-          .cuda()
+          .to(device)
       )
       image2 = (
           torch.as_tensor(
               np.ascontiguousarray(img_data[i + step : i + step + 1])
           )
           .float()
-          .cuda()
+          .to(device)
       )
 
       ii.append(i)
@@ -154,56 +300,73 @@ if __name__ == '__main__':
         padder = InputPadder(image1.shape)
         image1, image2 = padder.pad(image1, image2)
         if np.abs(step) > 1:
-          flow_init = np.stack(
-              [flows_arr_low_fwd[i], flows_arr_low_bwd[i + step]], axis=0
-          )
-          flow_init = (
-              torch.as_tensor(np.ascontiguousarray(flow_init))
-              .float()
-              .cuda()
-              .permute(0, 3, 1, 2)
+          # low resolution flows are kept on device
+          flow_init = torch.stack(
+              [flows_arr_low_fwd[i], flows_arr_low_bwd[i + step]], dim=0
           )
         else:
           flow_init = None
 
+        iters = args.flow_iters
+        if args.flow_compose and step > 1:
+          chain = flow_chain(step, steps[:step_idx])
+          frames = np.cumsum([i] + chain).tolist()
+          pairs = list(zip(frames[:-1], frames[1:]))
+          compose_fwd = compose_flows([flows_low[(a, b)] for a, b in pairs])
+          compose_bwd = compose_flows(
+              [flows_low[(b, a)] for a, b in reversed(pairs)]
+          )
+          compose_err = torch.norm(
+              compose_fwd + warp_flow(compose_bwd, compose_fwd), dim=1
+          )
+          outliers = (compose_err > args.compose_thresh).float().mean().item()
+          flow_init = torch.cat([compose_fwd, compose_bwd], dim=0)
+          if outliers <= args.compose_max_outliers:
+            iters = args.compose_iters
+
         flow_low, flow_up, _ = flow_model(
             torch.cat([image1, image2], dim=0),
             torch.cat([image2, image1], dim=0),
-            iters=22,
+            iters=iters,
             test_mode=True,
             flow_init=flow_init,
+            early_stop_thresh=args.flow_early_stop,
         )
 
-        flow_low_fwd = flow_low[0].cpu().numpy().transpose(1, 2, 0)
-        flow_low_bwd = flow_low[1].cpu().numpy().transpose(1, 2, 0)
+        flows_arr_low_bwd[i + step] = flow_low[1].float()
+        flows_arr_low_fwd[i] = flow_low[0].float()
+        if args.flow_compose:
+          flows_low[(i, i + step)] = flow_low[0:1].float()
+          flows_low[(i + step, i)] = flow_low[1:2].float()
 
-        flow_up_fwd = resize_flow(
-            flow_up[0].cpu().numpy().transpose(1, 2, 0),
-            flow_up.shape[-2] // 2,
-            flow_up.shape[-1] // 2,
-        )
-        flow_up_bwd = resize_flow(
-            flow_up[1].cpu().numpy().transpose(1, 2, 0),
-            flow_up.shape[-2] // 2,
-            flow_up.shape[-1] // 2,
-        )
+        pending_fwd.append(flow_up[0].float())
+        pending_bwd.append(flow_up[1].float())
+        if len(pending_fwd) >= args.post_batch:
+          flush_pending()
 
-        bwd2fwd_flow = warp_flow(flow_up_bwd, flow_up_fwd)
-        fwd_lr_error = np.linalg.norm(flow_up_fwd + bwd2fwd_flow, axis=-1)
-        fwd_mask_up = fwd_lr_error < 1.0
+  with torch.no_grad():
+    flush_pending()
 
-        # flows_arr_low.append(flow_low_fwd)
-        flows_arr_low_bwd[i + step] = flow_low_bwd
-        flows_arr_low_fwd[i] = flow_low_fwd
+  # pairs in stride order, then by first frame
+  order = np.lexsort((ii, np.subtract(jj, ii)))
+  iijj = np.stack((ii, jj), axis=0)[:, order]
+  flows_high = np.concatenate(flows_arr_up, axis=0)[order]
+  flow_masks_high = np.concatenate(masks_arr_up, axis=0)[order]
+  return flows_high, flow_masks_high, iijj
+
+
+if __name__ == '__main__':
+  args = get_parser().parse_args()
+
+  flow_model = load_flow_model(args)
+
+  scene_name = args.scene_name
+  # directory of frames or video file
+  img_data = load_images(FrameSource(args.datapath), args.flow_max_pixels)
 
-        # masks_arr_low.append(fwd_mask_low)
-        flows_arr_up.append(flow_up_fwd)
-        masks_arr_up.append(fwd_mask_up)
+  flows_high, flow_masks_high, iijj = compute_flows(flow_model, img_data, args)
 
-  iijj = np.stack((ii, jj), axis=0)
-  flows_high = np.array(flows_arr_up).transpose(0, 3, 1, 2)
-  flow_masks_high = np.array(masks_arr_up)[:, None, ...]
   Path('./cache_flow/%s' % scene_name).mkdir(parents=True, exist_ok=True)
-  np.save('./cache_flow/%s/flows.npy' % scene_name, np.float16(flows_high))
+  np.save('./cache_flow/%s/flows.npy' % scene_name, flows_high)
   np.save('./cache_flow/%s/flows_masks.npy' % scene_name, flow_masks_high)
   np.save('./cache_flow/%s/ii-jj.npy' % scene_name, iijj)
@@ -17,9 +17,15 @@
 
 import glob
 import os
+import sys
+
 import cv2
 import numpy as np
 
+sys.path.append(".")
+# pylint: disable=g-import-not-at-top
+from pipeline.reconstruction import open_reconstruction
+
 
 if __name__ == "__main__":
   scene_names = ["apple", "block", "creeper", "handwavy"]
@@ -66,10 +72,10 @@ if __name__ == "__main__":
         gt_depths, copy=True, nan=0.0, posinf=1e3, neginf=0.0
     )
 
-    cvd_data = np.load(
-        os.path.join(pred_root_dir, "%s_sgd_cvd_hr.npz" % scene_name)
+    cvd_data = open_reconstruction(
+        os.path.join(pred_root_dir, "%s_sgd_cvd_hr" % scene_name)
     )
-    pred_depths = cvd_data["depths"]
+    pred_depths = np.asarray(cvd_data["depths"])
 
     assert pred_depths.shape == gt_depths.shape
     valid_mask = (gt_depths < 100) & (gt_depths > 0.1)
@@ -17,9 +17,16 @@
 
 import glob
 import os
+import sys
+
 import cv2
 import numpy as np
 
+sys.path.append(".")
+# pylint: disable=g-import-not-at-top
+from pipeline.preprocess import resize_crop
+from pipeline.reconstruction import open_reconstruction
+
 
 if __name__ == "__main__":
   scene_names = ["alley_1", "alley_2", "temple_2", "temple_3", "market_5"]
@@ -49,11 +56,8 @@ if __name__ == "__main__":
     gt_depth_list = []
     for i, gt_path in enumerate(gt_list):
       gt_depth = np.float32(np.load(gt_path))
-      h0, w0 = gt_depth.shape
-      h1 = int(h0 * np.sqrt((384 * 512) / (h0 * w0)))
-      w1 = int(w0 * np.sqrt((384 * 512) / (h0 * w0)))
-      gt_depth = cv2.resize(gt_depth, (w1, h1), interpolation=cv2.INTER_LINEAR)
-      gt_depth = gt_depth[: h1 - h1 % 8, : w1 - w1 % 8]
+      # depths are interpolated, not averaged across boundaries
+      gt_depth = resize_crop(gt_depth, interpolation=cv2.INTER_LINEAR)
       gt_depth_list.append(gt_depth)
 
     gt_depths = np.array(gt_depth_list)
@@ -61,10 +65,10 @@ if __name__ == "__main__":
         gt_depths, copy=True, nan=0.0, posinf=1e3, neginf=0.0
     )
 
-    cvd_data = np.load(
-        os.path.join(pred_root_dir, "%s_sgd_cvd_hr.npz" % scene_name)
+    cvd_data = open_reconstruction(
+        os.path.join(pred_root_dir, "%s_sgd_cvd_hr" % scene_name)
     )
-    pred_depths = cvd_data["depths"]
+    pred_depths = np.asarray(cvd_data["depths"])
 
     assert pred_depths.shape == gt_depths.shape
     valid_mask = (gt_depths < 100) & (gt_depths > 0.1)
@@ -20,6 +20,8 @@
 # pylint: disable=invalid-name
 # pylint: disable=g-explicit-length-test
 
+import argparse
+import hashlib
 import os
 import sys
 from evaluate_rpe import evaluate_trajectory
@@ -29,60 +31,63 @@ import torch
 
 sys.path.append(os.path.realpath("."))
 import camera_tracking_scripts.colmap_read_model as read_model
+from pipeline.cache import CACHE_ROOT
+from pipeline.reconstruction import open_reconstruction
 
 
-def load_colmap_data(realdir):
-  """Load colmap data."""
-  camerasfile = os.path.join(realdir, "sparse/cameras.bin")
-  camdata = read_model.read_cameras_binary(camerasfile)
+GT_CACHE_DIR = os.path.join(CACHE_ROOT, "gt_poses")
 
-  list_of_keys = list(camdata.keys())
-  cam = camdata[list_of_keys[0]]
-  print("Cameras", len(cam))
 
-  imagesfile = os.path.join(realdir, "sparse/images.bin")
-  imdata = read_model.read_images_binary(imagesfile)
-
-  w2c_mats = []
-  bottom = np.array([0, 0, 0, 1.0]).reshape([1, 4])
+def load_colmap_data(realdir, cache_dir=GT_CACHE_DIR):
+  """Camera to world matrices (N, 4, 4) of the 0_* images, sorted by name.
 
-  names = [imdata[k].name for k in imdata]
-  img_keys = [k for k in imdata]
+  Only images.bin is read, without its 2D points. Parsed poses are cached in
+  cache_dir, keyed by the path, size and mtime of images.bin.
 
-  print("Images #", len(names))
-  perm = np.argsort(names)
+  Args:
+    realdir: dense directory of a DyCheck scene.
+    cache_dir: cache directory, None to always parse images.bin.
 
-  points3dfile = os.path.join(realdir, "sparse/points3D.bin")
-  pts3d = read_model.read_points3d_binary(points3dfile)
+  Returns:
+    c2w_mats.
+  """
+  imagesfile = os.path.join(realdir, "sparse/images.bin")
+  cache_path = None
+  if cache_dir is not None:
+    stat = os.stat(imagesfile)
+    key = "%s-%d-%d" % (
+        os.path.abspath(imagesfile),
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+    cache_path = os.path.join(
+        cache_dir, hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    )
+    if os.path.exists(cache_path + ".npy"):
+      return np.load(cache_path + ".npy")
 
-  # extract point 3D xyz
-  point_cloud = []
-  for key in pts3d:
-    point_cloud.append(pts3d[key].xyz)
+  names, qvecs, tvecs = read_model.read_image_poses_binary(imagesfile)
+  print("Images #", len(names))
 
+  perm = np.argsort(names)
   upper_bound = 100000
-
-  if upper_bound < len(img_keys):
+  if upper_bound < len(names):
     print("Only keeping " + str(upper_bound) + " images!")
-
-  for i in perm[0 : min(upper_bound, len(img_keys))]:
-    im = imdata[img_keys[i]]
-    if "2_" in im.name:
-      continue
-
-    if "1_" in im.name:
-      continue
-
-    # print(im.name)
-    R = im.qvec2rotmat()
-    t = im.tvec.reshape([3, 1])
-    m = np.concatenate([np.concatenate([R, t], 1), bottom], 0)
-    w2c_mats.append(m)
-
-  w2c_mats = np.stack(w2c_mats, 0)
-  # bounds_mats = np.stack(bounds_mats, 0)
-  c2w_mats = np.linalg.inv(w2c_mats)
-
+  perm = [
+      i
+      for i in perm[:upper_bound]
+      if "2_" not in names[i] and "1_" not in names[i]
+  ]
+
+  # inverse of [R | t], c2w = [R^T | -R^T t]
+  R_inv = read_model.qvecs2rotmats(qvecs[perm]).transpose(0, 2, 1)
+  c2w_mats = np.tile(np.eye(4), (len(perm), 1, 1))
+  c2w_mats[:, :3, :3] = R_inv
+  c2w_mats[:, :3, 3] = -(R_inv @ tvecs[perm][..., None])[..., 0]
+
+  if cache_path is not None:
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(cache_path + ".npy", c2w_mats)
   return c2w_mats
 
 
@@ -158,6 +163,15 @@ def align_trajectories(model, data):
 
 
 if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      "--gt_cache_dir",
+      type=str,
+      default=GT_CACHE_DIR,
+      help="cache of the parsed GT poses, empty to always parse images.bin",
+  )
+  args = parser.parse_args()
+
   scene_names = []
   scene_names += ["apple", "backpack", "block", "creeper"]
   scene_names += ["handwavy", "haru-sit", "mochi-high-five", "pillow"]
@@ -170,15 +184,17 @@ if __name__ == "__main__":
   rre = []
 
   for scene_name in scene_names:
-    gt_cam2w = load_colmap_data("%s/%s/dense" % (datapath, scene_name))
+    gt_cam2w = load_colmap_data(
+        "%s/%s/dense" % (datapath, scene_name), args.gt_cache_dir or None
+    )
 
-    poses = np.load(os.path.join(rootdir, scene_name, "poses.npy"))
+    recon = open_reconstruction(os.path.join(rootdir, scene_name))
+    poses = np.asarray(recon["poses"])
     cam_c2w = SE3(
         torch.as_tensor(poses, device="cpu")
     ).inv()  # .matrix().numpy()
 
     est_cam2w = cam_c2w.matrix().numpy()
-    num_cams = gt_cam2w.shape[0]
 
     assert gt_cam2w.shape[0] == est_cam2w.shape[0]
 
@@ -194,8 +210,7 @@ if __name__ == "__main__":
         scale * rot * est_cam2w[:, :3, 3].transpose(1, 0) + trans
     ).transpose(1, 0)
 
-    for k in range(num_cams):
-      est_cam2w[k, :3, :3] = rot @ est_cam2w[k, :3, :3]
+    est_cam2w[:, :3, :3] = np.asarray(rot) @ est_cam2w[:, :3, :3]
 
     traj_est_dict = [est_cam2w[i, ...] for i in range(est_cam2w.shape[0])]
     traj_gt_dict = [gt_cam2w[i, ...] for i in range(gt_cam2w.shape[0])]
@@ -16,13 +16,18 @@
 """Evaluate Sintel dataset."""
 
 # pylint: disable=invalid-name
+# pylint: disable=g-import-not-at-top
 
 import os
+import sys
 from evaluate_rpe import evaluate_trajectory
 from lietorch import SE3  # pylint: disable=g-importing-member
 import numpy as np
 import torch
 
+sys.path.append(os.path.realpath("."))
+from pipeline.reconstruction import open_reconstruction
+
 
 def rotmat2qvec(R):
   """Rotation matrix to quaternion."""
@@ -118,7 +123,8 @@ if __name__ == "__main__":
   for scene_name in scene_names:
     gt_path = os.path.join(gt_root_dir, scene_name, "extrinsics.npy")
     gt_cam2w = np.load(gt_path)
-    poses = np.load(os.path.join(rootdir, scene_name, "poses.npy"))
+    recon = open_reconstruction(os.path.join(rootdir, scene_name))
+    poses = np.asarray(recon["poses"])
     cam_c2w = SE3(
         torch.as_tensor(poses, device="cpu")
     ).inv()  # .matrix().numpy()
@@ -0,0 +1,32 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""MegaSaM pipeline orchestration, run from the repo root."""
+
+from pipeline.frames import FrameSource
+from pipeline.profiling import Profiler
+from pipeline.reconstruction import SceneReconstruction
+from pipeline.runner import Pipeline
+from pipeline.runner import STAGES
+from pipeline.scheduler import SceneScheduler
+
+__all__ = [
+    "FrameSource",
+    "Pipeline",
+    "Profiler",
+    "SceneReconstruction",
+    "SceneScheduler",
+    "STAGES",
+]
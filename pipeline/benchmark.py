@@ -0,0 +1,405 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmark suite of the pipeline stages on synthetic scenes.
+
+Times RAFT flow, a consistency_loss step (forward + backward), the CVD
+optimization, the COLMAP export and the trajectory evaluation on scenes from
+pipeline.synthetic, sweeping the frame count (at --size) and the resolution
+(at --num_frames), on GPU and CPU. RAFT runs with random weights unless
+--raft_checkpoint is set, which does not change its cost. CVD is GPU only.
+
+Usage (from the repo root):
+  python -m pipeline.benchmark --frames 16 32 64 --sizes 96x128 192x256 \
+    --output benchmark.json --plot benchmark.png
+"""
+
+# pylint: disable=g-import-not-at-top
+# pylint: disable=invalid-name
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+for path in ["cvd_opt", "cvd_opt/core", "evaluations_poses", "tools"]:
+  if path not in sys.path:
+    sys.path.append(path)
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from pipeline.synthetic import render_scene
+from pipeline.synthetic import scene_flows
+
+STEPS = (1, 2, 4, 8, 15)
+STAGES = ("raft_flow", "loss_step", "cvd", "colmap_export", "trajectory_eval")
+# stages that run on GPU, the others are timed on CPU only
+GPU_STAGES = ("raft_flow", "loss_step", "cvd")
+
+
+def get_parser():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      "--frames",
+      type=int,
+      nargs="+",
+      default=[16, 32, 64],
+      help="frame counts of the frame count sweep, at --size",
+  )
+  parser.add_argument(
+      "--sizes",
+      type=str,
+      nargs="+",
+      default=["96x128", "192x256", "384x512"],
+      help="HxW of the resolution sweep, at --num_frames",
+  )
+  parser.add_argument("--num_frames", type=int, default=32)
+  parser.add_argument("--size", type=str, default="192x256")
+  parser.add_argument(
+      "--stages", type=str, nargs="+", default=list(STAGES), choices=STAGES
+  )
+  parser.add_argument(
+      "--devices",
+      type=str,
+      nargs="+",
+      default=["cuda", "cpu"],
+      choices=["cuda", "cpu"],
+  )
+  parser.add_argument(
+      "--repeats", type=int, default=3, help="timed runs, the median is kept"
+  )
+  parser.add_argument("--cvd_steps", type=int, default=100)
+  parser.add_argument("--raft_checkpoint", type=str, default=None)
+  parser.add_argument("--output", type=str, default=None, help="JSON results")
+  parser.add_argument(
+      "--plot", type=str, default=None, help="image of the scaling curves"
+  )
+  return parser
+
+
+def parse_size(size):
+  h, w = size.lower().split("x")
+  return int(h), int(w)
+
+
+def frame_pairs(num_frames):
+  """(2, P) pairs of compute_flows, forward pairs at strides STEPS."""
+  ii = np.concatenate([np.arange(num_frames - s) for s in STEPS])
+  jj = np.concatenate([np.arange(s, num_frames) for s in STEPS])
+  return np.stack([ii, jj], axis=0)
+
+
+def cvd_inputs(scene):
+  """Inputs of cvd_opt.optimize, as produced by tracking and flow."""
+  from scipy.spatial.transform import Rotation
+
+  images = scene["images"].transpose(0, 3, 1, 2)
+  N, _, H, W = images.shape
+  K = scene["K"]
+
+  # mono disparity with a smooth per frame error, as after alignment
+  g = np.random.default_rng(0)
+  error = 1.0 + 0.1 * g.standard_normal((N, 1, 4, 4)).astype(np.float32)
+  error = F.interpolate(torch.from_numpy(error), (H, W), mode="bicubic")
+  disps = error[:, 0].numpy() / scene["depths"]
+
+  # droid poses are world to camera [t, q (xyzw)]
+  w2c = np.linalg.inv(scene["cam_c2w"])
+  quats = Rotation.from_matrix(w2c[:, :3, :3]).as_quat()
+  poses = np.concatenate([w2c[:, :3, 3], quats], axis=-1)
+
+  iijj = frame_pairs(N)
+  flows = scene_flows(scene, iijj[0], iijj[1])
+  flows = 0.5 * flows[..., ::2, ::2]
+  flow_masks = np.ones((flows.shape[0], 1) + flows.shape[-2:], dtype=bool)
+
+  static = 1.0 - scene["motion_masks"].astype(np.float32)
+  mot_prob = F.avg_pool2d(torch.from_numpy(static)[:, None], 8)[:, 0]
+
+  return {
+      "images": images,
+      "disps": np.float32(disps),
+      "intrinsics": np.tile([K[0, 0], K[1, 1], K[0, 2], K[1, 2]], (N, 1)),
+      "poses": np.float32(poses),
+      "mot_prob": mot_prob.numpy(),
+      "flows": np.float16(flows),
+      "flow_masks": flow_masks,
+      "iijj": iijj,
+  }
+
+
+def loss_inputs(scene, inputs, device):
+  """Inputs of a consistency_loss step, at half resolution as in CVD."""
+  K = torch.from_numpy(scene["K"]).float().clone()
+  K[:2] *= 0.5
+  disp = torch.from_numpy(inputs["disps"][:, ::2, ::2].copy())
+  fg_alpha = 1.0 - 0.8 * torch.from_numpy(
+      scene["motion_masks"][:, ::2, ::2].copy()
+  ).float()
+  tensors = {
+      "cam_c2w": torch.from_numpy(scene["cam_c2w"]).float(),
+      "K": K,
+      "K_inv": torch.linalg.inv(K),
+      "disp_data": disp,
+      "init_disp": disp,
+      "uncertainty": torch.full((disp.shape[0], 1) + disp.shape[1:], 0.2),
+      "flows": torch.from_numpy(inputs["flows"]).float(),
+      "flow_masks": torch.from_numpy(inputs["flow_masks"]).float(),
+      "ii": torch.from_numpy(inputs["iijj"][0]).long(),
+      "jj": torch.from_numpy(inputs["iijj"][1]).long(),
+      "fg_alpha": fg_alpha,
+  }
+  return {k: v.to(device) for k, v in tensors.items()}
+
+
+def evaluate_poses(gt_cam2w, est_cam2w):
+  """ATE, RTE and RRE as in evaluate_sintel.py."""
+  from evaluate_rpe import evaluate_trajectory
+  from evaluate_sintel import align_trajectories
+
+  gt_cam2w = gt_cam2w.copy()
+  est_cam2w = est_cam2w.copy()
+  full_t = np.dot(np.linalg.inv(gt_cam2w[-1]), gt_cam2w[0])
+  gt_cam2w[:, :3, 3] /= np.linalg.norm(full_t[:3, 3]) + 1e-8
+
+  rot, trans, trans_error, scale, _ = align_trajectories(
+      est_cam2w[:, :3, 3].T, gt_cam2w[:, :3, 3].T
+  )
+  est_cam2w[:, :3, 3] = (scale * rot * est_cam2w[:, :3, 3].T + trans).T
+  est_cam2w[:, :3, :3] = np.asarray(rot) @ est_cam2w[:, :3, :3]
+
+  rpe = np.array(
+      evaluate_trajectory(
+          list(gt_cam2w), list(est_cam2w), param_fixed_delta=True
+      )
+  )
+  return (
+      np.sqrt(np.mean(trans_error**2)),
+      np.sqrt(np.mean(rpe[:, 2] ** 2)),
+      np.rad2deg(np.sqrt(np.mean(rpe[:, 3] ** 2))),
+  )
+
+
+def stage_fn(stage, scene, device, args):
+  """Sets up stage on scene, returns a function running it once."""
+  if stage == "raft_flow":
+    import preprocess_flow
+    from raft import RAFT
+
+    flow_args = preprocess_flow.get_parser().parse_args([])
+    flow_args.mixed_precision = device == "cuda"
+    if args.raft_checkpoint is not None:
+      flow_args.model = args.raft_checkpoint
+      model = preprocess_flow.load_flow_model(flow_args).to(device)
+    else:
+      model = RAFT(flow_args).to(device).eval()
+    img_data = np.ascontiguousarray(
+        scene["images"][..., ::-1].transpose(0, 3, 1, 2)
+    )
+    return lambda: preprocess_flow.compute_flows(model, img_data, flow_args)
+
+  if stage == "loss_step":
+    from benchmark_cvd_loss import loss_and_grads
+    import cvd_opt
+    from geometry_utils import NormalGenerator
+
+    tensors = loss_inputs(scene, cvd_inputs(scene), device)
+    compute_normals = [NormalGenerator(*tensors["disp_data"].shape[1:])]
+    compute_normals = [m.to(device) for m in compute_normals]
+    targets = cvd_opt.consistency_targets(
+        tensors["init_disp"], tensors["K_inv"], compute_normals
+    )
+    return lambda: loss_and_grads(
+        cvd_opt.consistency_loss, tensors, compute_normals, targets
+    )
+
+  if stage == "cvd":
+    import cvd_opt
+
+    cvd_args = cvd_opt.get_parser().parse_args(
+        ["--schedule", "0.5:%d" % args.cvd_steps]
+    )
+    inputs = cvd_inputs(scene)
+    return lambda: cvd_opt.optimize(**inputs, args=cvd_args)
+
+  if stage == "colmap_export":
+    import convert_to_3dgs
+
+    rgb = scene["images"][..., ::-1]
+
+    def export():
+      with tempfile.TemporaryDirectory() as tmp:
+        convert_to_3dgs.write_cameras_binary(
+            os.path.join(tmp, "cameras.bin"),
+            rgb.shape[2],
+            rgb.shape[1],
+            scene["K"],
+        )
+        convert_to_3dgs.write_images_binary(
+            os.path.join(tmp, "images.bin"), rgb, scene["cam_c2w"]
+        )
+        convert_to_3dgs.write_points3D_from_depth(
+            os.path.join(tmp, "points3D.bin"),
+            rgb,
+            scene["depths"],
+            scene["cam_c2w"],
+            scene["K"],
+        )
+
+    return export
+
+  if stage == "trajectory_eval":
+    gt_cam2w = np.float64(scene["cam_c2w"])
+    est_cam2w = gt_cam2w.copy()
+    noise = np.random.default_rng(0).standard_normal((len(gt_cam2w), 3))
+    est_cam2w[:, :3, 3] = 2.0 * est_cam2w[:, :3, 3] + 0.01 * noise
+    return lambda: evaluate_poses(gt_cam2w, est_cam2w)
+
+  raise ValueError(f"Unknown stage {stage}")
+
+
+def sync(device):
+  if device == "cuda":
+    torch.cuda.synchronize()
+
+
+def timeit(fn, device, repeats):
+  """Median seconds of fn, after a warm-up run."""
+  fn()
+  times = []
+  for _ in range(repeats):
+    sync(device)
+    start = time.perf_counter()
+    fn()
+    sync(device)
+    times.append(time.perf_counter() - start)
+  return statistics.median(times)
+
+
+def run(args):
+  """Runs the sweeps, returns a list of result dicts."""
+  base_size = parse_size(args.size)
+  configs = [(n, base_size) for n in args.frames]
+  configs += [(args.num_frames, parse_size(s)) for s in args.sizes]
+  configs = sorted(set(configs))
+
+  devices = [
+      d for d in args.devices if d == "cpu" or torch.cuda.is_available()
+  ]
+  results = []
+  for num_frames, (h, w) in configs:
+    scene = render_scene(num_frames, h, w)
+    for device in devices:
+      for stage in args.stages:
+        if device == "cuda" and stage not in GPU_STAGES:
+          continue
+        if device == "cpu" and stage == "cvd":
+          continue
+        fn = stage_fn(stage, scene, device, args)
+        seconds = timeit(fn, device, args.repeats)
+        results.append({
+            "stage": stage,
+            "device": device,
+            "frames": num_frames,
+            "height": h,
+            "width": w,
+            "seconds": seconds,
+            "fps": num_frames / seconds,
+        })
+        print(
+            "%s %s %d frames %dx%d: %.3fs"
+            % (stage, device, num_frames, h, w, seconds)
+        )
+        del fn
+        if device == "cuda":
+          torch.cuda.empty_cache()
+  return results
+
+
+def report(results):
+  lines = [
+      "| stage | device | frames | size | s | frames/s |",
+      "|---|---|---|---|---|---|",
+  ]
+  for r in results:
+    lines.append(
+        "| %s | %s | %d | %dx%d | %.3f | %.1f |"
+        % (
+            r["stage"],
+            r["device"],
+            r["frames"],
+            r["height"],
+            r["width"],
+            r["seconds"],
+            r["fps"],
+        )
+    )
+  return "\n".join(lines)
+
+
+def plot(results, args, path):
+  """Scaling curves against frame count and resolution."""
+  import matplotlib
+
+  matplotlib.use("Agg")
+  import matplotlib.pyplot as plt
+
+  base_size = parse_size(args.size)
+  _, axes = plt.subplots(1, 2, figsize=(12, 4.5))
+  series = sorted({(r["stage"], r["device"]) for r in results})
+  for stage, device in series:
+    rs = [r for r in results if (r["stage"], r["device"]) == (stage, device)]
+    by_frames = sorted(
+        (r["frames"], r["seconds"])
+        for r in rs
+        if (r["height"], r["width"]) == base_size
+    )
+    by_pixels = sorted(
+        (r["height"] * r["width"], r["seconds"])
+        for r in rs
+        if r["frames"] == args.num_frames
+    )
+    label = "%s (%s)" % (stage, device)
+    if len(by_frames) > 1:
+      axes[0].plot(*zip(*by_frames), marker="o", label=label)
+    if len(by_pixels) > 1:
+      axes[1].plot(*zip(*by_pixels), marker="o", label=label)
+
+  axes[0].set_xlabel("frames (%dx%d)" % base_size)
+  axes[1].set_xlabel("pixels per frame (%d frames)" % args.num_frames)
+  for ax in axes:
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_ylabel("seconds")
+    ax.grid(True, which="both", alpha=0.3)
+  axes[1].legend(fontsize="small")
+  plt.tight_layout()
+  plt.savefig(path)
+
+
+if __name__ == "__main__":
+  args = get_parser().parse_args()
+  results = run(args)
+  print(report(results))
+  if args.output is not None:
+    with open(args.output, "w") as f:
+      json.dump({"args": vars(args), "results": results}, f, indent=1)
+  if args.plot is not None:
+    plot(results, args, args.plot)
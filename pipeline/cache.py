@@ -0,0 +1,155 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Content-addressed cache of the pipeline stage outputs.
+
+An artifact is keyed by the digest of what produced it: the keys of its
+inputs (the decoded frames or upstream artifacts), the stage config and the
+digests of the checkpoints. Keys of downstream stages are derived from the
+upstream keys, so e.g. changing only --w_grad changes the CVD key while the
+tracking and flow artifacts are reused.
+
+Artifacts are uncompressed .npz files, least recently used ones are evicted
+once the cache exceeds its disk quota.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# bump when a stage changes its outputs for the same inputs and config
+CACHE_VERSION = 2
+# root of the caches of derived dataset files, e.g. parsed GT poses, in the
+# repo rather than the working directory
+CACHE_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache"
+)
+
+_checkpoint_digests = {}
+
+
+def hash_frames(frames):
+  """Digest of a list of images (or any arrays)."""
+  h = hashlib.blake2b(digest_size=16)
+  for frame in frames:
+    frame = np.ascontiguousarray(frame)
+    h.update(str((frame.shape, frame.dtype.str)).encode())
+    h.update(memoryview(frame).cast("B"))
+  return h.hexdigest()
+
+
+def checkpoint_digest(path):
+  """Digest of a checkpoint file, memoized by path, size and mtime."""
+  stat = os.stat(path)
+  memo = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+  if memo not in _checkpoint_digests:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+      for block in iter(lambda: f.read(1 << 24), b""):
+        h.update(block)
+    _checkpoint_digests[memo] = h.hexdigest()
+  return _checkpoint_digests[memo]
+
+
+def config_dict(args, exclude=()):
+  """Config of an argparse namespace, without the arguments in exclude."""
+  return {k: v for k, v in sorted(vars(args).items()) if k not in exclude}
+
+
+def artifact_key(stage, inputs, config, checkpoints=()):
+  """Key of a stage artifact.
+
+  Args:
+    stage: stage name.
+    inputs: list of digests or keys of the stage inputs.
+    config: JSON serializable dict of the parameters of the stage.
+    checkpoints: list of checkpoint digests or model identifiers.
+
+  Returns:
+    hex digest.
+  """
+  payload = json.dumps(
+      {
+          "version": CACHE_VERSION,
+          "stage": stage,
+          "inputs": list(inputs),
+          "config": config,
+          "checkpoints": list(checkpoints),
+      },
+      sort_keys=True,
+      default=str,
+  )
+  return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class ArtifactCache:
+  """Directory of stage artifacts with LRU eviction under a disk quota."""
+
+  def __init__(self, root, quota_gb=50.0):
+    self.root = root
+    self.quota = int(quota_gb * 2**30)
+    self._lock = threading.Lock()
+    os.makedirs(root, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.root, key[:2], key + ".npz")
+
+  def get(self, key):
+    """Arrays of an artifact, or None if it is not cached."""
+    path = self._path(key)
+    try:
+      with np.load(path) as data:
+        arrays = {k: data[k] for k in data.files}
+    except (FileNotFoundError, OSError, ValueError):
+      return None
+    # mtime is the last use, atime is not reliable (noatime mounts)
+    os.utime(path)
+    return arrays
+
+  def put(self, key, arrays):
+    """Stores a dict of arrays under key, then enforces the quota."""
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.%d.tmp.npz" % (path[:-4], os.getpid(), threading.get_ident())
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    self.evict()
+
+  def evict(self):
+    """Removes least recently used artifacts until the quota is met."""
+    with self._lock:
+      entries = []
+      for path in glob.glob(os.path.join(self.root, "*", "*.npz")):
+        if path.endswith(".tmp.npz"):
+          continue
+        try:
+          stat = os.stat(path)
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+      total = sum(size for _, size, _ in entries)
+      for _, size, path in sorted(entries):
+        if total <= self.quota:
+          break
+        try:
+          os.remove(path)
+        except FileNotFoundError:
+          pass
+        total -= size
@@ -0,0 +1,276 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Frames of a scene, from a video file or a directory of images.
+
+FrameSource streams BGR frames (H, W, 3) uint8 directly from video
+containers, without extracting them to image files first, with start, end
+and stride selection and random access. It can be iterated several times
+and has a length, so it can be passed wherever a list of frames is used.
+
+Videos are decoded with PyAV when installed, which also reads the container
+tags (camera make and model) and the rotation (tag or display matrix) in the
+same open, and with OpenCV otherwise.
+"""
+
+import glob
+import math
+import os
+import struct
+
+import cv2
+
+try:
+  import av  # pylint: disable=g-import-not-at-top
+
+  HAS_AV = True
+except ImportError:
+  HAS_AV = False
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".avi", ".mkv", ".webm")
+
+_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def list_images(datapath):
+  """Frames of a scene, in the order used by the tracking scripts."""
+  image_list = sorted(glob.glob(os.path.join(datapath, "*.jpg")))
+  image_list += sorted(glob.glob(os.path.join(datapath, "*.png")))
+  return image_list
+
+
+def is_video(path):
+  return os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+class FrameSource:
+  """Frames [start:end:stride] of a video file or a directory of images.
+
+  Attributes:
+    metadata: dict with the fps, num_frames, width and height of the source
+      (before frame selection, width and height after rotation), its
+      rotation in degrees and the container tags (empty for images or
+      without PyAV).
+
+  Random access seeks the shared decoder, so it should not be interleaved
+  with an iteration, and a source is not thread safe.
+  """
+
+  def __init__(self, path, start=0, end=None, stride=1):
+    self.path = path
+    self.start = start
+    self.stride = stride
+    self._files = None
+    self._container = None
+    self._capture = None
+
+    if is_video(path):
+      if HAS_AV:
+        self._open_av()
+      else:
+        self._open_cv2()
+    else:
+      self._files = list_images(path)
+      if not self._files:
+        raise ValueError(f"No frames in {path}")
+      h, w = cv2.imread(self._files[0]).shape[:2]
+      self.metadata = {
+          "fps": None,
+          "num_frames": len(self._files),
+          "width": w,
+          "height": h,
+          "rotation": 0,
+          "tags": {},
+      }
+
+    num_frames = self.metadata["num_frames"]
+    self.end = num_frames if end is None else min(end, num_frames)
+
+  def _open_av(self):
+    self._container = av.open(self.path)
+    stream = self._container.streams.video[0]
+    stream.thread_type = "AUTO"
+    self._stream = stream
+
+    fps = float(stream.average_rate or stream.guessed_rate or 30)
+    num_frames = stream.frames
+    if not num_frames and stream.duration is not None:
+      num_frames = int(round(stream.duration * stream.time_base * fps))
+    if not num_frames:
+      # neither a frame count nor a duration, one packet per video frame
+      num_frames = sum(
+          1 for packet in self._container.demux(stream) if packet.size
+      )
+      self._rewind()
+    if not num_frames:
+      raise ValueError(f"No frames in {self.path}")
+
+    tags = dict(self._container.metadata)
+    tags.update(stream.metadata)
+    if "rotate" in tags:
+      rotation = float(tags["rotate"])
+    else:
+      # recent FFmpeg versions only export the display matrix side data
+      rotation = -self._display_rotation()
+    rotation = int(round(rotation / 90)) * 90 % 360
+    w, h = stream.codec_context.width, stream.codec_context.height
+    if rotation in (90, 270):
+      w, h = h, w
+    self.metadata = {
+        "fps": fps,
+        "num_frames": num_frames,
+        "width": w,
+        "height": h,
+        "rotation": rotation,
+        "tags": tags,
+    }
+
+  def _rewind(self):
+    start_time = self._stream.start_time or 0
+    self._container.seek(start_time, stream=self._stream, backward=True)
+
+  def _display_rotation(self):
+    """Counterclockwise rotation of the first frame's display matrix."""
+    for frame in self._container.decode(self._stream):
+      rotation = getattr(frame, "rotation", None)  # PyAV >= 14
+      if rotation is None:
+        side_data = frame.side_data.get("DISPLAYMATRIX")
+        if side_data is None:
+          rotation = 0
+        else:
+          # 3x3 int32 matrix, as av_display_rotation_get
+          m = struct.unpack("9i", bytes(side_data))
+          rotation = -math.degrees(
+              math.atan2(
+                  m[1] / math.hypot(m[1], m[4]),
+                  m[0] / math.hypot(m[0], m[3]),
+              )
+          )
+      self._rewind()
+      return rotation
+    return 0
+
+  def _open_cv2(self):
+    # OpenCV applies the rotation of the container itself
+    self._capture = cv2.VideoCapture(self.path)
+    if not self._capture.isOpened():
+      raise ValueError(f"Cannot open {self.path}")
+    self.metadata = {
+        "fps": self._capture.get(cv2.CAP_PROP_FPS),
+        "num_frames": int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "rotation": 0,
+        "tags": {},
+    }
+
+  def __len__(self):
+    return len(range(self.start, self.end, self.stride))
+
+  @property
+  def frame_names(self):
+    """File stems of the frames, or their 5 digit video frame index."""
+    indices = range(self.start, self.end, self.stride)
+    if self._files is not None:
+      return [
+          os.path.splitext(os.path.basename(self._files[i]))[0]
+          for i in indices
+      ]
+    return ["%05d" % i for i in indices]
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError(i)
+    index = self.start + i * self.stride
+    if self._files is not None:
+      return cv2.imread(self._files[index])
+    for _, frame in self._decode(index, index + 1):
+      return frame
+    raise IndexError(i)
+
+  def __iter__(self):
+    if self._files is not None:
+      for index in range(self.start, self.end, self.stride):
+        yield cv2.imread(self._files[index])
+      return
+    for _, frame in self._decode(self.start, self.end):
+      yield frame
+
+  def _decode(self, first, last):
+    """Yields (index, frame) of the selected frames in [first, last)."""
+    if self._container is not None:
+      yield from self._decode_av(first, last)
+    else:
+      yield from self._decode_cv2(first, last)
+
+  def _selected(self, index):
+    return index >= self.start and (index - self.start) % self.stride == 0
+
+  def _decode_av(self, first, last):
+    stream = self._stream
+    fps = self.metadata["fps"]
+    start_time = stream.start_time or 0
+    if first > 0:
+      # seeks to the keyframe before the frame, then decodes up to it
+      target = int(first / fps / stream.time_base) + start_time
+      self._container.seek(target, stream=stream, backward=True)
+    else:
+      self._rewind()
+
+    index = None
+    for frame in self._container.decode(stream):
+      if frame.pts is not None:
+        index = int(round((frame.pts - start_time) * stream.time_base * fps))
+      else:
+        index = 0 if index is None else index + 1
+      if index >= last:
+        return
+      if index < first or not self._selected(index):
+        continue
+      image = frame.to_ndarray(format="bgr24")
+      if self.metadata["rotation"]:
+        image = cv2.rotate(image, _ROTATIONS[self.metadata["rotation"]])
+      yield index, image
+
+  def _decode_cv2(self, first, last):
+    self._capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+    for index in range(first, last):
+      # frames in between are only demuxed, not converted
+      if not self._selected(index):
+        if not self._capture.grab():
+          return
+        continue
+      ok, image = self._capture.read()
+      if not ok:
+        return
+      yield index, image
+
+  def close(self):
+    if self._container is not None:
+      self._container.close()
+    if self._capture is not None:
+      self._capture.release()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
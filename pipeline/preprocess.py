@@ -0,0 +1,160 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Frame preprocessing shared by the tracking, flow and evaluation scripts.
+
+Frames are resized to about 384x512 pixels, keeping their aspect ratio, and
+cropped (bottom right) to a multiple of 8. FramePyramid computes this once
+per scene, optionally memory-mapped on disk, so that the tracking and flow
+stages of pipeline.runner (and pipeline.scheduler) and their reruns read the
+same preprocessed frames. The standalone scripts (test_demo.py,
+preprocess_flow.py, test_sintel.py, ...) resize their frames with resize_crop
+themselves and do not read it.
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+from pipeline.cache import hash_frames
+
+TRACKING_PIXELS = 384 * 512
+# frames are downsampled, area interpolation avoids aliasing
+INTERPOLATION = cv2.INTER_AREA
+
+
+def target_size(h0, w0, max_pixels=TRACKING_PIXELS):
+  """Size (h1, w1) of about max_pixels area, with the aspect of (h0, w0)."""
+  h1 = int(h0 * np.sqrt(max_pixels / (h0 * w0)))
+  w1 = int(w0 * np.sqrt(max_pixels / (h0 * w0)))
+  return h1, w1
+
+
+def crop_to_multiple(array, multiple=8):
+  """Crops the first two dimensions of an array to a multiple."""
+  h, w = array.shape[:2]
+  return array[: h - h % multiple, : w - w % multiple]
+
+
+def resize_crop(image, max_pixels=TRACKING_PIXELS, interpolation=None):
+  """Resizes an image (H, W, C) to target_size and crops it to a multiple of 8.
+
+  Args:
+    image: (H, W) or (H, W, C) image.
+    max_pixels: target area.
+    interpolation: cv2 interpolation, INTERPOLATION by default.
+
+  Returns:
+    resized and cropped image.
+  """
+  if interpolation is None:
+    interpolation = INTERPOLATION
+  h1, w1 = target_size(image.shape[0], image.shape[1], max_pixels)
+  image = cv2.resize(image, (w1, h1), interpolation=interpolation)
+  return crop_to_multiple(image)
+
+
+class FramePyramid:
+  """BGR frames at the tracking resolution.
+
+  Attributes:
+    tracking: (N, h, w, 3) uint8 frames, see resize_crop.
+    original_size: (h0, w0) of the source frames.
+  """
+
+  def __init__(self, tracking, original_size):
+    self.tracking = tracking
+    self.original_size = tuple(original_size)
+
+  def __len__(self):
+    return len(self.tracking)
+
+  @classmethod
+  def build(
+      cls, frames, path=None, max_pixels=TRACKING_PIXELS, frames_key=None
+  ):
+    """Preprocesses frames, streaming them one at a time.
+
+    Args:
+      frames: BGR frames (H, W, 3), a list or a FrameSource.
+      path: if set, directory of the memory-mapped frames, reused when it
+        holds the pyramid of the same frames.
+      max_pixels: area of the tracking level.
+      frames_key: hash_frames digest of frames, computed if None and path
+        is set.
+
+    Returns:
+      FramePyramid.
+    """
+    fingerprint = None
+    if path is not None:
+      if frames_key is None:
+        frames_key = hash_frames(frames)
+      fingerprint = {
+          "num_frames": len(frames),
+          "max_pixels": max_pixels,
+          "frames": frames_key,
+      }
+      pyramid = cls.load(path, fingerprint)
+      if pyramid is not None:
+        return pyramid
+      os.makedirs(path, exist_ok=True)
+      # an interrupted rebuild must not leave the previous index next to
+      # partly overwritten frames
+      index = os.path.join(path, "pyramid.json")
+      if os.path.exists(index):
+        os.remove(index)
+
+    h0, w0 = frames[0].shape[:2]
+    h1, w1 = target_size(h0, w0, max_pixels)
+    shape = (len(frames), h1 - h1 % 8, w1 - w1 % 8, 3)
+    if path is None:
+      tracking = np.empty(shape, dtype=np.uint8)
+    else:
+      tracking = np.lib.format.open_memmap(
+          os.path.join(path, "tracking.npy"),
+          mode="w+",
+          dtype=np.uint8,
+          shape=shape,
+      )
+
+    for t, frame in enumerate(frames):
+      tracking[t] = resize_crop(frame, max_pixels)
+
+    if path is not None:
+      tracking.flush()
+      # written last, a pyramid without it is incomplete
+      with open(os.path.join(path, "pyramid.json"), "w") as f:
+        json.dump(dict(fingerprint, original_size=[h0, w0]), f)
+      return cls.load(path, fingerprint)
+    return cls(tracking, (h0, w0))
+
+  @classmethod
+  def load(cls, path, fingerprint=None):
+    """Memory-maps a pyramid, None if missing or of other frames."""
+    try:
+      with open(os.path.join(path, "pyramid.json"), "r") as f:
+        meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+      return None
+    original_size = meta.pop("original_size")
+    if fingerprint is not None and meta != fingerprint:
+      return None
+    return cls(
+        np.load(os.path.join(path, "tracking.npy"), mmap_mode="r"),
+        original_size,
+    )
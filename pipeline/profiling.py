@@ -0,0 +1,200 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Lightweight profiling of the pipeline stages.
+
+Phases record wall time, frames/s, peak host RSS and peak device memory.
+Phases nest, and the peaks of a phase include the ones of its sub-phases.
+The device is synchronized at the phase boundaries so that wall times are
+those of the GPU work, which is why profiling is off unless requested.
+
+dump() writes a Chrome trace (chrome://tracing, ui.perfetto.dev) with a
+per phase summary:
+
+  {"traceEvents": [...], "summary": {name: {count, wall_s, fps, ...}}}
+
+With phases running in several threads (pipeline.scheduler), the memory
+peaks are those of the whole process during the phase: the peak counters are
+process wide, so they are folded into the phases open in every thread before
+each reset. The device synchronizations reduce the overlap of the stages.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+
+import torch
+
+
+def _host_peak():
+  """Peak resident set size in bytes, since the last _reset_host_peak."""
+  try:
+    with open("/proc/self/status", "r") as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _reset_host_peak():
+  # resets VmHWM on Linux >= 4.0, elsewhere peaks are since process start
+  try:
+    with open("/proc/self/clear_refs", "w") as f:
+      f.write("5")
+  except OSError:
+    pass
+
+
+class Profiler:
+  """Records nested phases, see phase()."""
+
+  def __init__(self, enabled=True):
+    self.enabled = enabled
+    self.events = []
+    self._lock = threading.Lock()
+    # id -> event of the phases open in all threads, guarded by _lock
+    self._open = {}
+    self._t0 = time.perf_counter()
+
+  def _fold_peaks(self):
+    """Folds the peaks so far into the open phases, before a reset."""
+    if not self._open:
+      return
+    host = _host_peak()
+    device = 0
+    if torch.cuda.is_available():
+      device = torch.cuda.max_memory_allocated()
+    for event in self._open.values():
+      event["peak_rss"] = max(event["peak_rss"], host)
+      event["peak_device"] = max(event["peak_device"], device)
+
+  @contextlib.contextmanager
+  def phase(self, name, frames=None):
+    """Context manager recording a phase.
+
+    Args:
+      name: phase name, phases with the same name are summed in the summary.
+      frames: number of frames processed by the phase, for frames/s.
+
+    Yields:
+      None.
+    """
+    if not self.enabled:
+      yield
+      return
+
+    cuda = torch.cuda.is_available()
+    if cuda:
+      torch.cuda.synchronize()
+    event = {"name": name, "frames": frames, "peak_rss": 0, "peak_device": 0}
+    with self._lock:
+      self._fold_peaks()
+      _reset_host_peak()
+      if cuda:
+        torch.cuda.reset_peak_memory_stats()
+      self._open[id(event)] = event
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      if cuda:
+        torch.cuda.synchronize()
+      end = time.perf_counter()
+
+      event["start"] = start - self._t0
+      event["wall"] = end - start
+      event["tid"] = threading.get_ident()
+      with self._lock:
+        self._fold_peaks()
+        del self._open[id(event)]
+        self.events.append(event)
+
+  def summary(self):
+    """Totals per phase name, in order of first occurrence."""
+    summary = collections.OrderedDict()
+    for event in sorted(self.events, key=lambda e: e["start"]):
+      s = summary.setdefault(
+          event["name"],
+          {
+              "count": 0,
+              "wall_s": 0.0,
+              "frames": 0,
+              "peak_rss_mb": 0.0,
+              "peak_device_mb": 0.0,
+          },
+      )
+      s["count"] += 1
+      s["wall_s"] += event["wall"]
+      s["frames"] += event["frames"] or 0
+      s["peak_rss_mb"] = max(s["peak_rss_mb"], event["peak_rss"] / 2**20)
+      s["peak_device_mb"] = max(
+          s["peak_device_mb"], event["peak_device"] / 2**20
+      )
+    for s in summary.values():
+      s["fps"] = s["frames"] / s["wall_s"] if s["frames"] else None
+    return summary
+
+  def report(self):
+    """Markdown table of the summary."""
+    lines = [
+        "| phase | count | wall s | frames/s | peak RSS MB | peak device MB |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name, s in self.summary().items():
+      fps = "-" if s["fps"] is None else "%.2f" % s["fps"]
+      lines.append(
+          "| %s | %d | %.3f | %s | %.0f | %.0f |"
+          % (
+              name,
+              s["count"],
+              s["wall_s"],
+              fps,
+              s["peak_rss_mb"],
+              s["peak_device_mb"],
+          )
+      )
+    return "\n".join(lines)
+
+  def dump(self, path):
+    """Writes the Chrome trace events and the summary as JSON."""
+    trace = []
+    for event in self.events:
+      args = {
+          "frames": event["frames"],
+          "peak_rss_mb": event["peak_rss"] / 2**20,
+          "peak_device_mb": event["peak_device"] / 2**20,
+      }
+      if event["frames"]:
+        args["fps"] = event["frames"] / max(event["wall"], 1e-9)
+      trace.append({
+          "name": event["name"],
+          "ph": "X",
+          "ts": event["start"] * 1e6,
+          "dur": event["wall"] * 1e6,
+          "pid": os.getpid(),
+          "tid": event["tid"],
+          "args": args,
+      })
+
+    if os.path.dirname(path):
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      json.dump({"traceEvents": trace, "summary": self.summary()}, f, indent=1)
@@ -0,0 +1,451 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Scene reconstruction container of the tracking and CVD outputs.
+
+A container is a directory with a scene.json index and one subdirectory per
+per frame field, holding chunks of CHUNK_FRAMES frames as .npy files:
+
+  reconstructions/<scene>/         tracking: images, disps, poses,
+                                   intrinsics, motion_prob, cam_c2w, intrinsic
+  <output_dir>/<scene>_sgd_cvd_hr/ CVD: depths, cam_c2w, intrinsic, and
+                                   images linked to the tracking container
+
+Fields are read lazily, chunk by chunk, from memory-mapped files. Depths and
+disparities are stored as float32, or with --depth_encoding as float16 or
+log-quantized uint16 (lossy, half the size), images are stored once as
+(N, 3, H, W) uint8 BGR and referenced by the CVD container.
+
+open_reconstruction and load_outputs also read the previous layout, .npy
+files per field in reconstructions/<scene> and _droid.npz or _sgd_cvd_hr.npz
+outputs.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+# 2: float32 encoding
+FORMAT_VERSION = 2
+CHUNK_FRAMES = 64
+
+ENCODINGS = ("raw", "float32", "float16", "log_uint16")
+# lossless depth encoding, float16 and log_uint16 (relative error of 2e-4 over
+# LOG_RANGE) halve the size
+DEPTH_ENCODING = "float32"
+# range of the log-quantized values, depths or disparities
+LOG_RANGE = (1e-6, 1e6)
+
+
+def _encode(frames, encoding, log_range):
+  if encoding == "raw":
+    return frames
+  if encoding == "float32":
+    return np.float32(frames)
+  if encoding == "float16":
+    return np.float16(frames)
+  lo, hi = np.log(log_range[0]), np.log(log_range[1])
+  frames = np.asarray(frames, dtype=np.float64)
+  t = (np.log(np.clip(frames, *log_range)) - lo) / (hi - lo)
+  # code 0 is reserved for zero (invalid) values
+  return np.where(frames > 0, 1 + np.round(t * 65534), 0).astype(np.uint16)
+
+
+def _decode(frames, encoding, log_range):
+  if encoding == "raw":
+    return np.array(frames)
+  if encoding in ("float32", "float16"):
+    return np.float32(frames)
+  lo, hi = np.log(log_range[0]), np.log(log_range[1])
+  values = np.exp(lo + (np.float32(frames) - 1) / 65534 * (hi - lo))
+  return np.where(frames > 0, values, 0).astype(np.float32)
+
+
+class FrameField:
+  """Lazy per frame field, indexed like an array of frames.
+
+  Integer, slice and index array lookups only read and decode the chunks of
+  the selected frames, iterating reads one chunk at a time.
+  """
+
+  def __init__(self, path, meta):
+    self.path = path
+    self.meta = meta
+    self.shape = (meta["num_frames"],) + tuple(meta["frame_shape"])
+    self.dtype = np.dtype(meta["dtype"])
+    self._chunk_frames = meta["chunk_frames"]
+
+  def __len__(self):
+    return self.shape[0]
+
+  def _chunk(self, c):
+    return np.load(os.path.join(self.path, "%05d.npy" % c), mmap_mode="r")
+
+  def _decode(self, frames):
+    return _decode(frames, self.meta["encoding"], self.meta.get("log_range"))
+
+  def __getitem__(self, index):
+    if isinstance(index, (int, np.integer)):
+      if index < 0:
+        index += len(self)
+      if not 0 <= index < len(self):
+        raise IndexError(index)
+      c, i = divmod(int(index), self._chunk_frames)
+      return self._decode(self._chunk(c)[i])
+
+    indices = np.arange(len(self))[index]
+    out = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+    chunks = indices // self._chunk_frames
+    for c in np.unique(chunks):
+      selected = chunks == c
+      out[selected] = self._decode(
+          self._chunk(c)[indices[selected] % self._chunk_frames]
+      )
+    return out
+
+  def __iter__(self):
+    for c in range(self.meta["num_chunks"]):
+      yield from self._decode(self._chunk(c))
+
+  def __array__(self, dtype=None, copy=None):
+    del copy
+    array = self[:]
+    return array if dtype is None else array.astype(dtype)
+
+
+class SceneWriter:
+  """Writes a scene container, frames are streamed chunk by chunk.
+
+  scene.json is written on close, so an interrupted container is not read
+  as a complete one. Fields of a previous container at path are replaced.
+  """
+
+  def __init__(self, path, chunk_frames=CHUNK_FRAMES):
+    self.path = path
+    self.chunk_frames = chunk_frames
+    self._fields = {}
+    self._arrays = {}
+
+    index = os.path.join(path, "scene.json")
+    if os.path.exists(index):
+      with open(index, "r") as f:
+        previous = json.load(f)
+      os.remove(index)
+      for name, meta in previous["fields"].items():
+        if meta["kind"] == "frames":
+          shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+  def write_frames(self, name, frames, encoding="raw", log_range=LOG_RANGE):
+    """Writes a per frame field.
+
+    Args:
+      name: field name.
+      frames: iterable of frames, e.g. an array, a list or a generator.
+      encoding: one of ENCODINGS.
+      log_range: (min, max) of the values for log_uint16.
+    """
+    if encoding not in ENCODINGS:
+      raise ValueError(f"Unknown encoding {encoding}")
+    field_dir = os.path.join(self.path, name)
+    shutil.rmtree(field_dir, ignore_errors=True)
+    os.makedirs(field_dir)
+
+    meta = {
+        "kind": "frames",
+        "encoding": encoding,
+        "chunk_frames": self.chunk_frames,
+        "num_frames": 0,
+        "num_chunks": 0,
+    }
+    if encoding == "log_uint16":
+      meta["log_range"] = list(log_range)
+
+    def flush(chunk):
+      np.save(
+          os.path.join(field_dir, "%05d.npy" % meta["num_chunks"]),
+          _encode(np.stack(chunk), encoding, log_range),
+      )
+      meta["num_frames"] += len(chunk)
+      meta["num_chunks"] += 1
+
+    chunk = []
+    for frame in frames:
+      frame = np.asarray(frame)
+      if "frame_shape" not in meta:
+        meta["frame_shape"] = list(frame.shape)
+        meta["dtype"] = frame.dtype.str if encoding == "raw" else "<f4"
+      chunk.append(frame)
+      if len(chunk) == self.chunk_frames:
+        flush(chunk)
+        chunk = []
+    if chunk:
+      flush(chunk)
+    if not meta["num_frames"]:
+      raise ValueError(f"No frames in field {name}")
+    self._fields[name] = meta
+
+  def write_array(self, name, array):
+    """Writes a small field stored in scene.json, e.g. a shared K."""
+    array = np.asarray(array)
+    self._fields[name] = {"kind": "array", "dtype": array.dtype.str}
+    self._arrays[name] = array.tolist()
+
+  def link(self, name, container, field=None):
+    """References the field of another container instead of copying it."""
+    target = os.path.relpath(os.path.abspath(container), self.path)
+    self._fields[name] = {
+        "kind": "link",
+        "container": target,
+        "field": field or name,
+    }
+
+  def close(self):
+    with open(os.path.join(self.path, "scene.json"), "w") as f:
+      json.dump(
+          {
+              "version": FORMAT_VERSION,
+              "fields": self._fields,
+              "arrays": self._arrays,
+          },
+          f,
+      )
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc):
+    if exc_type is None:
+      self.close()
+
+
+class SceneReconstruction:
+  """Read-only scene container, fields are loaded on access.
+
+  Per frame fields are FrameField, small fields are arrays. Directories of
+  .npy files (the previous reconstructions layout) are read as containers
+  whose fields are memory-mapped arrays.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    index = os.path.join(path, "scene.json")
+    if os.path.exists(index):
+      with open(index, "r") as f:
+        index = json.load(f)
+      if index["version"] > FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has format version {index['version']}, this code reads"
+            f" up to {FORMAT_VERSION}"
+        )
+      self._fields = index["fields"]
+      self._arrays = index["arrays"]
+    else:
+      names = sorted(
+          os.path.splitext(name)[0]
+          for name in os.listdir(path)
+          if name.endswith(".npy")
+      )
+      if not names:
+        raise FileNotFoundError(f"No scene reconstruction in {path}")
+      self._fields = {name: {"kind": "npy"} for name in names}
+      self._arrays = {}
+    self._loaded = {}
+
+  def keys(self):
+    return self._fields.keys()
+
+  def __contains__(self, name):
+    return name in self._fields
+
+  def __getitem__(self, name):
+    if name not in self._loaded:
+      self._loaded[name] = self._load(name)
+    return self._loaded[name]
+
+  def _load(self, name):
+    meta = self._fields[name]
+    if meta["kind"] == "frames":
+      return FrameField(os.path.join(self.path, name), meta)
+    if meta["kind"] == "array":
+      return np.array(self._arrays[name], dtype=meta["dtype"])
+    if meta["kind"] == "link":
+      container = os.path.join(self.path, meta["container"])
+      return SceneReconstruction(container)[meta["field"]]
+    return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+
+def open_reconstruction(path):
+  """Opens a container, or a legacy .npz output, both loaded lazily.
+
+  Args:
+    path: container directory, or .npz file (tried with an .npz extension
+      if path does not exist).
+
+  Returns:
+    SceneReconstruction, or NpzFile for .npz files.
+  """
+  if not os.path.exists(path) and os.path.exists(path + ".npz"):
+    path += ".npz"
+  if path.endswith(".npz"):
+    return np.load(path)
+  return SceneReconstruction(path)
+
+
+def save_tracking(
+    path,
+    images,
+    disps,
+    poses,
+    intrinsics,
+    motion_prob,
+    cam_c2w,
+    depth_encoding=DEPTH_ENCODING,
+):
+  """Writes the tracking outputs of a scene.
+
+  Args:
+    path: container directory, reconstructions/<scene>.
+    images: (N, 3, H, W) uint8 BGR frames, or an iterable of frames.
+    disps: (N, H, W) disparities, or an iterable of them.
+    poses: (N, 7) world to camera poses.
+    intrinsics: (N, 4) fx, fy, cx, cy.
+    motion_prob: (N, H / 8, W / 8) motion probabilities.
+    cam_c2w: (N, 4, 4) camera to world matrices.
+    depth_encoding: encoding of the disparities.
+  """
+  intrinsics = np.asarray(intrinsics)
+  K = np.eye(3)
+  K[0, 0], K[1, 1], K[0, 2], K[1, 2] = intrinsics[0]
+
+  with SceneWriter(path) as writer:
+    writer.write_frames("images", images)
+    writer.write_frames("disps", disps, encoding=depth_encoding)
+    writer.write_frames("motion_prob", motion_prob, encoding="float16")
+    writer.write_frames("poses", poses)
+    writer.write_frames("intrinsics", intrinsics)
+    writer.write_frames("cam_c2w", cam_c2w)
+    writer.write_array("intrinsic", K)
+
+
+def save_outputs(
+    path, outputs, images_from=None, depth_encoding=DEPTH_ENCODING
+):
+  """Writes the CVD outputs of a scene.
+
+  Args:
+    path: container directory, <output_dir>/<scene>_sgd_cvd_hr.
+    outputs: dict with images (N, H, W, 3) RGB, depths, intrinsic and
+      cam_c2w, see cvd_opt.optimize.
+    images_from: tracking container whose images are referenced instead of
+      storing them again.
+    depth_encoding: encoding of the depths.
+  """
+  with SceneWriter(path) as writer:
+    if images_from is not None:
+      writer.link("images", images_from)
+    else:
+      writer.write_frames(
+          "images",
+          (image[..., ::-1].transpose(2, 0, 1) for image in outputs["images"]),
+      )
+    writer.write_frames("depths", outputs["depths"], encoding=depth_encoding)
+    writer.write_frames("cam_c2w", outputs["cam_c2w"])
+    writer.write_array("intrinsic", outputs["intrinsic"])
+
+
+def _poses_to_cam_c2w(poses):
+  """(N, 4, 4) camera to world matrices of (N, 7) world to camera poses.
+
+  Args:
+    poses: tx, ty, tz, qx, qy, qz, qw poses, as lietorch SE3.
+
+  Returns:
+    (N, 4, 4) float64 matrices.
+  """
+  poses = np.asarray(poses, dtype=np.float64)
+  t, q = poses[:, :3], poses[:, 3:]
+  q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+  x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+  rot = np.empty((len(poses), 3, 3))
+  rot[:, 0, 0] = 1 - 2 * (y * y + z * z)
+  rot[:, 0, 1] = 2 * (x * y - z * w)
+  rot[:, 0, 2] = 2 * (x * z + y * w)
+  rot[:, 1, 0] = 2 * (x * y + z * w)
+  rot[:, 1, 1] = 1 - 2 * (x * x + z * z)
+  rot[:, 1, 2] = 2 * (y * z - x * w)
+  rot[:, 2, 0] = 2 * (x * z - y * w)
+  rot[:, 2, 1] = 2 * (y * z + x * w)
+  rot[:, 2, 2] = 1 - 2 * (x * x + y * y)
+  cam_c2w = np.tile(np.eye(4), (len(poses), 1, 1))
+  cam_c2w[:, :3, :3] = rot.transpose(0, 2, 1)
+  cam_c2w[:, :3, 3] = -np.einsum("nji,nj->ni", rot, t)
+  return cam_c2w
+
+
+def load_outputs(path):
+  """Loads the outputs of a tracking or CVD container.
+
+  Legacy inputs without some fields are completed: cam_c2w from the poses
+  (4x4 matrices, or SE3 of the reconstructions .npy layout) and intrinsic
+  from the per frame intrinsics.
+
+  Args:
+    path: container directory, legacy reconstructions/<scene> directory, or
+      legacy _droid.npz or _sgd_cvd_hr.npz file (tried with an .npz
+      extension if path does not exist).
+
+  Returns:
+    dict with images (N, H, W, 3) uint8 RGB, depths (N, H, W) float32 or
+    None if the outputs have neither depths nor disparities, intrinsic
+    (3, 3) and cam_c2w (N, 4, 4).
+
+  Raises:
+    KeyError: if the outputs have no camera poses or intrinsics.
+  """
+  recon = open_reconstruction(path)
+  depths = None
+  if "depths" in recon:
+    depths = np.asarray(recon["depths"], dtype=np.float32)
+  elif "disps" in recon:
+    depths = 1.0 / np.asarray(recon["disps"], dtype=np.float32)
+  images = np.asarray(recon["images"])
+  if isinstance(recon, SceneReconstruction):
+    images = images[:, ::-1].transpose(0, 2, 3, 1)
+
+  if "cam_c2w" in recon:
+    cam_c2w = np.asarray(recon["cam_c2w"])
+  elif "poses" in recon:
+    cam_c2w = np.asarray(recon["poses"])
+    if cam_c2w.shape[-1] == 7:
+      cam_c2w = _poses_to_cam_c2w(cam_c2w)
+  else:
+    raise KeyError(f"{path} has neither cam_c2w nor poses")
+
+  if "intrinsic" in recon:
+    K = np.asarray(recon["intrinsic"])
+  elif "intrinsics" in recon:
+    K = np.eye(3)
+    K[0, 0], K[1, 1], K[0, 2], K[1, 2] = np.asarray(recon["intrinsics"])[0]
+  else:
+    raise KeyError(f"{path} has neither intrinsic nor intrinsics")
+  return {
+      "images": images,
+      "depths": depths,
+      "intrinsic": K,
+      "cam_c2w": cam_c2w,
+  }
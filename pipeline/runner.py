@@ -0,0 +1,562 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Single process MegaSaM pipeline: mono depth, tracking, flow and CVD.
+
+Frames are decoded once, stages hand their outputs to the next one in memory
+and models stay loaded across scenes. Writing the per stage files of the
+standalone scripts is optional (--save), so that any stage can still be
+rerun or inspected on its own.
+
+Usage (from the repo root), stage options are forwarded to the stage scripts:
+  python -m pipeline.runner --scene_name swing --datapath DAVIS/swing \
+    --weights checkpoints/megasam_final.pth --w_grad 2.0 --w_normal 5.0
+"""
+
+# pylint: disable=g-import-not-at-top
+# pylint: disable=g-bad-import-order
+
+import argparse
+import gc
+import os
+import sys
+
+for path in [
+    "base/droid_slam",
+    "camera_tracking_scripts",
+    "cvd_opt",
+    "cvd_opt/core",
+    "Depth-Anything",
+    "UniDepth",
+]:
+  if path not in sys.path:
+    sys.path.append(path)
+
+import cv2
+import numpy as np
+from pathlib import Path  # pylint: disable=g-importing-member
+import torch
+
+from pipeline.cache import ArtifactCache
+from pipeline.cache import artifact_key
+from pipeline.cache import checkpoint_digest
+from pipeline.cache import config_dict
+from pipeline.cache import hash_frames
+from pipeline.frames import FrameSource
+from pipeline.preprocess import FramePyramid
+from pipeline.preprocess import TRACKING_PIXELS
+from pipeline.profiling import Profiler
+from pipeline.reconstruction import save_outputs
+
+STAGES = ("mono_depth", "tracking", "flow", "cvd")
+
+UNIDEPTH_MODEL = "lpiccinelli/unidepth-v2-vitl14"
+UNIDEPTH_REVISION = "1d0d3c52f60b5164629d279bb9a7546458e6dcc4"
+
+# stage arguments that do not change the stage outputs, checkpoint paths are
+# keyed by their digest instead
+UNKEYED_ARGS = (
+    "datapath",
+    "depth_encoding",
+    "disable_vis",
+    "image_size",
+    "metric_depth_path",
+    "model",
+    "mono_depth_path",
+    "output_dir",
+    "path",
+    "scene_name",
+    "weights",
+)
+
+
+def get_parser():
+  """Pipeline arguments, the stage arguments are parsed by each stage."""
+  # all parsers read the same argv, an abbreviation of one parser's option
+  # would silently match another parser's option
+  parser = argparse.ArgumentParser(allow_abbrev=False)
+  parser.add_argument("--scene_name", type=str, help="scene name")
+  parser.add_argument(
+      "--datapath", type=str, help="directory of frames or video file"
+  )
+  parser.add_argument("--start", type=int, default=0, help="first frame")
+  parser.add_argument("--end", type=int, default=None, help="last frame + 1")
+  parser.add_argument("--stride", type=int, default=1, help="frame stride")
+  parser.add_argument(
+      "--save",
+      type=str,
+      nargs="*",
+      default=["cvd"],
+      choices=STAGES,
+      help="stages whose outputs are written to the standalone script paths",
+  )
+  parser.add_argument(
+      "--da_checkpoint",
+      type=str,
+      default="Depth-Anything/checkpoints/depth_anything_vitl14.pth",
+  )
+  parser.add_argument("--da_encoder", type=str, default="vitl")
+  parser.add_argument(
+      "--mono_depth_path", default="Depth-Anything/video_visualization"
+  )
+  parser.add_argument("--metric_depth_path", default="UniDepth/outputs")
+  parser.add_argument(
+      "--tier",
+      type=str,
+      default="standard",
+      help="UniDepthV2 inference tier, see INFERENCE_TIERS (draft, standard"
+      " or high)",
+  )
+  parser.add_argument(
+      "--cache_dir",
+      type=str,
+      default=None,
+      help="content-addressed cache of the stage outputs, reused when the"
+      " frames, checkpoints and stage arguments are unchanged",
+  )
+  parser.add_argument(
+      "--cache_quota",
+      type=float,
+      default=50.0,
+      help="GB, least recently used cached outputs are evicted above it",
+  )
+  parser.add_argument(
+      "--frame_cache",
+      type=str,
+      default=None,
+      help="directory of the memory-mapped preprocessed frames of each scene,"
+      " reused by the tracking and flow stages and across runs",
+  )
+  parser.add_argument(
+      "--profile",
+      type=str,
+      default=None,
+      help="JSON/Chrome trace file of the wall time, frames/s and peak"
+      " memory of every stage and sub-phase",
+  )
+  return parser
+
+
+class Pipeline:
+  """Runs the MegaSaM stages of scenes in one process.
+
+  Models are loaded on first use and kept for the following scenes. Stage
+  arguments are the ones of the standalone scripts (test_demo.py,
+  preprocess_flow.py and cvd_opt.py), parsed from the same argv.
+  """
+
+  def __init__(self, argv=None):
+    import test_demo
+    import preprocess_flow
+    import cvd_opt
+    from unidepth.models.unidepthv2 import INFERENCE_TIERS
+
+    self.args, _ = get_parser().parse_known_args(argv)
+    # checked here rather than with choices, UniDepth is only imported by a
+    # Pipeline
+    if self.args.tier not in INFERENCE_TIERS:
+      get_parser().error(
+          "argument --tier: invalid choice: %r (choose from %s)"
+          % (self.args.tier, ", ".join(INFERENCE_TIERS))
+      )
+
+    tracking_parser = test_demo.get_parser()
+    tracking_parser.set_defaults(weights="checkpoints/megasam_final.pth")
+    self.tracking_args, _ = tracking_parser.parse_known_args(argv)
+    self.tracking_args.disable_vis = True
+
+    flow_parser = preprocess_flow.get_parser()
+    flow_parser.set_defaults(
+        model="cvd_opt/raft-things.pth", mixed_precision=True
+    )
+    self.flow_args, _ = flow_parser.parse_known_args(argv)
+
+    self.cvd_args, _ = cvd_opt.get_parser().parse_known_args(argv)
+
+    self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    self._models = {}
+    self.cache = None
+    if self.args.cache_dir is not None:
+      self.cache = ArtifactCache(self.args.cache_dir, self.args.cache_quota)
+    self.profiler = Profiler(enabled=self.args.profile is not None)
+
+  def stage_keys(self, frames):
+    """Cache keys of the stage outputs and frames of a scene.
+
+    Stage keys are None without a cache, the frames key (hash_frames digest,
+    also validating the frame cache) without either cache.
+    """
+    keys = dict.fromkeys(STAGES + ("frames",))
+    if self.cache is None and self.args.frame_cache is None:
+      return keys
+
+    frames_key = hash_frames(frames)
+    keys["frames"] = frames_key
+    if self.cache is None:
+      return keys
+
+    keys["mono_depth"] = artifact_key(
+        "mono_depth",
+        [frames_key],
+        {"da_encoder": self.args.da_encoder, "tier": self.args.tier},
+        [
+            checkpoint_digest(self.args.da_checkpoint),
+            UNIDEPTH_MODEL,
+            UNIDEPTH_REVISION,
+        ],
+    )
+    keys["tracking"] = artifact_key(
+        "tracking",
+        [frames_key, keys["mono_depth"]],
+        config_dict(self.tracking_args, UNKEYED_ARGS),
+        [checkpoint_digest(self.tracking_args.weights)],
+    )
+    keys["flow"] = artifact_key(
+        "flow",
+        [frames_key],
+        config_dict(self.flow_args, UNKEYED_ARGS),
+        [checkpoint_digest(self.flow_args.model)],
+    )
+    keys["cvd"] = artifact_key(
+        "cvd",
+        [keys["tracking"], keys["flow"]],
+        config_dict(self.cvd_args, UNKEYED_ARGS),
+    )
+    return keys
+
+  def _cache_get(self, key):
+    if self.cache is None or key is None:
+      return None
+    return self.cache.get(key)
+
+  def _cache_put(self, key, arrays):
+    if self.cache is not None and key is not None:
+      self.cache.put(key, {k: np.asarray(v) for k, v in arrays.items()})
+
+  def _model(self, name):
+    """Loads a model once, they are reused across scenes."""
+    if name in self._models:
+      return self._models[name]
+
+    if name == "depth_anything":
+      from depth_anything.dpt import load_dpt_dinov2
+      import run_videos
+
+      model = load_dpt_dinov2(
+          self.args.da_checkpoint,
+          encoder=self.args.da_encoder,
+          device=self.device,
+      )
+      model = (model, run_videos.build_transform(model))
+    elif name == "unidepth":
+      from unidepth.models import UniDepthV2
+
+      model = UniDepthV2.from_pretrained(
+          UNIDEPTH_MODEL, revision=UNIDEPTH_REVISION
+      )
+      model = model.to(self.device).eval()
+    elif name == "raft":
+      import preprocess_flow
+
+      model = preprocess_flow.load_flow_model(self.flow_args)
+    else:
+      raise ValueError(f"Unknown model {name}")
+
+    self._models[name] = model
+    return model
+
+  def mono_depth(self, frames, scene_name=None, key=None):
+    """Depth-Anything disparities and UniDepth metric depths and fovs.
+
+    Args:
+      frames: list of BGR images (H, W, 3).
+      scene_name: if set and "mono_depth" is saved, where outputs are saved.
+      key: cache key, see stage_keys.
+
+    Returns:
+      da_disps, metric_depths and fovs lists, one entry per frame.
+    """
+    with self.profiler.phase("mono_depth", frames=len(frames)):
+      cached = self._cache_get(key)
+      if cached is not None:
+        da_disps = list(cached["da_disps"])
+        metric_depths = list(cached["metric_depths"])
+        fovs = list(cached["fovs"])
+      else:
+        da_disps, metric_depths, fovs = self._predict_priors(frames)
+        self._cache_put(
+            key,
+            {
+                "da_disps": np.stack(da_disps),
+                "metric_depths": np.stack(metric_depths),
+                "fovs": np.stack(fovs),
+            },
+        )
+
+    if scene_name is not None and "mono_depth" in self.args.save:
+      da_dir = os.path.join(self.args.mono_depth_path, scene_name)
+      uni_dir = os.path.join(self.args.metric_depth_path, scene_name)
+      Path(da_dir).mkdir(parents=True, exist_ok=True)
+      Path(uni_dir).mkdir(parents=True, exist_ok=True)
+      for t, (da_disp, depth, fov) in enumerate(
+          zip(da_disps, metric_depths, fovs)
+      ):
+        np.save(os.path.join(da_dir, "%05d.npy" % t), da_disp)
+        np.savez(os.path.join(uni_dir, "%05d.npz" % t), depth=depth, fov=fov)
+    return da_disps, metric_depths, fovs
+
+  def _predict_priors(self, frames):
+    """Runs Depth-Anything and UniDepth on frames."""
+    import run_videos
+    from unidepth.models.unidepthv2 import INFERENCE_TIERS
+
+    depth_anything, transform = self._model("depth_anything")
+    unidepth = self._model("unidepth")
+    long_dim = INFERENCE_TIERS[self.args.tier]["long_dim"]
+
+    da_disps, metric_depths, fovs = [], [], []
+    with self.profiler.phase("mono_depth/depth_anything", frames=len(frames)):
+      for frame in frames:
+        da_disp = run_videos.predict_disparity(
+            depth_anything, transform, frame, self.device
+        )
+        da_disps.append(np.float32(da_disp.cpu().numpy()))
+
+    with self.profiler.phase("mono_depth/unidepth", frames=len(frames)):
+      for frame in frames:
+        rgb = np.ascontiguousarray(frame[..., ::-1])
+        if long_dim is not None:
+          scale = long_dim / max(rgb.shape[:2])
+          rgb = cv2.resize(
+              rgb,
+              (
+                  int(round(rgb.shape[1] * scale)),
+                  int(round(rgb.shape[0] * scale)),
+              ),
+          )
+        predictions = unidepth.infer(
+            torch.from_numpy(rgb).permute(2, 0, 1), tier=self.args.tier
+        )
+        fovs.append(
+            np.rad2deg(
+                2
+                * np.arctan(
+                    predictions["depth"].shape[-1]
+                    / (2 * predictions["intrinsics"][0, 0, 0].cpu().numpy())
+                )
+            )
+        )
+        metric_depths.append(
+            np.float32(predictions["depth"][0, 0].cpu().numpy())
+        )
+    return da_disps, metric_depths, fovs
+
+  def tracking(
+      self,
+      frames,
+      da_disps,
+      metric_depths,
+      fovs,
+      scene_name,
+      key=None,
+      pyramid=None,
+  ):
+    """Camera tracking, returns the reconstruction arrays and motion_prob.
+
+    Frames are taken from pyramid when given, instead of resizing frames.
+    """
+    import test_demo
+
+    with self.profiler.phase("tracking", frames=len(frames)):
+      recon = self._cache_get(key)
+      if recon is None:
+        recon = self._track(
+            frames, da_disps, metric_depths, fovs, scene_name, pyramid
+        )
+        self._cache_put(key, recon)
+    if "tracking" in self.args.save:
+      test_demo.write_reconstruction(
+          recon, scene_name, self.tracking_args.depth_encoding
+      )
+    return recon
+
+  def _track(
+      self, frames, da_disps, metric_depths, fovs, scene_name, pyramid=None
+  ):
+    import test_demo
+
+    image_list, original_size = frames, None
+    if pyramid is not None:
+      image_list, original_size = pyramid.tracking, pyramid.original_size
+
+    with self.profiler.phase("tracking/align", frames=len(frames)):
+      mono_disp_list, aligns, K = test_demo.align_mono_depth(
+          da_disps, metric_depths, fovs, frames[0].shape[:2]
+      )
+    droid, traj_est, rgb_list, senor_depth_list, motion_prob = (
+        test_demo.track(
+            self.tracking_args,
+            image_list,
+            mono_disp_list,
+            aligns,
+            K,
+            scene_name,
+            profile=self.profiler.phase,
+            original_size=original_size,
+        )
+    )
+    recon = test_demo.reconstruction_arrays(
+        droid, traj_est, rgb_list, senor_depth_list
+    )
+    recon["motion_prob"] = motion_prob
+
+    # the SLAM buffers are not needed by the next stages
+    del droid
+    gc.collect()
+    torch.cuda.empty_cache()
+    return recon
+
+  def flow(self, frames, scene_name=None, key=None, pyramid=None):
+    """Optical flows and consistency masks for the CVD optimization.
+
+    Frames are taken from pyramid when given and --flow_max_pixels is the
+    tracking resolution, instead of resizing frames.
+    """
+    import preprocess_flow
+
+    with self.profiler.phase("flow", frames=len(frames)):
+      cached = self._cache_get(key)
+      if cached is not None:
+        flows = cached["flows"]
+        flow_masks = cached["flow_masks"]
+        iijj = cached["iijj"]
+      else:
+        with self.profiler.phase("flow/load_images", frames=len(frames)):
+          if (
+              pyramid is not None
+              and self.flow_args.flow_max_pixels == TRACKING_PIXELS
+          ):
+            # (N, 3, H, W) RGB view, pairs are copied as RAFT reads them
+            img_data = pyramid.tracking[..., ::-1].transpose(0, 3, 1, 2)
+          else:
+            img_data = preprocess_flow.load_images(
+                frames, self.flow_args.flow_max_pixels
+            )
+        with self.profiler.phase("flow/raft", frames=len(frames)):
+          flows, flow_masks, iijj = preprocess_flow.compute_flows(
+              self._model("raft"), img_data, self.flow_args
+          )
+        self._cache_put(
+            key, {"flows": flows, "flow_masks": flow_masks, "iijj": iijj}
+        )
+    if scene_name is not None and "flow" in self.args.save:
+      cache_dir = "./cache_flow/%s" % scene_name
+      Path(cache_dir).mkdir(parents=True, exist_ok=True)
+      np.save("%s/flows.npy" % cache_dir, flows)
+      np.save("%s/flows_masks.npy" % cache_dir, flow_masks)
+      np.save("%s/ii-jj.npy" % cache_dir, iijj)
+    return {"flows": flows, "flow_masks": flow_masks, "iijj": iijj}
+
+  def cvd(self, recon, flow, scene_name=None, key=None):
+    """Consistent video depth optimization, returns the final outputs."""
+    import cvd_opt
+
+    with self.profiler.phase("cvd", frames=len(recon["images"])):
+      outputs = self._cache_get(key)
+      if outputs is None:
+        outputs = cvd_opt.optimize(
+            recon["images"],
+            recon["disps"],
+            recon["intrinsics"],
+            recon["poses"],
+            recon["motion_prob"],
+            flow["flows"],
+            flow["flow_masks"],
+            flow["iijj"],
+            self.cvd_args,
+            profile=self.profiler.phase,
+        )
+        self._cache_put(key, outputs)
+    if scene_name is not None and "cvd" in self.args.save:
+      output_dir = self.cvd_args.output_dir
+      Path(output_dir).mkdir(parents=True, exist_ok=True)
+      # the tracking images are referenced when they are saved
+      images_from = None
+      if "tracking" in self.args.save:
+        images_from = "reconstructions/%s" % scene_name
+      save_outputs(
+          "%s/%s_sgd_cvd_hr" % (output_dir, scene_name),
+          outputs,
+          images_from=images_from,
+          depth_encoding=self.cvd_args.depth_encoding,
+      )
+    return outputs
+
+  def read_frames(self, datapath):
+    """Decodes the frames selected by --start, --end and --stride."""
+    with FrameSource(
+        datapath, self.args.start, self.args.end, self.args.stride
+    ) as source:
+      with self.profiler.phase("decode", frames=len(source)):
+        return list(source)
+
+  def preprocess(self, frames, scene_name, frames_key=None):
+    """Frames resized once for tracking and flow, see FramePyramid."""
+    path = None
+    if self.args.frame_cache is not None:
+      path = os.path.join(self.args.frame_cache, scene_name)
+    with self.profiler.phase("preprocess", frames=len(frames)):
+      return FramePyramid.build(frames, path, frames_key=frames_key)
+
+  def run(self, scene_name, datapath=None, frames=None):
+    """Runs all stages of a scene.
+
+    Args:
+      scene_name: scene name, used for the saved outputs.
+      datapath: directory of frames or video file, if frames is None.
+      frames: list of BGR images (H, W, 3).
+
+    Returns:
+      dict with the optimized images, depths, intrinsic and cam_c2w.
+    """
+    if frames is None:
+      frames = self.read_frames(datapath)
+    keys = self.stage_keys(frames)
+    pyramid = self.preprocess(frames, scene_name, keys["frames"])
+
+    da_disps, metric_depths, fovs = self.mono_depth(
+        frames, scene_name, keys["mono_depth"]
+    )
+    recon = self.tracking(
+        frames,
+        da_disps,
+        metric_depths,
+        fovs,
+        scene_name,
+        keys["tracking"],
+        pyramid,
+    )
+    flow = self.flow(frames, scene_name, keys["flow"], pyramid)
+    return self.cvd(recon, flow, scene_name, keys["cvd"])
+
+
+if __name__ == "__main__":
+  pipeline = Pipeline()
+  if pipeline.args.scene_name is None or pipeline.args.datapath is None:
+    get_parser().error("--scene_name and --datapath are required")
+  pipeline.run(pipeline.args.scene_name, datapath=pipeline.args.datapath)
+  if pipeline.args.profile is not None:
+    pipeline.profiler.dump(pipeline.args.profile)
+    print(pipeline.profiler.report())
@@ -0,0 +1,302 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Multi-scene scheduler pipelining scenes across the MegaSaM stages.
+
+Each stage has its own worker thread (and CUDA stream) with warm models, so
+that e.g. the mono depth priors of scene k+1 run while scene k is tracked:
+
+  decode -> mono_depth -> tracking -+
+         \\-> flow -----------------+-> cvd
+
+Scenes enter the pipeline in order, at most --max_inflight at once (decoded
+frames are kept in host memory), and a GPU stage only starts when the device
+has --min_free_memory GB free (a quarter of its memory by default) or no other
+stage is running.
+
+Usage (from the repo root), other options are forwarded to the pipeline:
+  python -m pipeline.scheduler --data_root Sintel/training/final \
+    --scenes alley_1 alley_2 --weights checkpoints/megasam_final.pth
+"""
+
+# pylint: disable=g-import-not-at-top
+
+import argparse
+import os
+import queue
+import threading
+import time
+import traceback
+
+import torch
+
+from pipeline.runner import Pipeline
+
+# end of the scene stream
+_DONE = None
+# default free device memory to start a GPU stage, fraction of the total
+MIN_FREE_FRACTION = 0.25
+
+
+def get_parser():
+  # the remaining argv goes to Pipeline, see runner.get_parser
+  parser = argparse.ArgumentParser(allow_abbrev=False)
+  parser.add_argument("--data_root", type=str, required=True)
+  parser.add_argument(
+      "--scenes",
+      type=str,
+      nargs="+",
+      required=True,
+      help="scene names, frames in data_root/<scene>, or a .txt list",
+  )
+  parser.add_argument(
+      "--max_inflight",
+      type=int,
+      default=2,
+      help="max scenes in the pipeline at once",
+  )
+  parser.add_argument(
+      "--min_free_memory",
+      type=float,
+      default=None,
+      help="GB of free device memory required to start a GPU stage while"
+      " other stages are running, MIN_FREE_FRACTION of the device memory by"
+      " default, 0 disables the check",
+  )
+  return parser
+
+
+class SceneScheduler:
+  """Runs scenes through the stages of a Pipeline with one worker per stage.
+
+  Results are returned per scene; a failing scene is reported with its
+  exception and does not stop the others.
+  """
+
+  def __init__(self, pipeline, max_inflight=2, min_free_memory=None):
+    self.pipeline = pipeline
+    if min_free_memory is not None:
+      self.min_free_memory = min_free_memory * 2**30
+    elif torch.cuda.is_available():
+      _, total = torch.cuda.mem_get_info()
+      self.min_free_memory = total * MIN_FREE_FRACTION
+    else:
+      self.min_free_memory = 0
+    self._inflight = threading.Semaphore(max_inflight)
+    self._gpu = threading.Condition()
+    self._gpu_jobs = 0
+    self._lock = threading.Lock()
+    self._results = {}
+    self._partial = {}
+
+    self._queues = {
+        stage: queue.Queue()
+        for stage in ["decode", "mono_depth", "tracking", "flow", "cvd"]
+    }
+
+  def _acquire_gpu(self):
+    """Waits for enough free device memory, see --min_free_memory."""
+    with self._gpu:
+      while self._gpu_jobs > 0 and self.min_free_memory > 0:
+        free, _ = torch.cuda.mem_get_info()
+        if free >= self.min_free_memory:
+          break
+        self._gpu.wait(timeout=0.5)
+      self._gpu_jobs += 1
+
+  def _release_gpu(self):
+    with self._gpu:
+      self._gpu_jobs -= 1
+      self._gpu.notify_all()
+
+  def _finish(self, scene_name, result):
+    """Records the first result of a scene and frees its in-flight slot."""
+    with self._lock:
+      if scene_name in self._results:
+        # the scene already failed in another stage, its slot is free
+        return
+      try:
+        self._results[scene_name] = result
+        self._partial.pop(scene_name, None)
+      finally:
+        self._inflight.release()
+
+  def _join(self, scene_name, key, value):
+    """Collects the tracking and flow outputs of a scene for the CVD stage."""
+    with self._lock:
+      if scene_name in self._results:
+        return
+      partial = self._partial.setdefault(scene_name, {})
+      partial[key] = value
+      ready = all(k in partial for k in ("recon", "flow", "key"))
+    if ready:
+      self._queues["cvd"].put((scene_name, partial))
+
+  def _worker(self, stage, fn, outputs, gpu=True):
+    """Runs fn on the stage queue until the end of the scene stream."""
+    stream = torch.cuda.Stream() if gpu and torch.cuda.is_available() else None
+    while True:
+      item = self._queues[stage].get()
+      if item is _DONE:
+        for output in outputs:
+          self._queues[output].put(_DONE)
+        return
+
+      scene_name, data = item
+      with self._lock:
+        failed = scene_name in self._results
+      if failed:
+        continue
+
+      acquired = False
+      start = time.perf_counter()
+      try:
+        if gpu:
+          self._acquire_gpu()
+          acquired = True
+        if stream is not None:
+          with torch.cuda.stream(stream):
+            fn(scene_name, data)
+          stream.synchronize()
+        else:
+          fn(scene_name, data)
+      except Exception as e:  # pylint: disable=broad-exception-caught
+        traceback.print_exc()
+        self._finish(scene_name, e)
+      finally:
+        if acquired:
+          self._release_gpu()
+      print(
+          "[%s] %s done in %.1fs"
+          % (stage, scene_name, time.perf_counter() - start)
+      )
+
+  def _decode(self, scene_name, datapath):
+    frames = self.pipeline.read_frames(datapath)
+    if not frames:
+      raise ValueError(f"No frames in {datapath}")
+    keys = self.pipeline.stage_keys(frames)
+    pyramid = self.pipeline.preprocess(frames, scene_name, keys["frames"])
+    self._queues["mono_depth"].put((scene_name, (frames, keys, pyramid)))
+    self._queues["flow"].put((scene_name, (frames, keys, pyramid)))
+
+  def _mono_depth(self, scene_name, data):
+    frames, keys, pyramid = data
+    priors = self.pipeline.mono_depth(frames, scene_name, keys["mono_depth"])
+    self._queues["tracking"].put(
+        (scene_name, (frames, keys, pyramid, priors))
+    )
+
+  def _tracking(self, scene_name, data):
+    frames, keys, pyramid, priors = data
+    recon = self.pipeline.tracking(
+        frames, *priors, scene_name, keys["tracking"], pyramid
+    )
+    self._join(scene_name, "recon", recon)
+    self._join(scene_name, "key", keys["cvd"])
+
+  def _flow(self, scene_name, data):
+    frames, keys, pyramid = data
+    flow = self.pipeline.flow(frames, scene_name, keys["flow"], pyramid)
+    self._join(scene_name, "flow", flow)
+
+  def _cvd(self, scene_name, partial):
+    outputs = self.pipeline.cvd(
+        partial["recon"], partial["flow"], scene_name, partial["key"]
+    )
+    self._finish(scene_name, outputs)
+
+  def run(self, scenes):
+    """Runs scenes, a list of (scene_name, datapath).
+
+    Returns:
+      dict scene_name -> CVD outputs, or the exception that stopped it.
+
+    Raises:
+      ValueError: if a scene name is given twice, scenes are identified by
+        their name across the stages.
+    """
+    names = [scene_name for scene_name, _ in scenes]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+      raise ValueError("Duplicate scenes: %s" % ", ".join(duplicates))
+
+    workers = [
+        ("decode", self._decode, ["mono_depth", "flow"], False),
+        ("mono_depth", self._mono_depth, ["tracking"], True),
+        ("tracking", self._tracking, [], True),
+        ("flow", self._flow, [], True),
+        ("cvd", self._cvd, [], True),
+    ]
+    threads = {
+        stage: threading.Thread(
+            target=self._worker, args=(stage, fn, outputs, gpu), daemon=True
+        )
+        for stage, fn, outputs, gpu in workers
+    }
+    for thread in threads.values():
+      thread.start()
+
+    start = time.perf_counter()
+    for scene_name, datapath in scenes:
+      self._inflight.acquire()
+      self._queues["decode"].put((scene_name, datapath))
+    self._queues["decode"].put(_DONE)
+
+    # tracking and flow both feed cvd, which is ended once both are done
+    threads["decode"].join()
+    threads["mono_depth"].join()
+    threads["tracking"].join()
+    threads["flow"].join()
+    self._queues["cvd"].put(_DONE)
+    threads["cvd"].join()
+
+    elapsed = time.perf_counter() - start
+    print(
+        "%d scenes in %.1fs (%.1fs/scene)"
+        % (len(scenes), elapsed, elapsed / max(len(scenes), 1))
+    )
+    return self._results
+
+
+def read_scenes(data_root, scenes):
+  """Expands .txt scene lists, returns (scene_name, datapath) pairs."""
+  names = []
+  for scene in scenes:
+    if scene.endswith(".txt"):
+      with open(scene, "r") as f:
+        names += [line.strip() for line in f if line.strip()]
+    else:
+      names.append(scene)
+  # a scene listed twice runs once
+  names = list(dict.fromkeys(names))
+  return [(name, os.path.join(data_root, name)) for name in names]
+
+
+if __name__ == "__main__":
+  args, argv = get_parser().parse_known_args()
+  scheduler = SceneScheduler(
+      Pipeline(argv),
+      max_inflight=args.max_inflight,
+      min_free_memory=args.min_free_memory,
+  )
+  results = scheduler.run(read_scenes(args.data_root, args.scenes))
+  profiler = scheduler.pipeline.profiler
+  if profiler.enabled:
+    profiler.dump(scheduler.pipeline.args.profile)
+    print(profiler.report())
+  failed = [k for k, v in results.items() if isinstance(v, Exception)]
+  if failed:
+    print("Failed scenes: %s" % ", ".join(failed))
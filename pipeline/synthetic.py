@@ -0,0 +1,184 @@
+# Copyright 2025 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Synthetic video scenes with ground truth depth, poses, flows and motion.
+
+A camera moving along a smooth trajectory looks at a textured slanted plane,
+in front of which a textured square moves parallel to the image plane.
+Frames are ray cast, so depths, poses and flows are exact (flows ignore
+occlusions, the motion mask marks the moving square).
+
+Used by pipeline.benchmark, so that stages can be timed without datasets.
+"""
+
+# pylint: disable=invalid-name
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# background plane z = Z0 + SLANT_X * x + SLANT_Y * y, in world coordinates
+Z0, SLANT_X, SLANT_Y = 4.0, 0.15, -0.1
+# moving square at z = OBJECT_Z, of half size OBJECT_SIZE
+OBJECT_Z, OBJECT_SIZE = 2.0, 0.4
+
+
+def _texture(g, size=512, cells=24):
+  """Smooth random RGB texture (1, 3, size, size) in [0, 1]."""
+  noise = torch.rand(1, 3, cells, cells, generator=g)
+  texture = F.interpolate(noise, size=(size, size), mode="bicubic")
+  detail = torch.rand(1, 3, size // 4, size // 4, generator=g)
+  texture = texture + 0.3 * F.interpolate(
+      detail, size=(size, size), mode="bilinear"
+  )
+  return (texture / 1.3).clamp(0.0, 1.0)
+
+
+def _sample(texture, xy, extent):
+  """Samples a texture at world xy (..., 2) over [-extent, extent]^2."""
+  grid = (xy / extent).reshape(1, -1, 1, 2)
+  rgb = F.grid_sample(texture, grid, mode="bilinear", align_corners=True)
+  return rgb[0, :, :, 0].T.reshape(*xy.shape[:-1], 3)
+
+
+def camera_trajectory(num_frames, radius=0.3):
+  """Camera to world poses (N, 4, 4) of a smooth forward facing trajectory."""
+  tau = torch.linspace(0.0, 2.0 * np.pi, num_frames)
+  yaw = 0.08 * torch.sin(tau)
+  pitch = 0.04 * torch.sin(2.0 * tau)
+
+  cy, sy = torch.cos(yaw), torch.sin(yaw)
+  cp, sp = torch.cos(pitch), torch.sin(pitch)
+  zeros, ones = torch.zeros_like(tau), torch.ones_like(tau)
+  R_yaw = torch.stack(
+      [cy, zeros, sy, zeros, ones, zeros, -sy, zeros, cy], dim=-1
+  ).reshape(-1, 3, 3)
+  R_pitch = torch.stack(
+      [ones, zeros, zeros, zeros, cp, -sp, zeros, sp, cp], dim=-1
+  ).reshape(-1, 3, 3)
+
+  cam_c2w = torch.eye(4).repeat(num_frames, 1, 1)
+  cam_c2w[:, :3, :3] = R_yaw @ R_pitch
+  cam_c2w[:, 0, 3] = radius * torch.sin(tau)
+  cam_c2w[:, 1, 3] = 0.3 * radius * torch.cos(tau)
+  cam_c2w[:, 2, 3] = 0.5 * radius * tau / (2.0 * np.pi)
+  return cam_c2w
+
+
+def render_scene(num_frames=32, height=192, width=256, seed=0):
+  """Renders a synthetic scene.
+
+  Args:
+    num_frames: number of frames.
+    height: image height.
+    width: image width.
+    seed: seed of the textures and object motion.
+
+  Returns:
+    dict with
+      images: (N, H, W, 3) uint8 BGR frames.
+      depths: (N, H, W) float32 depths.
+      cam_c2w: (N, 4, 4) float32 camera to world poses.
+      K: (3, 3) float32 intrinsics.
+      motion_masks: (N, H, W) bool, pixels of the moving object.
+      object_xy: (N, 2) float32 world xy of the object center.
+  """
+  g = torch.Generator().manual_seed(seed)
+  N, H, W = num_frames, height, width
+
+  K = torch.tensor([
+      [0.9 * W, 0.0, 0.5 * W],
+      [0.0, 0.9 * W, 0.5 * H],
+      [0.0, 0.0, 1.0],
+  ])
+  cam_c2w = camera_trajectory(N)
+  background = _texture(g)
+  foreground = _texture(g, size=128, cells=6)
+
+  start = 0.4 * (torch.rand(2, generator=g) - 0.5)
+  velocity = 0.6 * (torch.rand(2, generator=g) - 0.5)
+  object_xy = start + velocity * torch.linspace(0.0, 1.0, N)[:, None]
+
+  ys, xs = torch.meshgrid(
+      torch.arange(H, dtype=torch.float32),
+      torch.arange(W, dtype=torch.float32),
+      indexing="ij",
+  )
+  pix = torch.stack([xs, ys, torch.ones_like(xs)], dim=-1)
+  rays = pix @ torch.linalg.inv(K).T  # (H, W, 3), z = 1
+
+  images, depths, masks = [], [], []
+  for t in range(N):
+    R, c = cam_c2w[t, :3, :3], cam_c2w[t, :3, 3]
+    d = rays @ R.T
+
+    # ray parameter = camera depth, since the camera space rays have z = 1
+    s_bg = (Z0 + SLANT_X * c[0] + SLANT_Y * c[1] - c[2]) / (
+        d[..., 2] - SLANT_X * d[..., 0] - SLANT_Y * d[..., 1]
+    )
+    s_obj = (OBJECT_Z - c[2]) / d[..., 2]
+    p_obj = c + s_obj[..., None] * d
+    local = p_obj[..., :2] - object_xy[t]
+    mask = (local.abs().amax(dim=-1) < OBJECT_SIZE) & (s_obj < s_bg)
+
+    p_bg = c + s_bg[..., None] * d
+    rgb = _sample(background, p_bg[..., :2], 6.0)
+    rgb[mask] = _sample(foreground, local, OBJECT_SIZE)[mask]
+
+    images.append(rgb)
+    depths.append(torch.where(mask, s_obj, s_bg))
+    masks.append(mask)
+
+  images = torch.stack(images)[..., [2, 1, 0]]  # BGR
+  return {
+      "images": (255.0 * images).round().byte().numpy(),
+      "depths": torch.stack(depths).numpy(),
+      "cam_c2w": cam_c2w.numpy(),
+      "K": K.numpy(),
+      "motion_masks": torch.stack(masks).numpy(),
+      "object_xy": object_xy.numpy(),
+  }
+
+
+def scene_flows(scene, ii, jj):
+  """Ground truth flows (P, 2, H, W) from frames ii to frames jj."""
+  depths = torch.from_numpy(scene["depths"])
+  cam_c2w = torch.from_numpy(scene["cam_c2w"])
+  K = torch.from_numpy(scene["K"])
+  masks = torch.from_numpy(scene["motion_masks"])
+  object_xy = torch.from_numpy(scene["object_xy"])
+  ii, jj = torch.as_tensor(ii), torch.as_tensor(jj)
+  _, H, W = depths.shape
+
+  ys, xs = torch.meshgrid(
+      torch.arange(H, dtype=torch.float32),
+      torch.arange(W, dtype=torch.float32),
+      indexing="ij",
+  )
+  pix = torch.stack([xs, ys, torch.ones_like(xs)], dim=-1)
+  points = depths[ii][..., None] * (pix @ torch.linalg.inv(K).T)
+
+  # world points of frames ii, moved with the object to time jj
+  c2w_i, c2w_j = cam_c2w[ii], cam_c2w[jj]
+  world = points.flatten(1, 2) @ c2w_i[:, :3, :3].transpose(1, 2)
+  world = world + c2w_i[:, None, :3, 3]
+  shift = (object_xy[jj] - object_xy[ii])[:, None, :]
+  world[..., :2] += masks[ii].flatten(1, 2)[..., None] * shift
+
+  cam = (world - c2w_j[:, None, :3, 3]) @ c2w_j[:, :3, :3]
+  uv = cam @ K.T
+  uv = uv[..., :2] / uv[..., 2:].clamp(min=1e-6)
+  flows = uv.reshape(-1, H, W, 2) - pix[..., :2]
+  return flows.permute(0, 3, 1, 2).contiguous().numpy()
@@ -1,11 +1,15 @@
 import numpy as np
 import os
+import sys
 import argparse
 import struct
 from scipy.spatial.transform import Rotation as R
 import cv2
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.reconstruction import load_outputs
+
 def write_cameras_binary(path, width, height, intrinsics):
     """Пишет cameras.bin (PINHOLE model)"""
     with open(path, "wb") as f:
@@ -186,16 +190,16 @@ def process_data(npz_path, output_path):
 
     # Загрузка
     print(f"Loading {npz_path}...")
-    data = np.load(npz_path)
+    # .npz outputs or reconstruction containers, cam_c2w falls back to the
+    # poses of legacy outputs
+    data = load_outputs(npz_path)
     images = data["images"]
-    poses = data["cam_c2w"] if "cam_c2w" in data else data["poses"]
+    poses = data["cam_c2w"]
     intrinsics = data["intrinsic"]
-    
-    # Try to load depths
-    depths = None
-    if "depths" in data:
-        depths = data["depths"]
-        
+
+    # Depths are optional (None)
+    depths = data["depths"]
+
     H, W, _ = images[0].shape
 
     print(f"Processing {len(images)} frames...")
@@ -227,7 +231,11 @@ def process_data(npz_path, output_path):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--npz_path", required=True)
+    parser.add_argument(
+        "--npz_path",
+        required=True,
+        help="CVD or tracking outputs, container directory or .npz file",
+    )
     parser.add_argument("--output_path", required=True)
     args = parser.parse_args()
 
@@ -1,11 +1,15 @@
 import subprocess
 import json
 import argparse
+import os
 import sys
 import math
 
-def get_metadata(file_path):
-    """Run ffprobe to extract metadata."""
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.frames import FrameSource, HAS_AV
+
+def get_ffprobe_tags(file_path):
+    """Run ffprobe to extract the format and video stream tags."""
     cmd = [
         "ffprobe",
         "-v", "quiet",
@@ -14,9 +18,23 @@ def get_metadata(file_path):
         "-show_streams",
         file_path
     ]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    probe = json.loads(result.stdout)
+    tags = dict(probe.get("format", {}).get("tags", {}))
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") == "video":
+            tags.update(stream.get("tags", {}))
+            break
+    return tags
+
+def get_metadata(file_path):
+    """Read the container metadata with PyAV, or ffprobe without it."""
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return json.loads(result.stdout)
+        if not HAS_AV:
+            # OpenCV does not read the container tags
+            return {"tags": get_ffprobe_tags(file_path)}
+        with FrameSource(file_path) as source:
+            return source.metadata
     except subprocess.CalledProcessError as e:
         print(f"Error running ffprobe: {e}", file=sys.stderr)
         sys.exit(1)
@@ -29,8 +47,8 @@ def estimate_fov(metadata):
     Estimate Horizontal FOV based on metadata.
     Defaults to 73.0 (approx iPhone 14 Pro 24mm equivalent) if unknown.
     """
-    # 1. Try to find Make/Model in format tags
-    format_tags = metadata.get("format", {}).get("tags", {})
+    # 1. Try to find Make/Model in container tags
+    format_tags = metadata.get("tags", {})
     make = format_tags.get("com.apple.quicktime.make", "").lower()
     model = format_tags.get("com.apple.quicktime.model", "").lower()
     